@@ -67,6 +67,9 @@ CREATE TABLE capstone.fact_market_price (
   CONSTRAINT fact_market_price_product_id_fkey FOREIGN KEY (product_id) REFERENCES capstone.dim_product(product_id),
   CONSTRAINT fact_market_price_unit_id_fkey FOREIGN KEY (unit_id) REFERENCES capstone.dim_unit(unit_id)
 );
+-- Upsert keys of the price scraper's uploads (here and on product_alias), scoped to its sources (No Frills, Metro, Food Basics)
+-- so other loaders' facts are unaffected. Existing databases: scripts/migrate_warehouse_keys.py
+CREATE UNIQUE INDEX fact_market_price_scraper_key_uidx ON capstone.fact_market_price (source_id, source_product_key, date_id) WHERE source_id IN (4, 5, 6);
 CREATE TABLE capstone.fact_purchase_line (
   purchase_fact_id bigint GENERATED ALWAYS AS IDENTITY NOT NULL,
   date_id date NOT NULL,
@@ -102,4 +105,5 @@ CREATE TABLE capstone.product_alias (
   CONSTRAINT product_alias_source_id_fkey FOREIGN KEY (source_id) REFERENCES capstone.dim_source(source_id),
   CONSTRAINT product_alias_product_id_fkey FOREIGN KEY (product_id) REFERENCES capstone.dim_product(product_id),
   CONSTRAINT product_alias_unit_id_fkey FOREIGN KEY (unit_id) REFERENCES capstone.dim_unit(unit_id)
-);
\ No newline at end of file
+);
+CREATE UNIQUE INDEX product_alias_scraper_key_uidx ON capstone.product_alias (source_id, source_product_key) WHERE source_id IN (4, 5, 6);
@@ -3,6 +3,8 @@ import logging
 import os
 import argparse
 import glob
+import signal
+import threading
 from datetime import datetime
 from scrapers.nofrills import NoFrillsScraper
 from scrapers.foodbasics import FoodBasicsScraper
@@ -10,8 +12,12 @@ from scrapers.metro import MetroScraper
 from storage.db_manager import DatabaseManager
 from storage.csv_manager import CSVManager
 from storage.supabase_manager import SupabaseManager
+from storage.dispatcher import StorageDispatcher
+from storage.outbox import UploadOutbox, OutboxDrainer
+from storage.product_catalog import ProductCatalog
 from alerts.notifier import Notifier
 from utils.unit_converter import UnitConverter
+from utils.progress_log import ProgressLog
 
 # Setup logging
 logging.basicConfig(
@@ -24,8 +30,60 @@ logging.basicConfig(
 )
 logger = logging.getLogger("Orchestrator")
 
-def process_result(item, result, db, notifier, csv_mgr, sb=None):
-    """Handles storage, notification, and CSV dataset for a scraper result."""
+# Records a storage sink could not write even on their own (see storage/dispatcher.py)
+DEAD_LETTER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "dead_letter")
+
+class ScanStopped(BaseException):
+    """
+    Raised in the scan loop when SIGTERM arrives (the UI cancelling or stale-killing the job).
+    A BaseException, so the per-product `except Exception` handlers don't swallow it.
+    """
+
+_stop_requested = threading.Event()
+
+def _stop_on_sigterm(signum, frame):
+    if not _stop_requested.is_set():
+        _stop_requested.set()
+        raise ScanStopped()
+
+def build_dispatcher(db, csv_mgr, notifier, outbox=None):
+    """Wires one write-behind queue per sink. SQLite stays the source of truth and feeds the notifier."""
+    dispatcher = StorageDispatcher()
+
+    def write_sqlite(batch):
+        previous = db.save_prices(batch)
+        for data, last_price in zip(batch, previous):
+            if last_price is not None and last_price != data["price"]:
+                dispatcher.submit((data["product_name"], last_price, data["price"]), sinks=["notifier"])
+
+    def write_csv(batch):
+        for data in batch:
+            csv_mgr.append_price(data)
+        csv_mgr.flush()
+
+    def write_notifier(batch):
+        for name, old_price, new_price in batch:
+            notifier.notify_change(name, old_price, new_price)
+
+    def write_supabase(batch):
+        # Only a local write; the OutboxDrainer ships it to the warehouse
+        outbox.enqueue(batch)
+
+    # Rows bound for the local DB, the CSV dataset or the warehouse outbox are never dropped: a full
+    # queue blocks the scan, and records that still fail after retries go to a dead-letter file.
+    # Only alerts may shed load under pressure.
+    dispatcher.add_sink("sqlite", write_sqlite, batch_size=50, on_full="block", retries=3,
+                        dead_letter=os.path.join(DEAD_LETTER_DIR, "sqlite.jsonl"))
+    dispatcher.add_sink("csv", write_csv, batch_size=50, on_full="block",
+                        dead_letter=os.path.join(DEAD_LETTER_DIR, "csv.jsonl"))
+    dispatcher.add_sink("notifier", write_notifier, batch_size=10, on_full="drop")
+    if outbox:
+        dispatcher.add_sink("supabase", write_supabase, batch_size=50, on_full="block", retries=3,
+                            dead_letter=os.path.join(DEAD_LETTER_DIR, "supabase.jsonl"))
+    return dispatcher
+
+def process_result(item, result, dispatcher):
+    """Standardizes a scraper result and hands it to the storage dispatcher (SQLite, CSV, notifier, Supabase)."""
     p_id = item['id']
     name = item['name']
     store = item['store']
@@ -52,8 +110,6 @@ def process_result(item, result, db, notifier, csv_mgr, sb=None):
             price = price / pack_size # update base price string if needed, or leave base price and just adjust unit price
             # We focus on adjusting the unit_price for standardized comparison
         
-        last_price = db.get_last_price(p_id)
-        
         data_to_store = {
             "product_id": p_id,
             "store": store,
@@ -68,21 +124,11 @@ def process_result(item, result, db, notifier, csv_mgr, sb=None):
             "url": url,
             "timestamp": datetime.now().isoformat()
         }
-        db.save_price(data_to_store)
-        csv_mgr.append_price(data_to_store)
-        
-        if last_price is not None and last_price != price:
-            notifier.notify_change(name, last_price, price)
+        # Price-change alerts are raised by the SQLite sink once the row is written
+        dispatcher.submit(data_to_store, sinks=["sqlite", "csv", "supabase"])
             
         logger.info(f"Success: {name} - ${price} (Unit Price: ${unit_price:.2f}/{std_unit})")
         
-        # Upload to Supabase
-        if sb:
-            try:
-                sb.insert_market_price(data_to_store)
-            except Exception as e:
-                logger.warning(f"Supabase upload failed for {name}: {e}")
-        
         return True
     elif result and result.get('status') == 'blocked':
         logger.error(f"BLOCKED: {name} at {store} is protected by anti-bot. Please use folder import.")
@@ -96,20 +142,42 @@ def main():
     parser.add_argument("--product-id", help="Product ID for the local file")
     parser.add_argument("--import-all", action="store_true", help="Batch import all HTML files from html_imports folders")
     parser.add_argument("--url", help="Run a single product extraction by URL for debugging")
-    parser.add_argument("--ui-mode", action="store_true", help="Run in UI mode, updating scraper_state.json")
+    parser.add_argument("--ui-mode", action="store_true", help="Run in UI mode, appending progress events to scraper_events.jsonl")
+    parser.add_argument("--sync", action="store_true", help="Upload queued warehouse rows (Supabase outbox) and exit")
+    parser.add_argument("--stores", help="Comma-separated stores to scan (e.g. metro,nofrills), overriding enabled_stores")
     args = parser.parse_args()
 
-    db = DatabaseManager()
+    config_path = "/Users/carlosborda/Documents/Python/Learning/scraping/config/products.json"
+    settings_path = "/Users/carlosborda/Documents/Python/Learning/scraping/config/settings.json"
+
+    db = DatabaseManager(storage_mode=DatabaseManager.storage_mode_from_settings(settings_path))
     csv_mgr = CSVManager()
     notifier = Notifier(webhook_url=os.getenv("DISCORD_WEBHOOK"))
     
-    # Initialize Supabase manager
-    try:
-        sb = SupabaseManager()
-        logger.info("Supabase connection initialized.")
-    except Exception as e:
-        logger.warning(f"Supabase init failed, running in local-only mode: {e}")
-        sb = None
+    # Warehouse uploads are queued locally and shipped by the drainer, so Supabase being down
+    # never slows the scan or loses rows. Without a warehouse nothing is queued at all.
+    outbox = drainer = None
+    configured, reason = SupabaseManager.is_configured()
+    if configured:
+        outbox = UploadOutbox(db.db_path)
+        drainer = OutboxDrainer(outbox, SupabaseManager)
+    else:
+        logger.info(f"Warehouse uploads disabled ({reason}); prices are stored locally only.")
+
+    if args.sync:
+        if not drainer:
+            logger.error(f"Nothing to sync: no warehouse configured ({reason}).")
+            return
+        requeued = drainer.requeue_unmapped()
+        summary = drainer.drain()
+        drainer.stop()
+        logger.info(f"Sync done: {summary['inserted']} uploaded, {summary['unmapped']} unmapped, "
+                    f"{summary['failed']} failed (requeued {requeued} unmapped rows); outbox: {outbox.stats()}")
+        return
+
+    if drainer:
+        drainer.start()
+    dispatcher = build_dispatcher(db, csv_mgr, notifier, outbox)
     
     scrapers = {
         "nofrills": NoFrillsScraper(),
@@ -117,23 +185,23 @@ def main():
         "metro": MetroScraper()
     }
 
-    config_path = "/Users/carlosborda/Documents/Python/Learning/scraping/config/products.json"
-    settings_path = "/Users/carlosborda/Documents/Python/Learning/scraping/config/settings.json"
-    
     # Load Products
-    try:
-        with open(config_path, "r") as f:
-            all_products = json.load(f)
-            # US01: Ignorar productos inactivos/pausados
-            products = [p for p in all_products if p.get("active", True)]
-            if len(products) < len(all_products):
-                logger.info(f"Loaded {len(products)} active products (ignored {len(all_products)-len(products)} paused).")
-    except FileNotFoundError:
+    if not os.path.exists(config_path):
         logger.error("Products config file not found.")
+        close_storage(dispatcher, csv_mgr, drainer)
         return
+    catalog = ProductCatalog(config_path)
+    # US01: Ignorar productos inactivos/pausados
+    products = catalog.all(active_only=True)
+    if len(products) < len(catalog):
+        logger.info(f"Loaded {len(products)} active products (ignored {len(catalog)-len(products)} paused).")
 
-    # Load Settings (Filter stores)
-    if os.path.exists(settings_path):
+    # Load Settings (Filter stores); --stores picks the stores explicitly (partial runs from the UI)
+    if args.stores:
+        stores = {s.strip() for s in args.stores.split(",") if s.strip()}
+        products = [p for p in products if p['store'] in stores]
+        logger.info(f"Filtered products: {len(products)} active in stores {sorted(stores)}.")
+    elif os.path.exists(settings_path):
         try:
             with open(settings_path, "r") as f:
                 settings = json.load(f)
@@ -145,6 +213,64 @@ def main():
         except Exception as e:
             logger.warning(f"Could not load settings.json, running all stores. Error: {e}")
 
+    # Lookups below only consider products that survived the filters above
+    eligible_ids = {p['id'] for p in products}
+
+    def find_product(product_id=None, url=None):
+        product = catalog.get(product_id) if product_id else catalog.by_url(url)
+        return product if product and product['id'] in eligible_ids else None
+
+    # Manual modes: batch import, single local file, single URL
+    if args.import_all or args.local_file or args.url:
+        try:
+            run_manual_mode(args, scrapers, find_product, dispatcher)
+        finally:
+            # atexit doesn't run on SIGKILL or os._exit: flush the write-behind queues explicitly
+            close_storage(dispatcher, csv_mgr, drainer)
+        return
+
+    # Automated Mode
+    logger.info("Starting Automated Scan (Browser Mode with Playwright)...")
+    import random
+    random.shuffle(products) 
+    
+    # On SIGTERM, stop scanning but still flush the storage queues below before exiting
+    signal.signal(signal.SIGTERM, _stop_on_sigterm)
+    progress = ProgressLog() if args.ui_mode else None
+    total_products = len(products)
+    try:
+        scan_products(products, scrapers, dispatcher, progress)
+    except ScanStopped:
+        pass
+    except Exception:
+        # Tearing the browser down can fail once its processes got the signal too
+        if not _stop_requested.is_set():
+            raise
+    if _stop_requested.is_set():
+        logger.warning("Scan stopped by SIGTERM; flushing queued writes before exiting.")
+
+    # Drain the sink queues (DB, CSV, alerts, warehouse outbox) before reporting completion
+    close_storage(dispatcher, csv_mgr, drainer)
+
+    if _stop_requested.is_set():
+        # The job manager records the cancellation and closes the progress run
+        raise SystemExit(128 + signal.SIGTERM)
+    if progress:
+        try:
+            progress.emit("run_completed", total=total_products)
+        except Exception:
+            pass
+
+def close_storage(dispatcher, csv_mgr, drainer=None):
+    """Drains the sink queues and the CSV buffer, then ships what reached the warehouse outbox."""
+    dispatcher.close()
+    csv_mgr.close()
+    if drainer:
+        drainer.stop(flush=True)
+
+
+def run_manual_mode(args, scrapers, find_product, dispatcher):
+    """--import-all, --local-file and --url: scrape the given files or URL instead of the whole catalog."""
     # Batch Import Mode
     if args.import_all:
         logger.info("Starting Batch Import from 'html_imports/'...")
@@ -157,13 +283,13 @@ def main():
             for file_path in html_files:
                 # Expecting filename to be ID.html (e.g. wm-ca-001.html)
                 p_id = os.path.basename(file_path).replace(".html", "")
-                product = next((p for p in products if p['id'] == p_id), None)
+                product = find_product(product_id=p_id)
                 
                 if product:
                     logger.info(f"Importing {file_path} for {product['name']}...")
                     scraper = scrapers.get(store)
                     result = scraper.run_local(file_path)
-                    process_result(product, result, db, notifier)
+                    process_result(product, result, dispatcher)
                 else:
                     logger.warning(f"File {p_id}.html ignored: Product ID not found in config.")
         return
@@ -174,16 +300,16 @@ def main():
         if not args.product_id:
             logger.error("Error: --product-id is required when using --local-file")
             return
-        product = next((p for p in products if p['id'] == args.product_id), None)
+        product = find_product(product_id=args.product_id)
         if product:
             result = scrapers.get(product['store']).run_local(args.local_file)
-            process_result(product, result, db, notifier, csv_mgr, sb)
+            process_result(product, result, dispatcher)
         return
 
     # Single URL Debug Mode
     if args.url:
         logger.info(f"Running single product debug for URL: {args.url}")
-        product = next((p for p in products if p['url'] == args.url), None)
+        product = find_product(url=args.url)
         if not product:
             logger.error("URL not found in products.json. Please ensure it matches exactly.")
             return
@@ -192,15 +318,12 @@ def main():
         with BrowserManager(headless=True) as bm:
             scraper = scrapers.get(product['store'])
             result = scraper.run(product['url'], browser_mgr=bm)
-            process_result(product, result, db, notifier, csv_mgr, sb)
-        return
+            process_result(product, result, dispatcher)
 
-    # Automated Mode
-    logger.info("Starting Automated Scan (Browser Mode with Playwright)...")
+
+def scan_products(products, scrapers, dispatcher, progress):
+    """Automated mode: scrapes every product in one browser, reporting progress events."""
     from utils.browser_manager import BrowserManager
-    import random
-    random.shuffle(products) 
-    
     with BrowserManager(headless=True) as bm:
         # 1. No Frills Flyer Scan (Bulk) - Disabled for specific product testing
         # logger.info("Extracting No Frills Flyer...")
@@ -215,59 +338,52 @@ def main():
         #         "store": "nofrills",
         #         "url": res["url"]
         #     }
-        #     process_result(mock_item, res, db, notifier, csv_mgr)
+        #     process_result(mock_item, res, dispatcher)
         
         # logger.info(f"Imported {len(flyer_results)} items from No Frills Flyer.")
 
         # 2. Individual Product Scan (No Frills PDP, Costco, etc.)
-        state_file = "/Users/carlosborda/Documents/Python/Learning/scraping/data/scraper_state.json"
-        completed_ids = []
         total_products = len(products)
-        
-        for idx, item in enumerate(products):
-            if args.ui_mode:
+        if progress:
+            progress.emit("run_started", total=total_products)
+
+        def report(event_type, item, **fields):
+            # One appended line per event; never let progress reporting break the scan
+            if progress:
                 try:
-                    with open(state_file, "w") as f:
-                        json.dump({
-                            "status": "running",
-                            "progress": idx,
-                            "total": total_products,
-                            "current_product": item['name'],
-                            "completed_ids": completed_ids
-                        }, f)
+                    progress.emit(event_type, id=item['id'], name=item['name'], store=item['store'], **fields)
                 except Exception as e:
-                    logger.error(f"Failed to write state: {e}")
-                    
+                    logger.error(f"Failed to write progress event: {e}")
+
+        for idx, item in enumerate(products):
+            if _stop_requested.is_set():
+                # The signal landed somewhere that swallowed ScanStopped (e.g. inside Playwright)
+                raise ScanStopped()
+            report("product_started", item, index=idx)
+
             scraper = scrapers.get(item['store'])
-            if scraper:
-                try:
-                    result = scraper.run(item['url'], browser_mgr=bm)
-                    
-                    # Retry once if blocked
-                    if result and result.get('status') == 'blocked':
-                        logger.warning(f"Blocked on {item['name']}. Retrying in 45s...")
-                        import time
-                        time.sleep(45)
-                        result = scraper.run(item['url'], browser_mgr=bm)
-                    
-                    process_result(item, result, db, notifier, csv_mgr, sb)
-                    completed_ids.append(item['id'])
-                except Exception as e:
-                    logger.error(f"Error processing {item['name']}: {e}")
-                    
-        # Final state update
-        if args.ui_mode:
+            if not scraper:
+                report("product_failed", item, error=f"No scraper for store {item['store']}")
+                continue
             try:
-                with open(state_file, "w") as f:
-                    json.dump({
-                        "status": "completed",
-                        "progress": total_products,
-                        "total": total_products,
-                        "current_product": "Done",
-                        "completed_ids": completed_ids
-                    }, f)
-            except Exception:
-                pass
+                result = scraper.run(item['url'], browser_mgr=bm)
+
+                # Retry once if blocked
+                if result and result.get('status') == 'blocked':
+                    logger.warning(f"Blocked on {item['name']}. Retrying in 45s...")
+                    import time
+                    time.sleep(45)
+                    result = scraper.run(item['url'], browser_mgr=bm)
+
+                if process_result(item, result, dispatcher):
+                    report("product_succeeded", item, price=result['price'], currency=result.get('currency'))
+                elif result and result.get('status') == 'blocked':
+                    report("product_blocked", item)
+                else:
+                    report("product_failed", item, error="No price extracted")
+            except Exception as e:
+                logger.error(f"Error processing {item['name']}: {e}")
+                report("product_failed", item, error=str(e))
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,60 @@
+"""
+Apply the price_history retention policy configured in config/settings.json:
+
+    "retention": {
+        "collapse_after_days": 14,     # older days keep only their last scrape per product
+        "archive_after_days": 365,     # older rows leave the live DB entirely
+        "archive_dir": "data/archive"  # gzip CSV side files, one per month
+    }
+
+Removed rows are archived before deletion, then the DB is vacuumed.
+
+Usage:
+    python scripts/apply_retention.py
+    python scripts/apply_retention.py --dry-run
+"""
+
+import sys
+import os
+import json
+import argparse
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+from storage.db_manager import DatabaseManager
+from storage.retention import RetentionManager
+
+LOCAL_DB = os.path.join(ROOT_DIR, "storage", "history.db")
+SETTINGS_JSON = os.path.join(ROOT_DIR, "config", "settings.json")
+
+
+def load_settings():
+    if not os.path.exists(SETTINGS_JSON):
+        return {}
+    with open(SETTINGS_JSON, "r") as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="price_history retention job")
+    parser.add_argument("--dry-run", action="store_true", help="Only report how many rows would be removed")
+    args = parser.parse_args()
+
+    db = DatabaseManager(db_path=LOCAL_DB)
+    manager = RetentionManager.from_settings(db, load_settings(), ROOT_DIR)
+    summary = manager.run(dry_run=args.dry_run)
+
+    if summary["dry_run"]:
+        print(f"🔎 Dry run: {summary['expired']} rows would be archived and removed.")
+        return
+
+    print(f"🎉 Done!")
+    print(f"   Removed:  {summary['removed']} rows")
+    print(f"   Archived: {', '.join(summary['archived_months']) or '-'}")
+    print(f"   DB size:  {summary['bytes_before']} -> {summary['bytes_after']} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""
+One-time backfill of the price_daily rollup from existing price_history rows.
+Safe to rerun: every product-day present in price_history is recomputed, except days that
+retention (scripts/apply_retention.py) has already collapsed, whose rollup rows are kept.
+
+Usage:
+    python scripts/backfill_price_daily.py
+"""
+
+import sqlite3
+import sys
+import os
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+from storage.db_manager import DatabaseManager
+
+LOCAL_DB = os.path.join(ROOT_DIR, "storage", "history.db")
+
+
+def main():
+    db = DatabaseManager(db_path=LOCAL_DB)
+    written = db.rebuild_daily()
+
+    with sqlite3.connect(LOCAL_DB) as conn:
+        raw_rows = conn.execute("SELECT COUNT(*) FROM price_history").fetchone()[0]
+        daily_rows = conn.execute("SELECT COUNT(*) FROM price_daily").fetchone()[0]
+
+    print(f"🎉 Done!")
+    print(f"   Raw rows:            {raw_rows}")
+    print(f"   Product-days written: {written}")
+    print(f"   Rollup size:         {daily_rows}")
+
+
+if __name__ == "__main__":
+    main()
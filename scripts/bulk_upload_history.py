@@ -1,15 +1,19 @@
 """
-Bulk upload all historical data from local SQLite to Supabase.
-Avoids duplicates by checking existing records in fact_market_price.
+Sync local daily history (price_daily) to Supabase incrementally.
+
+Only product-days observed since the last successful run are sent (the watermark is the
+rollup's last_ts, stored in the db_meta table of history.db). Facts are upserted on
+(source_id, source_product_key, date_id), so reruns, overlapping runs and --full resyncs
+never create duplicates.
 
 Usage:
-    python scripts/bulk_upload_history.py
+    python scripts/bulk_upload_history.py            # new/updated product-days only
+    python scripts/bulk_upload_history.py --full     # resend the whole history (e.g. after seeding aliases)
 """
 
-import sqlite3
 import sys
 import os
-import json
+import argparse
 from datetime import datetime, date
 
 ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -17,114 +21,94 @@ if ROOT_DIR not in sys.path:
     sys.path.append(ROOT_DIR)
 
 from storage.supabase_manager import SupabaseManager
+from storage.db_manager import DatabaseManager
+from storage.product_catalog import ProductCatalog
 
 LOCAL_DB = os.path.join(ROOT_DIR, "storage", "history.db")
+SETTINGS_JSON = os.path.join(ROOT_DIR, "config", "settings.json")
 PRODUCTS_JSON = os.path.join(ROOT_DIR, "config", "products.json")
 
+WATERMARK_KEY = "warehouse_sync_last_ts"
+
 
 def load_active_product_ids():
     """Load active product IDs from products.json."""
-    with open(PRODUCTS_JSON, "r") as f:
-        products = json.load(f)
-    return set(p["id"] for p in products if p.get("active", True))
-
-
-def get_existing_keys(sb):
-    """Get existing (source_product_key, date_id) pairs from Supabase to avoid duplicates."""
-    import psycopg2
-    existing = set()
-    with psycopg2.connect(sb._dsn) as conn:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT source_product_key, date_id 
-                FROM capstone.fact_market_price 
-                WHERE source_id IN (4, 5, 6)
-            """)
-            for key, dt in cur.fetchall():
-                existing.add((key, dt))
-    return existing
+    return ProductCatalog(PRODUCTS_JSON).active_ids()
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Sync daily price history to Supabase")
+    parser.add_argument("--full", action="store_true", help="Ignore the watermark and resend everything")
+    args = parser.parse_args()
+
     sb = SupabaseManager()
     active_ids = load_active_product_ids()
-    existing_keys = get_existing_keys(sb)
-    
+    db = DatabaseManager(db_path=LOCAL_DB, storage_mode=DatabaseManager.storage_mode_from_settings(SETTINGS_JSON))
+
+    watermark = None if args.full else db.get_meta(WATERMARK_KEY)
     print(f"📦 Active products: {len(active_ids)}")
-    print(f"📦 Existing Supabase records: {len(existing_keys)}")
-
-    # Read all local history, keeping only the latest per product per day
-    conn_local = sqlite3.connect(LOCAL_DB)
-    cur = conn_local.cursor()
-    cur.execute("""
-        SELECT product_id, store, product_name, price, unit_price, standard_unit, 
-               unit, quantity, currency, url, timestamp
-        FROM price_history
-        ORDER BY product_id, timestamp DESC
-    """)
-    rows = cur.fetchall()
-    conn_local.close()
-
-    # Deduplicate: keep one record per (product_id, date)
-    seen = {}
+    print(f"📦 Watermark: {watermark or 'none (full sync)'}")
+
+    # One record per (product_id, date): the latest observation of the day, as the rollup tracks it.
+    # since_ts uses >=, so the boundary product-days are resent; the upsert makes that harmless.
+    rows = db.daily_closes(since_ts=watermark)
+    new_watermark = max((row["last_ts"] for row in rows), default=watermark)
+
+    records = []
     for row in rows:
-        pid, store, name, price, unit_price, std_unit, unit, qty, currency, url, ts = row
-        
         # Only active products
-        if pid not in active_ids:
+        if row["product_id"] not in active_ids:
             continue
-        
-        # Parse date
         try:
-            dt = datetime.fromisoformat(ts).date()
-        except:
-            continue
-        
-        key = (pid, dt)
-        if key not in seen:
-            seen[key] = {
-                "product_id": pid,
-                "store": store,
-                "product_name": name,
-                "price": price,
-                "unit_price": unit_price if unit_price else price,
-                "standard_unit": std_unit if std_unit else "each",
-                "unit": unit,
-                "quantity": qty,
-                "currency": currency,
-                "url": url,
-                "timestamp": ts,
-            }
-
-    print(f"📦 Unique (product, date) records from SQLite: {len(seen)}")
-
-    # Upload, skipping duplicates
-    uploaded = 0
-    skipped = 0
-    failed = 0
-
-    for (pid, dt), data in sorted(seen.items()):
-        # Check if already in Supabase
-        if (pid, dt) in existing_keys:
-            skipped += 1
+            date.fromisoformat(row["date"])
+        except (TypeError, ValueError):
             continue
-
-        try:
-            success = sb.insert_market_price(data)
-            if success:
-                uploaded += 1
-                print(f"  ✅ {pid} @ {dt} -> ${data['unit_price']:.2f}")
-            else:
-                skipped += 1
-                print(f"  ⏭️  {pid} @ {dt} (no alias/vendor)")
-        except Exception as e:
-            failed += 1
-            print(f"  ❌ {pid} @ {dt}: {e}")
-
+        # The day's closing observation; its raw row may be gone, then only the close price is known
+        price, unit_price = row["price"], row["unit_price"]
+        if price is None and unit_price is None:
+            price = row["close_price"]
+        records.append({
+            "product_id": row["product_id"],
+            "store": row["store"],
+            "product_name": row["product_name"],
+            "price": price,
+            "unit_price": unit_price if unit_price is not None else price,
+            "standard_unit": row["standard_unit"] if row["standard_unit"] else "each",
+            "unit": row["unit"],
+            "quantity": row["quantity"],
+            "currency": row["currency"],
+            "url": row["url"],
+            "timestamp": row["last_ts"],
+        })
+
+    print(f"📦 Product-days to sync: {len(records)}")
+
+    outcomes = sb.insert_market_prices(records)
+    uploaded = sum(1 for o in outcomes if o["status"] == "inserted")
+    skipped = sum(1 for o in outcomes if o["status"] == "skipped")
+    failed = [r for r, o in zip(records, outcomes) if o["status"] == "failed"]
+
+    # Summarize instead of printing every row
+    unmapped = sorted({r["product_id"] for r, o in zip(records, outcomes) if o["status"] == "skipped"})
+    if unmapped:
+        print(f"  ⏭️  No alias/vendor for {len(unmapped)} products: {', '.join(unmapped[:10])}"
+              f"{' ...' if len(unmapped) > 10 else ''}")
+    errors = {o["reason"] for o in outcomes if o["status"] == "failed"}
+    for reason in list(errors)[:5]:
+        print(f"  ❌ {reason}")
+
+    # Failed product-days must be picked up again: never move the watermark past the oldest one
+    if failed:
+        new_watermark = min(r["timestamp"] for r in failed)
+    if new_watermark and new_watermark != watermark:
+        db.set_meta(WATERMARK_KEY, new_watermark)
+
+    sb.close()
     print(f"\n🎉 Done!")
     print(f"   Uploaded: {uploaded}")
-    print(f"   Skipped:  {skipped} (duplicates or unmapped)")
-    print(f"   Failed:   {failed}")
+    print(f"   Skipped:  {skipped} unmapped")
+    print(f"   Failed:   {len(failed)}")
+    print(f"   Watermark: {new_watermark}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,48 @@
+"""
+Export local price_history to a Parquet dataset partitioned by store and month.
+Only rows added since the previous export are written (as new part files).
+
+Usage:
+    python scripts/export_parquet.py
+    python scripts/export_parquet.py --full        # rebuild the whole dataset
+
+Reading back a single partition, e.g. with pyarrow:
+    import pyarrow.dataset as ds
+    dataset = ds.dataset("data/parquet", format="parquet", partitioning="hive")
+    table = dataset.to_table(filter=(ds.field("store") == "metro") & (ds.field("month") == "2026-02"))
+"""
+
+import sys
+import os
+import argparse
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+from storage.db_manager import DatabaseManager
+from storage.parquet_exporter import ParquetExporter
+
+LOCAL_DB = os.path.join(ROOT_DIR, "storage", "history.db")
+SETTINGS_JSON = os.path.join(ROOT_DIR, "config", "settings.json")
+PARQUET_DIR = os.path.join(ROOT_DIR, "data", "parquet")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Partitioned Parquet export of price_history")
+    parser.add_argument("--full", action="store_true", help="Drop existing part files and re-export everything")
+    parser.add_argument("--out-dir", default=PARQUET_DIR, help="Output dataset directory")
+    args = parser.parse_args()
+
+    db = DatabaseManager(db_path=LOCAL_DB, storage_mode=DatabaseManager.storage_mode_from_settings(SETTINGS_JSON))
+    exporter = ParquetExporter(db, out_dir=args.out_dir)
+    summary = exporter.export(full=args.full)
+
+    print(f"🎉 Done!")
+    print(f"   Exported: {summary['exported']} rows")
+    print(f"   Last id:  {summary['last_id']}")
+    print(f"   Dataset:  {summary['out_dir']}")
+
+
+if __name__ == "__main__":
+    main()
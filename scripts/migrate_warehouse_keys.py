@@ -0,0 +1,120 @@
+"""
+One-off migration: creates the unique keys the uploader's upserts rely on, scoped to the scraper.
+
+The keys (UNIQUE_KEYS in storage/warehouse.py) are partial unique indexes over the scraper's own
+sources (source_id IN (4, 5, 6)), so rows written by other capstone loaders are never constrained
+or touched. Uploads check for them and refuse to run until they exist.
+
+By default the script only reports: duplicate keys among the scraper's rows (which would block the
+index) and which indexes exist. With --apply it, in one transaction per table:
+  1. saves the duplicate rows it is about to delete to data/migrations/<table>-duplicates-<ts>.csv,
+  2. deletes them, keeping the newest row (highest id) of each key,
+  3. drops the table-wide index an earlier version created, if present,
+  4. creates the partial unique index.
+
+Usage:
+    python scripts/migrate_warehouse_keys.py            # report only
+    python scripts/migrate_warehouse_keys.py --apply
+"""
+
+import argparse
+import csv
+import os
+import sys
+from datetime import datetime
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+from dotenv import load_dotenv
+from storage.warehouse import SCRAPER_SOURCE_FILTER, UNIQUE_KEYS, warehouse_backend_from_env
+
+BACKUP_DIR = os.path.join(ROOT_DIR, "data", "migrations")
+
+
+def duplicates_sql(table, key, select):
+    """Rows of the scraper's sources that share a key with a newer row."""
+    columns = key["columns"]
+    scope = f"{SCRAPER_SOURCE_FILTER} AND " + " AND ".join(f"{c} IS NOT NULL" for c in columns)
+    return f"""
+        {select} FROM capstone.{table}
+        WHERE {scope}
+          AND {key["id_column"]} NOT IN (
+              SELECT MAX({key["id_column"]}) FROM capstone.{table} WHERE {scope} GROUP BY {", ".join(columns)}
+          )
+    """
+
+
+def report(cur, backend, table, key):
+    columns = ", ".join(key["columns"])
+    cur.execute(f"""
+        SELECT COUNT(*), COALESCE(SUM(n - 1), 0) FROM (
+            SELECT COUNT(*) AS n FROM capstone.{table}
+            WHERE {SCRAPER_SOURCE_FILTER}
+            GROUP BY {columns} HAVING COUNT(*) > 1
+        ) d
+    """)
+    groups, extra = cur.fetchone()
+    print(f"capstone.{table} ({columns}) WHERE {SCRAPER_SOURCE_FILTER}")
+    print(f"  index {key['index']}: {'present' if backend.has_index(cur, key['index']) else 'missing'}")
+    if key.get("legacy_index"):
+        print(f"  legacy table-wide index {key['legacy_index']}: "
+              f"{'present (will be dropped)' if backend.has_index(cur, key['legacy_index']) else 'absent'}")
+    print(f"  duplicate keys: {groups}, rows that --apply would delete: {extra}")
+    if groups:
+        cur.execute(f"""
+            SELECT {columns}, COUNT(*) FROM capstone.{table}
+            WHERE {SCRAPER_SOURCE_FILTER}
+            GROUP BY {columns} HAVING COUNT(*) > 1
+            ORDER BY COUNT(*) DESC LIMIT 10
+        """)
+        for row in cur.fetchall():
+            print(f"    {row[:-1]} x{row[-1]}")
+    return extra
+
+
+def apply(cur, backend, table, key):
+    cur.execute(duplicates_sql(table, key, "SELECT *"))
+    rows = cur.fetchall()
+    if rows:
+        os.makedirs(BACKUP_DIR, exist_ok=True)
+        path = os.path.join(BACKUP_DIR, f"{table}-duplicates-{datetime.now():%Y%m%d-%H%M%S}.csv")
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow([d[0] for d in cur.description])
+            writer.writerows(rows)
+        print(f"  saved {len(rows)} rows to {path}")
+        cur.execute(duplicates_sql(table, key, "DELETE"))
+        print(f"  deleted {cur.rowcount} duplicate rows")
+    if key.get("legacy_index"):
+        cur.execute(f"DROP INDEX IF EXISTS capstone.{key['legacy_index']}")
+    backend.create_unique_index(cur, key["index"], table, key["columns"], where=SCRAPER_SOURCE_FILTER)
+    print(f"  created {key['index']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create the scraper's scoped unique keys in the warehouse")
+    parser.add_argument("--apply", action="store_true",
+                        help="Delete the reported duplicates (after saving them) and create the indexes")
+    args = parser.parse_args()
+
+    load_dotenv()
+    backend = warehouse_backend_from_env()
+    print(f"Warehouse backend: {backend.name}\n")
+    try:
+        for table, key in UNIQUE_KEYS.items():
+            with backend.connection() as conn:
+                with conn.cursor() as cur:
+                    report(cur, backend, table, key)
+                    if args.apply:
+                        apply(cur, backend, table, key)
+            print()
+        if not args.apply:
+            print("Report only; nothing was changed. Rerun with --apply to migrate.")
+    finally:
+        backend.close()
+
+
+if __name__ == "__main__":
+    main()
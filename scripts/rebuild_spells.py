@@ -0,0 +1,38 @@
+"""
+Convert existing price_history rows into change-only price spells.
+Run once before setting "storage_mode": "spells" in config/settings.json so the
+spell table starts with the full history. Safe to rerun: spells are rebuilt from scratch.
+
+Usage:
+    python scripts/rebuild_spells.py
+"""
+
+import sqlite3
+import sys
+import os
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+from storage.db_manager import DatabaseManager
+
+LOCAL_DB = os.path.join(ROOT_DIR, "storage", "history.db")
+
+
+def main():
+    db = DatabaseManager(db_path=LOCAL_DB, storage_mode="spells")
+    spells = db.rebuild_spells()
+
+    with sqlite3.connect(LOCAL_DB) as conn:
+        raw_rows = conn.execute("SELECT COUNT(*) FROM price_history").fetchone()[0]
+
+    print(f"🎉 Done!")
+    print(f"   Raw rows: {raw_rows}")
+    print(f"   Spells:   {spells}")
+    if spells:
+        print(f"   Ratio:    {raw_rows / spells:.1f} rows per spell")
+
+
+if __name__ == "__main__":
+    main()
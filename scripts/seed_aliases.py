@@ -1,5 +1,6 @@
 """
-Seed script: generates product_mapping.csv and optionally inserts aliases into Supabase.
+Seed script: generates product_mapping.csv (with suggested names for unmatched products)
+and optionally inserts aliases into Supabase.
 
 Usage:
     # Step 1: Generate mapping CSV for review
@@ -13,7 +14,6 @@ Usage:
 """
 
 import csv
-import json
 import os
 import sys
 import argparse
@@ -22,6 +22,9 @@ ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if ROOT_DIR not in sys.path:
     sys.path.append(ROOT_DIR)
 
+from utils.product_matcher import ProductMatcher
+from storage.product_catalog import ProductCatalog
+
 PRODUCTS_JSON = os.path.join(ROOT_DIR, "config", "products.json")
 PRODUCTS_CSV = os.path.join(ROOT_DIR, "data", "products.csv")
 MAPPING_CSV = os.path.join(ROOT_DIR, "data", "product_mapping.csv")
@@ -45,45 +48,7 @@ def load_dim_products():
 
 def load_scraper_products():
     """Load scraping products from config/products.json."""
-    with open(PRODUCTS_JSON, "r") as f:
-        return json.load(f)
-
-
-def fuzzy_match(scraper_name: str, dim_products: dict):
-    """
-    Try to find the best match between a scraper product name and dim_product names.
-    Returns (product_id, product_name, confidence) or None.
-    """
-    scraper_lower = scraper_name.lower()
-    
-    best_match = None
-    best_score = 0
-
-    for pid, dp in dim_products.items():
-        dim_lower = dp["product_name"].lower()
-        
-        # Exact match
-        if scraper_lower == dim_lower:
-            return pid, dp["product_name"], "EXACT"
-
-        # Check if dim name is contained in scraper name or vice versa
-        if dim_lower in scraper_lower or scraper_lower in dim_lower:
-            score = len(dim_lower) / max(len(scraper_lower), 1)
-            if score > best_score:
-                best_score = score
-                best_match = (pid, dp["product_name"], "PARTIAL")
-
-        # Check keyword overlap
-        dim_words = set(dim_lower.split())
-        scraper_words = set(scraper_lower.split())
-        overlap = dim_words & scraper_words
-        if len(overlap) >= 2:
-            score = len(overlap) / max(len(dim_words), len(scraper_words))
-            if score > best_score:
-                best_score = score
-                best_match = (pid, dp["product_name"], "KEYWORD")
-
-    return best_match
+    return ProductCatalog(PRODUCTS_JSON).all()
 
 
 # Hardcoded mapping overrides for known tricky cases
@@ -189,10 +154,16 @@ SOURCE_MAP = {
 }
 
 
+# Similar dim_product names listed for products without a match
+SUGGESTIONS = 3
+
+
 def generate_mapping():
     """Generate product_mapping.csv for user review."""
     dim_products = load_dim_products()
     scraper_products = load_scraper_products()
+    # Built once; each lookup only looks at the products that can satisfy a match rule
+    matcher = ProductMatcher(dim_products)
 
     rows = []
     for sp in scraper_products:
@@ -218,11 +189,12 @@ def generate_mapping():
                     "dim_unit_id": dp["unit_id"],
                     "match_type": "MANUAL",
                     "approved": "Y",
+                    "suggestions": "",
                 })
                 continue
 
         # Try fuzzy match
-        match = fuzzy_match(scraper_name, dim_products)
+        match = matcher.match(scraper_name)
         if match:
             dim_pid, dim_name, match_type = match
             dp = dim_products.get(dim_pid)
@@ -237,8 +209,12 @@ def generate_mapping():
                 "dim_unit_id": dp["unit_id"] if dp else 3,
                 "match_type": match_type,
                 "approved": "Y" if match_type == "EXACT" else "?",
+                "suggestions": "",
             })
         else:
+            # Closest names by similarity, so the reviewer can fill in dim_product_id by hand
+            suggestions = " | ".join(f"{pid}: {dim_products[pid]['product_name']}"
+                                     for pid, _ in matcher.candidates(scraper_name, k=SUGGESTIONS))
             rows.append({
                 "scraper_id": scraper_id,
                 "scraper_name": scraper_name,
@@ -250,11 +226,12 @@ def generate_mapping():
                 "dim_unit_id": "",
                 "match_type": "NONE",
                 "approved": "N",
+                "suggestions": suggestions,
             })
 
     # Write CSV
     fieldnames = ["scraper_id", "scraper_name", "store", "source_id", "active",
-                  "dim_product_id", "dim_product_name", "dim_unit_id", "match_type", "approved"]
+                  "dim_product_id", "dim_product_name", "dim_unit_id", "match_type", "approved", "suggestions"]
     
     with open(MAPPING_CSV, "w", newline="", encoding="utf-8") as f:
         writer = csv.DictWriter(f, fieldnames=fieldnames)
@@ -269,33 +246,37 @@ def generate_mapping():
 
 
 def seed_aliases():
-    """Read approved mappings from CSV and insert into Supabase."""
+    """Read approved mappings from CSV and upsert them into Supabase in one transaction."""
     from storage.supabase_manager import SupabaseManager
-    sb = SupabaseManager()
 
+    aliases = []
+    not_approved = []
     with open(MAPPING_CSV, "r", encoding="utf-8") as f:
         reader = csv.DictReader(f)
-        count = 0
         for row in reader:
             if row["approved"].strip().upper() != "Y":
-                print(f"⏭️  Skipping {row['scraper_id']} (not approved)")
+                not_approved.append(row["scraper_id"])
                 continue
-            
-            source_id = int(row["source_id"])
-            product_id = int(row["dim_product_id"])
-            unit_id = int(row["dim_unit_id"])
-            
-            sb.upsert_alias(
-                source_id=source_id,
-                product_id=product_id,
-                source_product_key=row["scraper_id"],
-                source_product_name=row["scraper_name"],
-                unit_id=unit_id,
-            )
-            count += 1
-            print(f"✅ Seeded: {row['scraper_id']} -> product_id={product_id}")
-
-    print(f"\n🎉 Done! Seeded {count} aliases.")
+            aliases.append({
+                "source_id": int(row["source_id"]),
+                "product_id": int(row["dim_product_id"]),
+                "source_product_key": row["scraper_id"],
+                "source_product_name": row["scraper_name"],
+                "unit_id": int(row["dim_unit_id"]),
+            })
+
+    sb = SupabaseManager()
+    diff = sb.upsert_aliases(aliases)
+    sb.close()
+
+    if not_approved:
+        print(f"⏭️  Skipped {len(not_approved)} not approved: {', '.join(not_approved)}")
+    for source_id, key in diff["added"]:
+        print(f"✅ Added:   {key} (source_id={source_id})")
+    for source_id, key in diff["changed"]:
+        print(f"✏️  Changed: {key} (source_id={source_id})")
+    print(f"\n🎉 Done! {len(diff['added'])} added, {len(diff['changed'])} changed, "
+          f"{len(diff['unchanged'])} unchanged.")
 
 
 def seed_vendors():
@@ -303,6 +284,7 @@ def seed_vendors():
     from storage.supabase_manager import SupabaseManager
     sb = SupabaseManager()
     vendor_map = sb.ensure_vendors()
+    sb.close()
     print(f"✅ Vendors created/verified: {vendor_map}")
 
 
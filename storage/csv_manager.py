@@ -1,31 +1,91 @@
+import atexit
 import csv
+import fcntl
+import json
 import os
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 
 class CSVManager:
-    """Manages the dataset in CSV format."""
-    
-    def __init__(self, file_path="/Users/carlosborda/Documents/Python/Learning/scraping/data/price_dataset.csv"):
+    """
+    Manages the dataset in CSV format.
+
+    Rows are buffered in memory and written in batches through a file handle that stays
+    open for the whole scan. The dataset is split into one segment per month
+    (price_dataset_2026-02.csv, ...). price_dataset_index.json
+    records which dates each segment covers, so readers only open the months they need.
+
+    Several processes append to the dataset (a scan and the UI's manual entries), so the index
+    is never written from memory: every update re-reads it under an exclusive file lock and
+    applies only this process's changes.
+    """
+
+    HEADER = ["date", "store", "product", "price", "unit", "quantity"]
+
+    def __init__(self, file_path="/Users/carlosborda/Documents/Python/Learning/scraping/data/price_dataset.csv",
+                 flush_every=50):
+        # file_path is the legacy single-file dataset; segments and the index live next to it
         self.file_path = file_path
+        self.base_dir = os.path.dirname(file_path)
+        self.stem = os.path.splitext(os.path.basename(file_path))[0]
+        self.index_path = os.path.join(self.base_dir, f"{self.stem}_index.json")
+        self.flush_every = flush_every
+
+        self._lock = threading.RLock()
+        self._buffer = []
+        self._handle = None
+        self._writer = None
+        self._month = None
         self._init_csv()
+        atexit.register(self.close)
 
     def _init_csv(self):
-        """Creates the CSV file with headers if it doesn't exist."""
-        os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
-        if not os.path.exists(self.file_path):
-            with open(self.file_path, mode='w', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                writer.writerow([
-                    "date", 
-                    "store", 
-                    "product", 
-                    "price", 
-                    "unit", 
-                    "quantity"
-                ])
+        """Loads the segment index, registering the legacy single-file dataset once if present."""
+        os.makedirs(self.base_dir, exist_ok=True)
+        self._index = self._read_index()
+        if os.path.exists(self.file_path) and "legacy" not in self._index["segments"]:
+            first_date, last_date, rows = None, None, 0
+            with open(self.file_path, "r", newline="", encoding="utf-8") as f:
+                for row in csv.DictReader(f):
+                    day = row["date"][:10]
+                    first_date = first_date or day
+                    last_date = day
+                    rows += 1
+            with self._locked_index() as index:
+                index["segments"].setdefault("legacy", {
+                    "file": os.path.basename(self.file_path), "first_date": first_date, "last_date": last_date,
+                    "rows": rows
+                })
+
+    def _read_index(self):
+        if not os.path.exists(self.index_path):
+            return {"segments": {}}
+        with open(self.index_path, "r") as f:
+            return json.load(f)
+
+    @contextmanager
+    def _locked_index(self):
+        """Yields the index as currently on disk, holding an exclusive lock; saves it on exit."""
+        with open(self.index_path + ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._index = self._read_index()
+                yield self._index
+                self._save_index()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _save_index(self):
+        # Called with the index lock held
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._index, f, indent=4)
+        os.replace(tmp_path, self.index_path)
 
+    # ── Writing ───────────────────────────────────────────────
     def append_price(self, data: dict):
-        """Appends a new price entry to the CSV file."""
+        """Buffers a new price entry; rows hit disk every `flush_every` entries or on flush()/close()."""
         # We use the standardized unit price and unit as requested for the dataset
         row = [
             datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
@@ -35,7 +95,85 @@ class CSVManager:
             data.get("standard_unit", ""),
             1.0 # Consistent with unit_price which is per 1 standard unit
         ]
-        
-        with open(self.file_path, mode='a', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow(row)
+        with self._lock:
+            self._buffer.append(row)
+            if len(self._buffer) >= self.flush_every:
+                self.flush()
+
+    def flush(self):
+        """Writes buffered rows to their monthly segments and updates the index."""
+        with self._lock:
+            if not self._buffer:
+                return
+            added = {}  # month -> [first_date, last_date, rows] written by this flush
+            for row in self._buffer:
+                month = row[0][:7]
+                if month != self._month:
+                    self._rotate(month)
+                self._writer.writerow(row)
+                day = row[0][:10]
+                stats = added.setdefault(month, [day, day, 0])
+                stats[0], stats[1], stats[2] = min(stats[0], day), max(stats[1], day), stats[2] + 1
+            self._buffer = []
+            self._handle.flush()
+            with self._locked_index() as index:
+                for month, (first_date, last_date, rows) in added.items():
+                    entry = index["segments"].setdefault(month, self._new_segment(month))
+                    entry["first_date"] = min(filter(None, [entry["first_date"], first_date]))
+                    entry["last_date"] = max(filter(None, [entry["last_date"], last_date]))
+                    entry["rows"] += rows
+
+    def _rotate(self, month):
+        """Closes the current segment and opens (or creates) the one for `month`."""
+        if self._handle:
+            self._handle.close()
+            self._handle = None
+
+        with self._locked_index() as index:
+            entry = index["segments"].setdefault(month, self._new_segment(month))
+        path = os.path.join(self.base_dir, entry["file"])
+        is_new = not os.path.exists(path)
+        self._handle = open(path, mode="a", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._handle)
+        if is_new:
+            self._writer.writerow(self.HEADER)
+        self._month = month
+
+    def _new_segment(self, month):
+        return {"file": f"{self.stem}_{month}.csv", "first_date": None, "last_date": None, "rows": 0}
+
+    def close(self):
+        """Flushes pending rows and releases the file handle. Safe to call more than once."""
+        with self._lock:
+            self.flush()
+            if self._handle:
+                self._handle.close()
+                self._handle = None
+                self._month = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    # ── Reading ───────────────────────────────────────────────
+    def iter_rows(self, start_date=None, end_date=None):
+        """Yields dataset rows (dicts) between two ISO dates, opening only the segments that cover them."""
+        self.flush()
+        segments = self._read_index()["segments"]
+        # The legacy single file predates every monthly segment
+        for name, entry in sorted(segments.items(), key=lambda item: (item[0] != "legacy", item[0])):
+            if not entry["rows"]:
+                continue
+            if start_date and entry["last_date"] < start_date:
+                continue
+            if end_date and entry["first_date"] > end_date:
+                continue
+            path = os.path.join(self.base_dir, entry["file"])
+            with open(path, "r", newline="", encoding="utf-8") as f:
+                for row in csv.DictReader(f):
+                    day = row["date"][:10]
+                    if (start_date and day < start_date) or (end_date and day > end_date):
+                        continue
+                    yield row
@@ -1,17 +1,156 @@
 import sqlite3
-from datetime import datetime
+import json
+from datetime import datetime, date, timedelta, timezone
 import os
 
+# db_meta key: ISO date before which retention has thinned the raw rows (see RetentionManager)
+PRUNED_BEFORE_KEY = "retention_pruned_before"
+
 class DatabaseManager:
-    def __init__(self, db_path="/Users/carlosborda/Documents/Python/Learning/scraping/storage/history.db"):
+    # "rows": one price_history row per scrape (default)
+    # "spells": one price_spells row per run of identical prices, extended via last_seen
+    STORAGE_MODES = ("rows", "spells")
+
+    def __init__(self, db_path="/Users/carlosborda/Documents/Python/Learning/scraping/storage/history.db", storage_mode="rows"):
+        if storage_mode not in self.STORAGE_MODES:
+            raise ValueError(f"Unknown storage_mode '{storage_mode}', expected one of {self.STORAGE_MODES}")
         self.db_path = db_path
+        self.storage_mode = storage_mode
+        self._key_cache = {}
         self._init_db()
 
+    @staticmethod
+    def storage_mode_from_settings(settings_path: str) -> str:
+        """Reads "storage_mode" from settings.json, defaulting to "rows"."""
+        if not os.path.exists(settings_path):
+            return "rows"
+        try:
+            with open(settings_path, "r") as f:
+                return json.load(f).get("storage_mode", "rows")
+        except (OSError, ValueError):
+            return "rows"
+
     def _init_db(self):
-        """Creates tables if they don't exist."""
+        """Creates tables if they don't exist and migrates a legacy price_history table in place."""
         with sqlite3.connect(self.db_path) as conn:
+            legacy = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'price_history' AND type = 'table'"
+            ).fetchone()
+
+            # Normalized layout: small dimension tables + an integer-keyed fact table
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS dim_store (
+                    store_key INTEGER PRIMARY KEY,
+                    store TEXT NOT NULL UNIQUE
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS dim_product (
+                    product_key INTEGER PRIMARY KEY,
+                    product_id TEXT NOT NULL UNIQUE,
+                    product_name TEXT,
+                    url TEXT
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS dim_unit (
+                    unit_key INTEGER PRIMARY KEY,
+                    unit TEXT NOT NULL UNIQUE
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS dim_currency (
+                    currency_key INTEGER PRIMARY KEY,
+                    currency TEXT NOT NULL UNIQUE
+                )
+            """)
+            # ts: wall-clock seconds since epoch (the naive local timestamp read as UTC)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS price_fact (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    product_key INTEGER NOT NULL REFERENCES dim_product (product_key),
+                    store_key INTEGER NOT NULL REFERENCES dim_store (store_key),
+                    ts INTEGER NOT NULL,
+                    price REAL,
+                    unit_price REAL,
+                    quantity REAL,
+                    unit_key INTEGER REFERENCES dim_unit (unit_key),
+                    standard_unit_key INTEGER REFERENCES dim_unit (unit_key),
+                    currency_key INTEGER REFERENCES dim_currency (currency_key),
+                    stock TEXT,
+                    revision_key INTEGER REFERENCES dim_product_revision (revision_key)
+                )
+            """)
+            # Name and url a product was scraped with; dim_product only keeps the latest ones
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS dim_product_revision (
+                    revision_key INTEGER PRIMARY KEY,
+                    product_key INTEGER NOT NULL REFERENCES dim_product (product_key),
+                    product_name TEXT,
+                    url TEXT
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_product_revision_product ON dim_product_revision (product_key)")
+            fact_columns = {row[1] for row in conn.execute("PRAGMA table_info(price_fact)")}
+            if "revision_key" not in fact_columns:
+                # Rows written before revisions existed keep NULL and read the current name
+                conn.execute("ALTER TABLE price_fact ADD COLUMN revision_key INTEGER REFERENCES dim_product_revision (revision_key)")
+                conn.execute("DROP VIEW IF EXISTS price_history")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_price_fact_product_ts ON price_fact (product_key, ts)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_price_fact_ts ON price_fact (ts)")
+
+            if legacy:
+                self._migrate_legacy_history(conn)
+
+            # Read-compatible view with the original price_history columns. product_name and url are
+            # the ones each row was scraped with (the current ones for rows older than revisions).
+            conn.execute("""
+                CREATE VIEW IF NOT EXISTS price_history AS
+                SELECT
+                    f.id,
+                    p.product_id,
+                    s.store,
+                    COALESCE(r.product_name, p.product_name) AS product_name,
+                    f.price,
+                    c.currency,
+                    f.stock,
+                    u.unit,
+                    f.quantity,
+                    f.unit_price,
+                    su.unit AS standard_unit,
+                    strftime('%Y-%m-%dT%H:%M:%S', f.ts, 'unixepoch') AS timestamp,
+                    COALESCE(r.url, p.url) AS url
+                FROM price_fact f
+                JOIN dim_product p ON p.product_key = f.product_key
+                LEFT JOIN dim_product_revision r ON r.revision_key = f.revision_key
+                JOIN dim_store s ON s.store_key = f.store_key
+                LEFT JOIN dim_unit u ON u.unit_key = f.unit_key
+                LEFT JOIN dim_unit su ON su.unit_key = f.standard_unit_key
+                LEFT JOIN dim_currency c ON c.currency_key = f.currency_key
+            """)
+            # Daily rollup: one row per product per day, maintained by save_price
             conn.execute("""
-                CREATE TABLE IF NOT EXISTS price_history (
+                CREATE TABLE IF NOT EXISTS price_daily (
+                    product_id TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    store TEXT NOT NULL,
+                    product_name TEXT,
+                    standard_unit TEXT,
+                    open_price REAL,
+                    close_price REAL,
+                    min_price REAL,
+                    max_price REAL,
+                    sample_count INTEGER NOT NULL DEFAULT 0,
+                    first_ts TEXT,
+                    last_ts TEXT,
+                    PRIMARY KEY (product_id, date)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_price_daily_date ON price_daily (date)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_price_daily_last_ts ON price_daily (last_ts)")
+            # Change-only storage: valid_to stays NULL while the spell is still open
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS price_spells (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     product_id TEXT NOT NULL,
                     store TEXT NOT NULL,
@@ -23,85 +162,825 @@ class DatabaseManager:
                     quantity REAL,
                     unit_price REAL,
                     standard_unit TEXT,
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    url TEXT
+                    url TEXT,
+                    valid_from TEXT NOT NULL,
+                    valid_to TEXT,
+                    last_seen TEXT NOT NULL,
+                    observations INTEGER NOT NULL DEFAULT 1
+                )
+            """)
+            conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_price_spells_open ON price_spells (product_id) WHERE valid_to IS NULL")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_price_spells_last_seen ON price_spells (last_seen)")
+            # Small key/value store for bookkeeping such as sync watermarks
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS db_meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
                 )
             """)
             conn.commit()
 
+            # First run against an existing history: populate the rollup once
+            has_daily = conn.execute("SELECT 1 FROM price_daily LIMIT 1").fetchone()
+            has_history = conn.execute("SELECT 1 FROM price_fact LIMIT 1").fetchone()
+
+        if legacy:
+            # The old table's pages are free now; give them back to the filesystem
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute("VACUUM")
+        if legacy or (has_history and not has_daily):
+            self.rebuild_daily()
+
+    def _migrate_legacy_history(self, conn):
+        """Moves rows from the old wide price_history table into dims + price_fact, keeping ids."""
+        conn.execute("INSERT OR IGNORE INTO dim_store (store) SELECT DISTINCT store FROM price_history WHERE store IS NOT NULL")
+        # Latest name/url per product wins
+        conn.execute("""
+            INSERT OR IGNORE INTO dim_product (product_id, product_name, url)
+            SELECT product_id, product_name, url FROM (
+                SELECT product_id, product_name, url, ROW_NUMBER() OVER (
+                    PARTITION BY product_id ORDER BY timestamp DESC, id DESC
+                ) AS rn
+                FROM price_history
+            )
+            WHERE rn = 1
+        """)
+        conn.execute("""
+            INSERT OR IGNORE INTO dim_unit (unit)
+            SELECT unit FROM price_history WHERE unit IS NOT NULL
+            UNION
+            SELECT standard_unit FROM price_history WHERE standard_unit IS NOT NULL
+        """)
+        conn.execute("INSERT OR IGNORE INTO dim_currency (currency) SELECT DISTINCT currency FROM price_history WHERE currency IS NOT NULL")
+        conn.execute("""
+            INSERT INTO dim_product_revision (product_key, product_name, url)
+            SELECT DISTINCT p.product_key, h.product_name, h.url
+            FROM price_history h
+            JOIN dim_product p ON p.product_id = h.product_id
+        """)
+        conn.execute("""
+            INSERT INTO price_fact (
+                id, product_key, store_key, ts, price, unit_price, quantity,
+                unit_key, standard_unit_key, currency_key, stock, revision_key
+            )
+            SELECT
+                h.id,
+                p.product_key,
+                s.store_key,
+                CAST(COALESCE(strftime('%s', h.timestamp), strftime('%s', 'now')) AS INTEGER),
+                h.price,
+                h.unit_price,
+                h.quantity,
+                u.unit_key,
+                su.unit_key,
+                c.currency_key,
+                h.stock,
+                r.revision_key
+            FROM price_history h
+            JOIN dim_product p ON p.product_id = h.product_id
+            LEFT JOIN dim_product_revision r ON r.product_key = p.product_key
+                AND r.product_name IS h.product_name AND r.url IS h.url
+            JOIN dim_store s ON s.store = h.store
+            LEFT JOIN dim_unit u ON u.unit = h.unit
+            LEFT JOIN dim_unit su ON su.unit = h.standard_unit
+            LEFT JOIN dim_currency c ON c.currency = h.currency
+            ORDER BY h.id
+        """)
+        conn.execute("DROP TABLE price_history")
+
+    # ── Dimension keys ────────────────────────────────────────
+    def _dim_key(self, conn, table: str, key_col: str, value_col: str, value):
+        """Returns the integer key for a dimension value, inserting it if new. Keys never change once assigned."""
+        if value is None:
+            return None
+        cache_key = (table, value)
+        if cache_key in self._key_cache:
+            return self._key_cache[cache_key]
+        inserted = conn.execute(f"INSERT OR IGNORE INTO {table} ({value_col}) VALUES (?)", (value,)).rowcount
+        key = conn.execute(f"SELECT {key_col} FROM {table} WHERE {value_col} = ?", (value,)).fetchone()[0]
+        # A key created in this transaction could still be rolled back, so only cache committed ones
+        if not inserted:
+            self._key_cache[cache_key] = key
+        return key
+
+    def _product_key(self, conn, data: dict):
+        """Returns the product key, refreshing the stored name/url if they changed."""
+        conn.execute("""
+            INSERT INTO dim_product (product_id, product_name, url)
+            VALUES (?, ?, ?)
+            ON CONFLICT (product_id) DO UPDATE SET
+                product_name = COALESCE(excluded.product_name, dim_product.product_name),
+                url = COALESCE(excluded.url, dim_product.url)
+            WHERE excluded.product_name IS NOT dim_product.product_name
+               OR excluded.url IS NOT dim_product.url
+        """, (data.get("product_id"), data.get("product_name"), data.get("url")))
+        return conn.execute("SELECT product_key FROM dim_product WHERE product_id = ?",
+                            (data.get("product_id"),)).fetchone()[0]
+
+    def _revision_key(self, conn, product_key: int, data: dict):
+        """Returns the key of the product's (name, url) revision, inserting it if new."""
+        revision = (product_key, data.get("product_name"), data.get("url"))
+        cache_key = ("dim_product_revision", revision)
+        if cache_key in self._key_cache:
+            return self._key_cache[cache_key]
+        row = conn.execute("""
+            SELECT revision_key FROM dim_product_revision
+            WHERE product_key = ? AND product_name IS ? AND url IS ?
+        """, revision).fetchone()
+        if row:
+            self._key_cache[cache_key] = row[0]
+            return row[0]
+        # Not cached yet: the transaction could still be rolled back (see _dim_key)
+        return conn.execute("INSERT INTO dim_product_revision (product_key, product_name, url) VALUES (?, ?, ?)",
+                            revision).lastrowid
+
+    @staticmethod
+    def _to_epoch(timestamp: str) -> int:
+        """
+        ISO timestamp -> wall-clock epoch seconds, matching strftime('%s', ...) in SQLite.
+        A UTC offset is ignored (the wall-clock reading is kept, like the naive timestamps the
+        scrapers produce) and fractions of a second are truncated: price_fact.ts is whole seconds.
+        """
+        wall_clock = datetime.fromisoformat(timestamp).replace(tzinfo=None)
+        return (wall_clock - datetime(1970, 1, 1)) // timedelta(seconds=1)
+
+    @staticmethod
+    def _normalize_ts(timestamp: str) -> str:
+        """ISO timestamp -> naive 'YYYY-MM-DDTHH:MM:SS[.ffffff]', so stored timestamps compare correctly as text."""
+        return datetime.fromisoformat(timestamp).replace(tzinfo=None).isoformat()
+
+    @staticmethod
+    def _from_epoch(ts: int) -> str:
+        return datetime.fromtimestamp(ts, timezone.utc).replace(tzinfo=None).isoformat()
+
+    def _upsert_daily(self, conn, data: dict, timestamp: str):
+        """Folds one observation into the price_daily rollup (caller owns the transaction)."""
+        # Fall back to the shelf price only when no unit price was parsed (0 is a real price)
+        price = data.get("unit_price")
+        if price is None:
+            price = data.get("price")
+        conn.execute("""
+            INSERT INTO price_daily (
+                product_id, date, store, product_name, standard_unit,
+                open_price, close_price, min_price, max_price, sample_count, first_ts, last_ts
+            )
+            VALUES (?, DATE(?), ?, ?, ?, ?, ?, ?, ?, 1, ?, ?)
+            ON CONFLICT (product_id, date) DO UPDATE SET
+                open_price = CASE WHEN excluded.first_ts < price_daily.first_ts
+                                  THEN excluded.open_price ELSE price_daily.open_price END,
+                first_ts = MIN(price_daily.first_ts, excluded.first_ts),
+                close_price = CASE WHEN excluded.last_ts >= price_daily.last_ts
+                                   THEN excluded.close_price ELSE price_daily.close_price END,
+                store = CASE WHEN excluded.last_ts >= price_daily.last_ts
+                             THEN excluded.store ELSE price_daily.store END,
+                product_name = CASE WHEN excluded.last_ts >= price_daily.last_ts
+                                    THEN excluded.product_name ELSE price_daily.product_name END,
+                standard_unit = CASE WHEN excluded.last_ts >= price_daily.last_ts
+                                     THEN excluded.standard_unit ELSE price_daily.standard_unit END,
+                last_ts = MAX(price_daily.last_ts, excluded.last_ts),
+                min_price = MIN(COALESCE(price_daily.min_price, excluded.min_price), COALESCE(excluded.min_price, price_daily.min_price)),
+                max_price = MAX(COALESCE(price_daily.max_price, excluded.max_price), COALESCE(excluded.max_price, price_daily.max_price)),
+                sample_count = price_daily.sample_count + 1
+        """, (
+            data.get("product_id"),
+            timestamp,
+            data.get("store"),
+            data.get("product_name"),
+            data.get("standard_unit"),
+            price, price, price, price,
+            timestamp, timestamp
+        ))
+
     def save_price(self, data: dict):
-        """Inserts a new price record."""
+        """Stores a price observation according to storage_mode."""
+        self.save_prices([data])
+
+    def save_prices(self, records: list):
+        """
+        Stores a batch of price observations in a single transaction.
+        Returns the previous price of each record's product (None if new), for change detection.
+        """
+        previous = []
         with sqlite3.connect(self.db_path) as conn:
+            for data in records:
+                # Mixed 'T' / space separators would order wrongly in the text comparisons below
+                timestamp = self._normalize_ts(data.get("timestamp") or datetime.now().isoformat())
+                previous.append(self._last_price(conn, data.get("product_id")))
+                if self.storage_mode == "spells":
+                    self._save_spell(conn, data, timestamp)
+                    continue
+                # Fact row + daily rollup in the same transaction
+                ts = self._to_epoch(timestamp)
+                product_key = self._product_key(conn, data)
+                conn.execute("""
+                    INSERT INTO price_fact (
+                        product_key, store_key, ts, price, unit_price, quantity,
+                        unit_key, standard_unit_key, currency_key, stock, revision_key
+                    )
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, (
+                    product_key,
+                    self._dim_key(conn, "dim_store", "store_key", "store", data.get("store")),
+                    ts,
+                    data.get("price"),
+                    data.get("unit_price"),
+                    data.get("quantity"),
+                    self._dim_key(conn, "dim_unit", "unit_key", "unit", data.get("unit")),
+                    self._dim_key(conn, "dim_unit", "unit_key", "unit", data.get("standard_unit")),
+                    self._dim_key(conn, "dim_currency", "currency_key", "currency", data.get("currency")),
+                    data.get("stock"),
+                    self._revision_key(conn, product_key, data)
+                ))
+                # Rollup timestamps use the same second precision as the fact table
+                self._upsert_daily(conn, data, self._from_epoch(ts))
+            if records:
+                self._bump_write_seq(conn)
+            conn.commit()
+        return previous
+
+    def _save_spell(self, conn, data: dict, timestamp: str):
+        """Extends the open spell if the price is unchanged, otherwise closes it and opens a new one."""
+        open_spell = conn.execute("""
+            SELECT id, price, unit_price, standard_unit, last_seen
+            FROM price_spells
+            WHERE product_id = ? AND valid_to IS NULL
+        """, (data.get("product_id"),)).fetchone()
+
+        if open_spell:
+            spell_id, price, unit_price, std_unit, last_seen = open_spell
+            unchanged = (price == data.get("price") and unit_price == data.get("unit_price")
+                         and std_unit == data.get("standard_unit"))
+            if unchanged:
+                conn.execute("""
+                    UPDATE price_spells
+                    SET last_seen = MAX(last_seen, ?), observations = observations + 1,
+                        product_name = ?, url = ?, stock = ?
+                    WHERE id = ?
+                """, (timestamp, data.get("product_name"), data.get("url"), data.get("stock"), spell_id))
+                return
+            conn.execute("UPDATE price_spells SET valid_to = ? WHERE id = ?", (timestamp, spell_id))
+
+        conn.execute("""
+            INSERT INTO price_spells (
+                product_id, store, product_name, price, currency, stock,
+                unit, quantity, unit_price, standard_unit, url, valid_from, last_seen
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (
+            data.get("product_id"),
+            data.get("store"),
+            data.get("product_name"),
+            data.get("price"),
+            data.get("currency"),
+            data.get("stock"),
+            data.get("unit"),
+            data.get("quantity"),
+            data.get("unit_price"),
+            data.get("standard_unit"),
+            data.get("url"),
+            timestamp,
+            timestamp
+        ))
+
+    def rebuild_spells(self):
+        """
+        Converts the raw price_history rows into price_spells, replacing any existing spells.
+        Used when switching an existing database to storage_mode="spells". Returns the number of spells.
+        """
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("DELETE FROM price_spells")
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute("""
+                SELECT product_id, store, product_name, price, currency, stock,
+                       unit, quantity, unit_price, standard_unit, url, timestamp
+                FROM price_history
+                ORDER BY product_id, timestamp, id
+            """)
+            for row in rows:
+                self._save_spell(conn, dict(row), self._normalize_ts(row["timestamp"]))
+            count = conn.execute("SELECT COUNT(*) FROM price_spells").fetchone()[0]
+            self._bump_write_seq(conn)
+            conn.commit()
+            return count
+
+    def rebuild_daily(self):
+        """
+        Recomputes price_daily from the raw price_fact rows.
+        Days that no longer have raw rows are left untouched, and so are days before the retention
+        watermark: their raw rows were collapsed, but their rollup still holds the full day.
+        Returns the number of product-days written.
+        """
+        with sqlite3.connect(self.db_path) as conn:
+            row = conn.execute("SELECT value FROM db_meta WHERE key = ?", (PRUNED_BEFORE_KEY,)).fetchone()
+            pruned_before = row[0] if row else "0000-00-00"
             conn.execute("""
-                INSERT INTO price_history (
-                    product_id, store, product_name, price, currency, stock, 
-                    unit, quantity, unit_price, standard_unit, url, timestamp
+                WITH obs AS (
+                    SELECT
+                        f.id,
+                        f.product_key,
+                        f.store_key,
+                        f.standard_unit_key,
+                        f.revision_key,
+                        f.ts,
+                        DATE(f.ts, 'unixepoch') AS date,
+                        COALESCE(f.unit_price, f.price) AS value
+                    FROM price_fact f
+                    WHERE DATE(f.ts, 'unixepoch') >= ?
+                ),
+                ranked AS (
+                    SELECT
+                        obs.*,
+                        ROW_NUMBER() OVER (PARTITION BY product_key, date ORDER BY ts, id) AS rn_first,
+                        ROW_NUMBER() OVER (PARTITION BY product_key, date ORDER BY ts DESC, id DESC) AS rn_last
+                    FROM obs
+                ),
+                days AS (
+                    SELECT
+                        product_key,
+                        date,
+                        MIN(value) AS min_price,
+                        MAX(value) AS max_price,
+                        COUNT(*) AS sample_count,
+                        MIN(ts) AS first_ts,
+                        MAX(ts) AS last_ts
+                    FROM obs
+                    GROUP BY product_key, date
                 )
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                data.get("product_id"),
-                data.get("store"),
-                data.get("product_name"),
-                data.get("price"),
-                data.get("currency"),
-                data.get("stock"),
-                data.get("unit"),
-                data.get("quantity"),
-                data.get("unit_price"),
-                data.get("standard_unit"),
-                data.get("url"),
-                data.get("timestamp", datetime.now().isoformat())
-            ))
+                INSERT OR REPLACE INTO price_daily (
+                    product_id, date, store, product_name, standard_unit,
+                    open_price, close_price, min_price, max_price, sample_count, first_ts, last_ts
+                )
+                SELECT
+                    p.product_id,
+                    d.date,
+                    s.store,
+                    COALESCE(r.product_name, p.product_name),
+                    su.unit,
+                    first.value,
+                    last.value,
+                    d.min_price,
+                    d.max_price,
+                    d.sample_count,
+                    strftime('%Y-%m-%dT%H:%M:%S', d.first_ts, 'unixepoch'),
+                    strftime('%Y-%m-%dT%H:%M:%S', d.last_ts, 'unixepoch')
+                FROM days d
+                JOIN ranked first ON first.product_key = d.product_key AND first.date = d.date AND first.rn_first = 1
+                JOIN ranked last ON last.product_key = d.product_key AND last.date = d.date AND last.rn_last = 1
+                JOIN dim_product p ON p.product_key = d.product_key
+                LEFT JOIN dim_product_revision r ON r.revision_key = last.revision_key
+                JOIN dim_store s ON s.store_key = last.store_key
+                LEFT JOIN dim_unit su ON su.unit_key = last.standard_unit_key
+            """, (pruned_before,))
+            written = conn.execute("SELECT changes()").fetchone()[0]
+            self._bump_write_seq(conn)
             conn.commit()
+            return written
+
+    def iter_history(self, since_id=0, batch_size=5000):
+        """Yields raw price_history rows as dicts in id order, starting after since_id."""
+        last_id = since_id
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            while True:
+                rows = conn.execute("""
+                    SELECT id, product_id, store, product_name, price, currency, stock,
+                           unit, quantity, unit_price, standard_unit, timestamp, url
+                    FROM price_history
+                    WHERE id > ?
+                    ORDER BY id
+                    LIMIT ?
+                """, (last_id, batch_size)).fetchall()
+                if not rows:
+                    return
+                for row in rows:
+                    yield dict(row)
+                last_id = rows[-1]["id"]
+
+    def iter_export(self, dataset="raw", start=None, end=None, product_ids=None, store=None, batch_size=5000):
+        """
+        Streams rows for an export straight from a SQLite cursor, yielding (columns, rows) batches of
+        up to batch_size tuples, so memory stays flat whatever the size of the export. The first
+        batch may be empty (no matching rows), so callers always get the column names.
+        dataset: "raw" (price_history, or price_spells in spells mode) or "daily" (the rollup).
+        Raw rows carry the name and url they were scraped with; rows stored before name revisions
+        were tracked show the current ones.
+        start / end: inclusive ISO dates.
+        """
+        if dataset not in ("raw", "daily"):
+            raise ValueError(f"Unknown dataset '{dataset}', expected 'raw' or 'daily'")
+        if dataset == "daily" and self.storage_mode == "spells":
+            # Spells are expanded in Python; batches still stream, the expansion itself does not
+            rows = self._expand_spells(product_ids=product_ids, store=store, start=start, end=end)
+            columns = ["product_id", "date", "store", "product_name", "standard_unit", "open_price",
+                       "close_price", "min_price", "max_price", "sample_count", "first_ts", "last_ts"]
+            for i in range(0, max(len(rows), 1), batch_size):
+                yield columns, [tuple(r[c] for c in columns) for r in rows[i:i + batch_size]]
+            return
+
+        params = []
+        if dataset == "daily":
+            query = """
+                SELECT product_id, date, store, product_name, standard_unit,
+                       open_price, close_price, min_price, max_price, sample_count, first_ts, last_ts
+                FROM price_daily
+                WHERE 1 = 1
+            """
+            if start:
+                query += " AND date >= ?"
+                params.append(start)
+            if end:
+                query += " AND date <= ?"
+                params.append(end)
+            order = " ORDER BY product_id, date"
+        elif self.storage_mode == "spells":
+            query = """
+                SELECT id, product_id, store, product_name, price, currency, stock, unit, quantity,
+                       unit_price, standard_unit, url, valid_from, valid_to, last_seen, observations
+                FROM price_spells
+                WHERE 1 = 1
+            """
+            # Spells overlapping [start, end]
+            if start:
+                query += " AND last_seen >= ?"
+                params.append(start)
+            if end:
+                query += " AND valid_from < DATE(?, '+1 day')"
+                params.append(end)
+            order = " ORDER BY id"
+        else:
+            # Same columns as the price_history view, filtered on the indexed fact columns
+            query = """
+                SELECT
+                    f.id, p.product_id, s.store, COALESCE(r.product_name, p.product_name) AS product_name,
+                    f.price, c.currency, f.stock, u.unit, f.quantity, f.unit_price, su.unit AS standard_unit,
+                    strftime('%Y-%m-%dT%H:%M:%S', f.ts, 'unixepoch') AS timestamp, COALESCE(r.url, p.url) AS url
+                FROM price_fact f
+                JOIN dim_product p ON p.product_key = f.product_key
+                LEFT JOIN dim_product_revision r ON r.revision_key = f.revision_key
+                JOIN dim_store s ON s.store_key = f.store_key
+                LEFT JOIN dim_unit u ON u.unit_key = f.unit_key
+                LEFT JOIN dim_unit su ON su.unit_key = f.standard_unit_key
+                LEFT JOIN dim_currency c ON c.currency_key = f.currency_key
+                WHERE 1 = 1
+            """
+            if start:
+                query += " AND f.ts >= ?"
+                params.append(self._to_epoch(start))
+            if end:
+                query += " AND f.ts < ?"
+                params.append(self._to_epoch((date.fromisoformat(end) + timedelta(days=1)).isoformat()))
+            order = " ORDER BY f.ts, f.id"
+        prefix = "p." if dataset == "raw" and self.storage_mode != "spells" else ""
+        if product_ids is not None:
+            query += f" AND {prefix}product_id IN ({','.join('?' for _ in product_ids)})"
+            params.extend(product_ids)
+        if store:
+            query += f" AND {'s.' if prefix else ''}store = ?"
+            params.append(store)
+
+        # The generator may be resumed from different worker threads (streaming responses)
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        try:
+            cursor = conn.execute(query + order, params)
+            columns = [d[0] for d in cursor.description]
+            rows = cursor.fetchmany(batch_size)
+            yield columns, rows
+            while rows:
+                rows = cursor.fetchmany(batch_size)
+                if rows:
+                    yield columns, rows
+        finally:
+            conn.close()
 
     def get_last_price(self, product_id: str):
         """Retrieves the most recent price for a product to detect changes."""
         with sqlite3.connect(self.db_path) as conn:
+            return self._last_price(conn, product_id)
+
+    def _last_price(self, conn, product_id: str):
+        if self.storage_mode == "spells":
             cursor = conn.execute("""
-                SELECT price FROM price_history 
-                WHERE product_id = ? 
-                ORDER BY timestamp DESC LIMIT 1
+                SELECT price FROM price_spells
+                WHERE product_id = ?
+                ORDER BY last_seen DESC LIMIT 1
             """, (product_id,))
-            row = cursor.fetchone()
-            return row[0] if row else None
+        else:
+            cursor = conn.execute("""
+                SELECT f.price FROM price_fact f
+                JOIN dim_product p ON p.product_key = f.product_key
+                WHERE p.product_id = ?
+                ORDER BY f.ts DESC, f.id DESC LIMIT 1
+            """, (product_id,))
+        row = cursor.fetchone()
+        return row[0] if row else None
 
-    def get_history(self, days=7):
-        """Retrieves price history grouped by product. If days=None, returns all history."""
+    def get_meta(self, key: str, default=None):
+        """Reads a value from the db_meta key/value table."""
+        with sqlite3.connect(self.db_path) as conn:
+            row = conn.execute("SELECT value FROM db_meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key: str, value):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("""
+                INSERT INTO db_meta (key, value) VALUES (?, ?)
+                ON CONFLICT(key) DO UPDATE SET value = excluded.value
+            """, (key, value))
+
+    @staticmethod
+    def _bump_write_seq(conn):
+        """Counts committed writes to the price tables (caller owns the transaction); see write_seq()."""
+        conn.execute("""
+            INSERT INTO db_meta (key, value) VALUES ('write_seq', 1)
+            ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1
+        """)
+
+    def write_seq(self) -> int:
+        """
+        Sequence number that changes whenever price data is written, so readers can cache
+        derived results (e.g. the UI's history ETag) until it moves.
+        """
+        return int(self.get_meta("write_seq", 0))
+
+    def get_daily(self, days=None, product_ids=None, store=None, since_ts=None, start=None, end=None):
+        """
+        Returns one dict per product-day (open/close/min/max...), ordered by product and date.
+        If days=None, returns the whole series. In spells mode the spells are expanded on read.
+        since_ts: only product-days whose last observation is at or after this ISO timestamp
+        (new or updated since a previous read).
+        start / end: inclusive ISO date bounds.
+        """
+        if self.storage_mode == "spells":
+            rows = self._expand_spells(days=days, product_ids=product_ids, store=store, since_ts=since_ts,
+                                       start=start, end=end)
+            return [r for r in rows if r["last_ts"] >= since_ts] if since_ts else rows
+
+        query = """
+            SELECT product_id, date, store, product_name, standard_unit,
+                   open_price, close_price, min_price, max_price, sample_count, first_ts, last_ts
+            FROM price_daily
+            WHERE 1 = 1
+        """
+        params = []
+        if days:
+            query += " AND date >= date('now', ?)"
+            params.append(f"-{int(days)} days")
+        if product_ids is not None:
+            query += f" AND product_id IN ({','.join('?' for _ in product_ids)})"
+            params.extend(product_ids)
+        if store:
+            query += " AND store = ?"
+            params.append(store)
+        if since_ts:
+            query += " AND last_ts >= ?"
+            params.append(since_ts)
+        if start:
+            query += " AND date >= ?"
+            params.append(start)
+        if end:
+            query += " AND date <= ?"
+            params.append(end)
+        query += " ORDER BY product_id, date"
+
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            return [dict(row) for row in conn.execute(query, params)]
+
+    def daily_closes(self, since_ts=None):
+        """
+        The observation behind each product-day's close price, with its original fields (price,
+        unit_price, unit, quantity, currency, url), for the product-days get_daily(since_ts=...)
+        returns. The warehouse sync sends these, so it uploads what a live scrape would have.
+        Days whose raw rows are gone keep the rollup's fields and None for the rest.
+        """
+        if self.storage_mode == "spells":
+            return self._expand_spells(since_ts=since_ts, close_fields=True)
+
+        query = """
+            SELECT d.product_id, d.date, d.last_ts, d.close_price,
+                   COALESCE(h.store, d.store) AS store,
+                   COALESCE(h.product_name, d.product_name) AS product_name,
+                   COALESCE(h.standard_unit, d.standard_unit) AS standard_unit,
+                   h.price, h.unit_price, h.unit, h.quantity, h.currency, h.url
+            FROM price_daily d
+            JOIN dim_product p ON p.product_id = d.product_id
+            LEFT JOIN price_history h ON h.id = (
+                SELECT MAX(f.id) FROM price_fact f
+                WHERE f.product_key = p.product_key AND f.ts = CAST(strftime('%s', d.last_ts) AS INTEGER)
+            )
+        """
+        params = []
+        if since_ts:
+            query += " WHERE d.last_ts >= ?"
+            params.append(since_ts)
+        query += " ORDER BY d.product_id, d.date"
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            return [dict(row) for row in conn.execute(query, params)]
+
+    def daily_points(self, start=None, end=None, product_ids=None, store=None):
+        """
+        (product_id, day, close_price) for every product-day between the ISO dates start and end
+        (inclusive, either optional), ordered by product and date. day counts days since 1970-01-01.
+        Plain tuples instead of dicts, for bulk numeric work such as /api/series.
+        """
+        if self.storage_mode == "spells":
+            epoch = date(1970, 1, 1)
+            return [
+                (r["product_id"], (date.fromisoformat(r["date"]) - epoch).days, r["close_price"])
+                for r in self._expand_spells(product_ids=product_ids, store=store, start=start, end=end)
+            ]
+
+        query = """
+            SELECT product_id, CAST(julianday(date) - 2440587.5 AS INTEGER), close_price
+            FROM price_daily
+            WHERE close_price IS NOT NULL
+        """
+        params = []
+        if start:
+            query += " AND date >= ?"
+            params.append(start)
+        if end:
+            query += " AND date <= ?"
+            params.append(end)
+        if product_ids is not None:
+            query += f" AND product_id IN ({','.join('?' for _ in product_ids)})"
+            params.extend(product_ids)
+        if store:
+            query += " AND store = ?"
+            params.append(store)
+        query += " ORDER BY product_id, date"
+        with sqlite3.connect(self.db_path) as conn:
+            return conn.execute(query, params).fetchall()
+
+    def _expand_spells(self, days=None, product_ids=None, store=None, since_ts=None, start=None, end=None,
+                       close_fields=False):
+        """
+        Expands price_spells into the same daily rows price_daily would hold, between the
+        inclusive ISO dates start and end (and/or the last `days` days).
+
+        A spell only records that the price held from valid_from to last_seen, not which days
+        were actually scraped, so every day inside a spell is carried forward at the spell's
+        price. sample_count is therefore None, and first_ts / last_ts are the spell's bounds
+        clipped to the day. Days between spells (not seen at any price) stay empty.
+        close_fields: also return the closing spell's raw fields (price, unit_price, unit, ...).
+        """
+        query = """
+            SELECT product_id, store, product_name, standard_unit, price, unit_price, valid_from, last_seen,
+                   unit, quantity, currency, url
+            FROM price_spells
+            WHERE 1 = 1
+        """
+        params = []
+        start = date.fromisoformat(start) if start else None
+        end = date.fromisoformat(end) if end else None
         with sqlite3.connect(self.db_path) as conn:
-            query = """
-                SELECT 
-                    product_id,
-                    product_name,
-                    store,
-                    COALESCE(unit_price, price) as price,
-                    standard_unit,
-                    DATE(timestamp) as date
-                FROM price_history
-            """
-            
             if days:
-                query += f" WHERE timestamp >= date('now', '-{days} days') "
-                
-            query += " ORDER BY product_id, timestamp DESC"
-                
-            cursor = conn.execute(query)
-            
-            rows = cursor.fetchall()
-            
-            # Format: { "nf-chicken": { "id": "...", "name": "...", "store": "...", "unit": "kg", "history": { "2026-02-20": 4.99 } } }
-            results = {}
-            for row in rows:
-                p_id, name, store, price, unit, date_str = row
-                if p_id not in results:
-                    results[p_id] = {
-                        "id": p_id,
-                        "name": name,
-                        "store": store,
-                        "unit": unit or "each",
-                        "history": {}
+                since = date.fromisoformat(conn.execute("SELECT date('now', ?)", (f"-{int(days)} days",)).fetchone()[0])
+                start = max(start, since) if start else since
+            if start:
+                query += " AND DATE(last_seen) >= ?"
+                params.append(start.isoformat())
+            if end:
+                query += " AND DATE(valid_from) <= ?"
+                params.append(end.isoformat())
+            if product_ids is not None:
+                query += f" AND product_id IN ({','.join('?' for _ in product_ids)})"
+                params.extend(product_ids)
+            if store:
+                query += " AND store = ?"
+                params.append(store)
+            if since_ts:
+                query += " AND last_seen >= ?"
+                params.append(since_ts)
+            query += " ORDER BY product_id, valid_from"
+            spells = conn.execute(query, params).fetchall()
+
+        days_out = {}
+        for p_id, p_store, name, std_unit, price, unit_price, valid_from, last_seen, *raw in spells:
+            value = price if unit_price is None else unit_price
+            # Spells written before timestamps were normalized may use a space separator
+            valid_from, last_seen = self._normalize_ts(valid_from), self._normalize_ts(last_seen)
+            day = datetime.fromisoformat(valid_from).date()
+            last_day = datetime.fromisoformat(last_seen).date()
+            if start and day < start:
+                day = start
+            if end and last_day > end:
+                last_day = end
+            while day <= last_day:
+                key = (p_id, day.isoformat())
+                day_start = f"{key[1]}T00:00:00"
+                day_end = f"{key[1]}T23:59:59.999999"
+                first_ts = max(valid_from, day_start)
+                last_ts = min(last_seen, day_end)
+                row = days_out.get(key)
+                if row is None:
+                    days_out[key] = {
+                        "product_id": p_id, "date": key[1], "store": p_store,
+                        "product_name": name, "standard_unit": std_unit,
+                        "open_price": value, "close_price": value,
+                        "min_price": value, "max_price": value,
+                        "sample_count": None, "first_ts": first_ts, "last_ts": last_ts,
                     }
-                # Keep the latest price for that day if there are multiple entries
-                if date_str not in results[p_id]["history"]:
-                    results[p_id]["history"][date_str] = price
-                    
-            return list(results.values())
+                else:
+                    # Price changed during this day: spells arrive in valid_from order
+                    row.update({
+                        "store": p_store, "product_name": name, "standard_unit": std_unit,
+                        "close_price": value, "last_ts": last_ts,
+                        "min_price": min(row["min_price"], value),
+                        "max_price": max(row["max_price"], value),
+                    })
+                if close_fields:
+                    days_out[key].update(zip(("price", "unit_price", "unit", "quantity", "currency", "url"),
+                                             (price, unit_price, *raw)))
+                day += timedelta(days=1)
+
+        return [days_out[key] for key in sorted(days_out)]
+
+    def history_product_ids(self, days=None, product_ids=None, store=None, after=None, limit=None):
+        """
+        Ids of the products that have daily data in range, in product_id order: the unit of
+        pagination for get_history_page. after: only ids greater than this (the page cursor).
+        """
+        if self.storage_mode == "spells":
+            table, day_expr = "price_spells", "DATE(last_seen)"
+        else:
+            table, day_expr = "price_daily", "date"
+        query = f"SELECT DISTINCT product_id FROM {table} WHERE 1 = 1"
+        params = []
+        if days:
+            query += f" AND {day_expr} >= date('now', ?)"
+            params.append(f"-{int(days)} days")
+        if product_ids is not None:
+            query += f" AND product_id IN ({','.join('?' for _ in product_ids)})"
+            params.extend(product_ids)
+        if store:
+            query += " AND store = ?"
+            params.append(store)
+        if after:
+            query += " AND product_id > ?"
+            params.append(after)
+        query += " ORDER BY product_id"
+        if limit:
+            query += " LIMIT ?"
+            params.append(int(limit))
+        with sqlite3.connect(self.db_path) as conn:
+            return [row[0] for row in conn.execute(query, params)]
+
+    def history_dates(self, days=None, product_ids=None, store=None):
+        """Distinct dates with daily data in range, oldest first: the date columns of the history pivot."""
+        if self.storage_mode == "spells":
+            rows = self._expand_spells(days=days, product_ids=product_ids, store=store)
+            return sorted({r["date"] for r in rows})
+        query = "SELECT DISTINCT date FROM price_daily WHERE 1 = 1"
+        params = []
+        if days:
+            query += " AND date >= date('now', ?)"
+            params.append(f"-{int(days)} days")
+        if product_ids is not None:
+            query += f" AND product_id IN ({','.join('?' for _ in product_ids)})"
+            params.extend(product_ids)
+        if store:
+            query += " AND store = ?"
+            params.append(store)
+        query += " ORDER BY date"
+        with sqlite3.connect(self.db_path) as conn:
+            return [row[0] for row in conn.execute(query, params)]
+
+    def get_history(self, days=7, product_ids=None, store=None):
+        """Retrieves price history grouped by product. If days=None, returns all history."""
+        # One row per product-day; close_price is the latest price of that day
+        rows = self.get_daily(days=days, product_ids=product_ids, store=store)
+
+        # Format: { "nf-chicken": { "id": "...", "name": "...", "store": "...", "unit": "kg", "history": { "2026-02-20": 4.99 } } }
+        results = {}
+        for row in rows:
+            p_id = row["product_id"]
+            # Rows come oldest first, so name/unit end up reflecting the latest scrape
+            history = results[p_id]["history"] if p_id in results else {}
+            results[p_id] = {
+                "id": p_id,
+                "name": row["product_name"],
+                "store": row["store"],
+                "unit": row["standard_unit"] or "each",
+                "history": history
+            }
+            history[row["date"]] = row["close_price"]
+
+        # Keep the newest-first date order of the original API
+        for item in results.values():
+            item["history"] = dict(sorted(item["history"].items(), reverse=True))
+        return list(results.values())
+
+    def get_history_page(self, days=7, product_ids=None, store=None, cursor=None, limit=100):
+        """
+        One page of get_history, `limit` products at a time in product_id order.
+        Returns {"items": [...], "next_cursor": id to pass back as `cursor`, or None on the last page}.
+        """
+        page_ids = self.history_product_ids(days=days, product_ids=product_ids, store=store,
+                                            after=cursor, limit=limit + 1)
+        next_cursor = page_ids[limit - 1] if len(page_ids) > limit else None
+        page_ids = page_ids[:limit]
+        if not page_ids:
+            return {"items": [], "next_cursor": None}
+        return {"items": self.get_history(days=days, product_ids=page_ids, store=store), "next_cursor": next_cursor}
@@ -0,0 +1,189 @@
+"""
+Write-behind fan-out for scrape results.
+
+Each sink (SQLite, CSV, Supabase, notifier) gets its own bounded queue and worker thread,
+so the scrape loop only pays for an in-memory enqueue and a slow or failing sink never
+delays the next product. Workers write in batches; close() drains every queue. A batch
+that keeps failing is retried record by record, and records that still fail are appended to
+the sink's dead-letter file instead of being discarded.
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger("dispatcher")
+
+_STOP = object()
+
+
+class SinkQueue:
+    """A bounded queue drained in batches by a dedicated worker thread."""
+
+    def __init__(self, name, write_batch, batch_size=25, max_wait=1.0, maxsize=1000,
+                 on_full="block", retries=0, dead_letter=None):
+        """
+        write_batch: callable receiving a list of items.
+        on_full: "block" waits for room (use for the source of truth), "drop" discards the item.
+        retries: extra attempts for a failing batch before it is split into single records.
+        dead_letter: JSONL file receiving records that fail even on their own (None: log only).
+        """
+        self.name = name
+        self.write_batch = write_batch
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.on_full = on_full
+        self.retries = retries
+        self.dead_letter = dead_letter
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._stats = {"enqueued": 0, "written": 0, "failed": 0, "dead_lettered": 0, "dropped": 0, "blocked": 0,
+                       "high_water": 0}
+        self._stats_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name=f"sink-{name}", daemon=True)
+        self._thread.start()
+
+    # ── Producer side ─────────────────────────────────────────
+    def put(self, item):
+        """Enqueues an item. Returns False if it was dropped because the queue is full."""
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            if self.on_full == "drop":
+                self._bump("dropped")
+                logger.warning(f"[{self.name}] queue full ({self._queue.maxsize}), dropping item")
+                return False
+            self._bump("blocked")
+            logger.warning(f"[{self.name}] queue full ({self._queue.maxsize}), waiting for the sink to catch up")
+            self._queue.put(item)
+        self._bump("enqueued")
+        with self._stats_lock:
+            self._stats["high_water"] = max(self._stats["high_water"], self._queue.qsize())
+        return True
+
+    def stats(self):
+        """Counters plus current depth; depth close to maxsize means the sink can't keep up."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["depth"] = self._queue.qsize()
+        stats["capacity"] = self._queue.maxsize
+        stats["backpressure"] = stats["depth"] / stats["capacity"] if stats["capacity"] else 0.0
+        return stats
+
+    def close(self, timeout=None):
+        """Flushes everything already queued, then stops the worker."""
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    # ── Worker side ───────────────────────────────────────────
+    def _bump(self, key, n=1):
+        with self._stats_lock:
+            self._stats[key] += n
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._write(batch)
+
+    def _write(self, batch):
+        for attempt in range(self.retries + 1):
+            try:
+                self.write_batch(batch)
+                self._bump("written", len(batch))
+                return
+            except Exception as e:
+                logger.error(f"[{self.name}] batch of {len(batch)} failed (attempt {attempt + 1}): {e}")
+                error = e
+                if attempt < self.retries:
+                    time.sleep(min(2 ** attempt, 10))
+
+        # One bad record shouldn't take the rest of the batch with it: write them one by one
+        rejected = [(batch[0], error)] if len(batch) == 1 else []
+        if len(batch) > 1:
+            for item in batch:
+                try:
+                    self.write_batch([item])
+                    self._bump("written")
+                except Exception as e:
+                    rejected.append((item, e))
+            logger.info(f"[{self.name}] wrote {len(batch) - len(rejected)}/{len(batch)} records one by one")
+        self._bump("failed", len(rejected))
+        self._dead_letter(rejected)
+
+    def _dead_letter(self, rejected):
+        if not rejected:
+            return
+        if not self.dead_letter:
+            logger.error(f"[{self.name}] discarding {len(rejected)} records that could not be written")
+            return
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.dead_letter)), exist_ok=True)
+            with open(self.dead_letter, "a", encoding="utf-8") as f:
+                for item, error in rejected:
+                    f.write(json.dumps({"ts": datetime.now().isoformat(), "sink": self.name,
+                                        "error": str(error), "record": item}, default=str) + "\n")
+            self._bump("dead_lettered", len(rejected))
+            logger.error(f"[{self.name}] {len(rejected)} records written to dead letter {self.dead_letter}")
+        except OSError as e:
+            logger.error(f"[{self.name}] could not dead-letter {len(rejected)} records: {e}")
+
+
+class StorageDispatcher:
+    """Routes each record to every registered sink."""
+
+    def __init__(self):
+        self._sinks = {}
+        self._closed = False
+        atexit.register(self.close)
+
+    def add_sink(self, name, write_batch, **options):
+        self._sinks[name] = SinkQueue(name, write_batch, **options)
+        return self._sinks[name]
+
+    def submit(self, record, sinks=None):
+        """Enqueues a record for all sinks (or only the named ones). Never does I/O itself."""
+        for name in (sinks or self._sinks):
+            if name in self._sinks:
+                self._sinks[name].put(record)
+
+    def stats(self):
+        return {name: sink.stats() for name, sink in self._sinks.items()}
+
+    def close(self, timeout=None):
+        """Drains the sinks in registration order, so sinks that feed later ones flush first."""
+        if self._closed:
+            return
+        self._closed = True
+        for sink in self._sinks.values():
+            sink.close(timeout)
+        for name, stats in self.stats().items():
+            logger.info(f"[{name}] written={stats['written']} failed={stats['failed']} "
+                        f"dead_lettered={stats['dead_lettered']} "
+                        f"dropped={stats['dropped']} blocked={stats['blocked']} high_water={stats['high_water']}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
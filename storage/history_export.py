@@ -0,0 +1,129 @@
+import csv
+import io
+
+class HistoryExport:
+    """
+    Streams price data out of SQLite as CSV or Parquet chunks, one cursor batch at a time.
+
+    Neither format is built in memory: CSV text is emitted per batch, and Parquet is written
+    one row group per batch into a sink that hands the bytes over as soon as they are produced
+    (the Parquet footer comes last, so no seeking is needed).
+    """
+
+    FORMATS = ("csv", "parquet")
+    MEDIA_TYPES = {"csv": "text/csv", "parquet": "application/vnd.apache.parquet"}
+
+    # Parquet column types; columns not listed are strings
+    FLOAT_COLUMNS = {"price", "unit_price", "quantity", "open_price", "close_price", "min_price", "max_price"}
+    INT_COLUMNS = {"id", "sample_count", "observations"}
+    TIMESTAMP_COLUMNS = {"timestamp", "first_ts", "last_ts", "valid_from", "valid_to", "last_seen"}
+    DATE_COLUMNS = {"date"}
+
+    def __init__(self, db, dataset="raw", fmt="csv", start=None, end=None, product_ids=None, store=None,
+                 batch_size=5000):
+        if fmt not in self.FORMATS:
+            raise ValueError(f"Unknown format '{fmt}', expected one of {self.FORMATS}")
+        self.db = db
+        self.dataset = dataset
+        self.fmt = fmt
+        self.filters = {"start": start, "end": end, "product_ids": product_ids, "store": store}
+        self.batch_size = batch_size
+
+    @property
+    def media_type(self):
+        return self.MEDIA_TYPES[self.fmt]
+
+    @property
+    def filename(self):
+        return f"price_{self.dataset}.{self.fmt}"
+
+    def _batches(self):
+        return self.db.iter_export(self.dataset, batch_size=self.batch_size, **self.filters)
+
+    def __iter__(self):
+        return self.iter_csv() if self.fmt == "csv" else self.iter_parquet()
+
+    # ── CSV ───────────────────────────────────────────────────
+    def iter_csv(self):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for index, (columns, rows) in enumerate(self._batches()):
+            if index == 0:
+                writer.writerow(columns)
+            writer.writerows(rows)
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+
+    # ── Parquet ───────────────────────────────────────────────
+    def _schema(self, columns):
+        import pyarrow as pa
+        fields = []
+        for name in columns:
+            if name in self.FLOAT_COLUMNS:
+                fields.append((name, pa.float64()))
+            elif name in self.INT_COLUMNS:
+                fields.append((name, pa.int64()))
+            elif name in self.TIMESTAMP_COLUMNS:
+                fields.append((name, pa.timestamp("us")))
+            elif name in self.DATE_COLUMNS:
+                fields.append((name, pa.date32()))
+            else:
+                fields.append((name, pa.string()))
+        return pa.schema(fields)
+
+    @staticmethod
+    def _column(values, field):
+        import pyarrow as pa
+        if pa.types.is_timestamp(field.type) or pa.types.is_date(field.type):
+            # ISO strings parse in the cast, vectorized
+            return pa.array(values, type=pa.string()).cast(field.type)
+        if pa.types.is_string(field.type):
+            values = [None if v is None else str(v) for v in values]
+        return pa.array(values, type=field.type)
+
+    def iter_parquet(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        sink = _ChunkSink()
+        writer = None
+        for columns, rows in self._batches():
+            if writer is None:
+                schema = self._schema(columns)
+                writer = pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema, compression="zstd")
+            if not rows:
+                continue
+            values = list(zip(*rows))
+            table = pa.Table.from_arrays([self._column(list(values[i]), field) for i, field in enumerate(schema)],
+                                         schema=schema)
+            # One row group per batch; its bytes go out right away
+            writer.write_table(table)
+            yield sink.take()
+        writer.close()
+        yield sink.take()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that collects what the Parquet writer produces until take() is called."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def take(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
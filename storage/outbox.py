@@ -0,0 +1,250 @@
+"""
+Durable outbox for warehouse (Supabase) uploads.
+
+Every record bound for the warehouse is first written to the sync_outbox table in the local
+SQLite DB, which is cheap and never depends on the network. A background OutboxDrainer ships
+due rows in batches and deletes them once inserted. Failed batches are retried with exponential
+backoff. Because the queue lives in history.db, rows left over from a crash or an offline run
+are picked up by the next drainer (or by `main.py --sync`).
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger("outbox")
+
+
+class UploadOutbox:
+    """The sync_outbox table: pending uploads, their retry schedule, and parked (unmapped) rows."""
+
+    def __init__(self, db_path, base_backoff=5, max_backoff=900):
+        self.db_path = db_path
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._init_db()
+
+    def _init_db(self):
+        with sqlite3.connect(self.db_path) as conn:
+            # status: 'pending' (shipped when next_attempt_at is due) or 'unmapped' (parked until
+            # aliases are seeded; see requeue_unmapped)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sync_outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    enqueued_at TEXT NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_due ON sync_outbox (status, next_attempt_at)")
+
+    def enqueue(self, records):
+        """Adds records (dicts) to the outbox in one transaction."""
+        now = datetime.now().isoformat()
+        with sqlite3.connect(self.db_path) as conn:
+            conn.executemany(
+                "INSERT INTO sync_outbox (payload, enqueued_at) VALUES (?, ?)",
+                [(json.dumps(r, default=str), now) for r in records]
+            )
+
+    def due(self, limit=200, lease=120):
+        """
+        Claims up to `limit` pending rows whose retry time has come, oldest first, as (id, record).
+        Claimed rows are hidden from other drainers (the UI and a scan may both run one) for
+        `lease` seconds; ack() or retry_later() settles them before that.
+        """
+        now = time.time()
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute("""
+                SELECT id, payload FROM sync_outbox
+                WHERE status = 'pending' AND next_attempt_at <= ?
+                ORDER BY id LIMIT ?
+            """, (now, limit)).fetchall()
+            conn.executemany("UPDATE sync_outbox SET next_attempt_at = ? WHERE id = ?",
+                             [(now + lease, row_id) for row_id, _ in rows])
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return [(row_id, json.loads(payload)) for row_id, payload in rows]
+
+    def ack(self, ids):
+        """Removes rows that reached the warehouse."""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.executemany("DELETE FROM sync_outbox WHERE id = ?", [(i,) for i in ids])
+
+    def retry_later(self, ids, error):
+        """Schedules rows for another attempt, backing off exponentially per row."""
+        now = time.time()
+        with sqlite3.connect(self.db_path) as conn:
+            conn.executemany("""
+                UPDATE sync_outbox
+                SET attempts = attempts + 1,
+                    next_attempt_at = ? + MIN(?, ? * (1 << MIN(attempts, 20))),
+                    last_error = ?
+                WHERE id = ?
+            """, [(now, self.max_backoff, self.base_backoff, str(error)[:500], i) for i in ids])
+
+    def park(self, ids, reason):
+        """Sets aside rows the warehouse can't map yet (no alias), so they don't block the queue."""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.executemany(
+                "UPDATE sync_outbox SET status = 'unmapped', last_error = ? WHERE id = ?",
+                [(str(reason)[:500], i) for i in ids]
+            )
+
+    def requeue_unmapped(self):
+        """Moves parked rows back to pending (e.g. after seed_aliases.py). Returns how many."""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.execute("""
+                UPDATE sync_outbox SET status = 'pending', attempts = 0, next_attempt_at = 0
+                WHERE status = 'unmapped'
+            """)
+            return cursor.rowcount
+
+    def stats(self):
+        with sqlite3.connect(self.db_path) as conn:
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM sync_outbox GROUP BY status").fetchall())
+            oldest = conn.execute(
+                "SELECT MIN(enqueued_at) FROM sync_outbox WHERE status = 'pending'"
+            ).fetchone()[0]
+        return {"pending": counts.get("pending", 0), "unmapped": counts.get("unmapped", 0),
+                "oldest_pending": oldest}
+
+
+class OutboxDrainer:
+    """Background thread that ships outbox rows to the warehouse in batches."""
+
+    def __init__(self, outbox, sb_factory, batch_size=200, poll_interval=5.0, max_backoff=300,
+                 requeue_every=900):
+        """
+        sb_factory: callable returning a SupabaseManager; called lazily and again after failures,
+        so the drainer keeps working when the warehouse was unreachable at startup.
+        requeue_every: seconds between retries of parked (unmapped) rows in background mode, so a
+        long-lived drainer picks up aliases seeded after it started.
+        """
+        self.outbox = outbox
+        self.sb_factory = sb_factory
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_backoff = max_backoff
+        self.requeue_every = requeue_every
+        self._sb = None
+        self._failures = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _manager(self):
+        if self._sb is None:
+            self._sb = self.sb_factory()
+        if not self._sb.VENDOR_MAP:
+            # Vendor ids failed to load (offline at startup); without them every row looks unmapped
+            self._sb._load_vendor_map()
+            if not self._sb.VENDOR_MAP:
+                raise ConnectionError("warehouse vendor map unavailable")
+        return self._sb
+
+    def drain_once(self):
+        """Ships one batch of due rows and returns a summary dict. Warehouse errors are absorbed."""
+        batch = self.outbox.due(self.batch_size)
+        summary = {"sent": len(batch), "inserted": 0, "unmapped": 0, "failed": 0}
+        if not batch:
+            return summary
+
+        ids = [row_id for row_id, _ in batch]
+        try:
+            outcomes = self._manager().insert_market_prices([record for _, record in batch])
+        except Exception as e:
+            logger.warning(f"Warehouse unavailable, {len(ids)} rows stay queued: {e}")
+            self.outbox.retry_later(ids, e)
+            self._failures += 1
+            summary["failed"] = len(ids)
+            return summary
+
+        done, failed, unmapped = [], {}, {}
+        for row_id, outcome in zip(ids, outcomes):
+            if outcome["status"] == "inserted":
+                done.append(row_id)
+            elif outcome["status"] == "skipped":
+                unmapped.setdefault(outcome["reason"], []).append(row_id)
+            else:
+                failed.setdefault(outcome["reason"], []).append(row_id)
+        self.outbox.ack(done)
+        for reason, row_ids in unmapped.items():
+            self.outbox.park(row_ids, reason)
+        for reason, row_ids in failed.items():
+            self.outbox.retry_later(row_ids, reason)
+
+        self._failures = self._failures + 1 if failed and not done else 0
+        summary.update(inserted=len(done), unmapped=sum(map(len, unmapped.values())),
+                       failed=sum(map(len, failed.values())))
+        return summary
+
+    def requeue_unmapped(self):
+        """Gives parked rows another chance with fresh alias lookups. Returns how many were requeued."""
+        requeued = self.outbox.requeue_unmapped()
+        if requeued and self._sb is not None:
+            self._sb.invalidate_caches()
+        return requeued
+
+    def drain(self):
+        """Ships batches until nothing is due. Returns the combined summary (used by --sync)."""
+        total = {"sent": 0, "inserted": 0, "unmapped": 0, "failed": 0}
+        while True:
+            summary = self.drain_once()
+            for key in total:
+                total[key] += summary[key]
+            # Stop on an empty queue, or when a whole batch failed (the rest would fail the same way)
+            if not summary["sent"] or summary["failed"] == summary["sent"]:
+                return total
+
+    # ── Background mode ───────────────────────────────────────
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="outbox-drainer", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        last_requeue = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                if time.monotonic() - last_requeue >= self.requeue_every:
+                    last_requeue = time.monotonic()
+                    requeued = self.requeue_unmapped()
+                    if requeued:
+                        logger.info(f"Retrying {requeued} unmapped rows")
+                summary = self.drain_once()
+            except sqlite3.Error as e:
+                logger.error(f"Could not read the outbox: {e}")
+                summary = {"sent": 0}
+                self._failures += 1
+            if self._failures:
+                wait = min(self.poll_interval * 2 ** self._failures, self.max_backoff)
+            elif summary["sent"] == self.batch_size:
+                wait = 0  # more is probably waiting
+            else:
+                wait = self.poll_interval
+            self._stop.wait(wait)
+
+    def stop(self, flush=False, timeout=30):
+        """Stops the thread, optionally draining once more; rows still queued are kept for the next run."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        if flush:
+            self.drain()
+        if self._sb is not None:
+            self._sb.close()
@@ -0,0 +1,209 @@
+import json
+import os
+import logging
+from datetime import datetime, date, timedelta
+
+logger = logging.getLogger("parquet_exporter")
+
+class ParquetExporter:
+    """
+    Exports price_history as Parquet files partitioned by store and month.
+
+    Layout (Hive-style, so pyarrow.dataset / DuckDB / pandas can prune partitions):
+        <out_dir>/store=nofrills/month=2026-02/part-0000000001-0000000722.parquet
+
+    Each run only exports rows added since the last export (tracked by row id in
+    <out_dir>/_export_state.json) and writes them as new part files.
+
+    In spells storage mode there are no raw rows to export: the expanded daily series is
+    written instead (one row per product-day), only for completed days, tracked by date.
+    It has its own schema, so it goes to a separate dataset root that can be read on its own:
+        <out_dir>/daily/store=nofrills/month=2026-02/part-daily-2026-02-01-2026-02-28.parquet
+    """
+
+    STATE_FILE = "_export_state.json"
+    DAILY_DIR = "daily"
+
+    def __init__(self, db, out_dir="/Users/carlosborda/Documents/Python/Learning/scraping/data/parquet", chunk_size=50000):
+        self.db = db
+        self.out_dir = out_dir
+        self.chunk_size = chunk_size
+        self.state_path = os.path.join(out_dir, self.STATE_FILE)
+
+    # ── State ─────────────────────────────────────────────────
+    def _load_state(self):
+        if not os.path.exists(self.state_path):
+            return {"last_id": 0}
+        with open(self.state_path, "r") as f:
+            return json.load(f)
+
+    def _save_state(self, state):
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f, indent=4)
+        os.replace(tmp_path, self.state_path)
+
+    # ── Schema ────────────────────────────────────────────────
+    @staticmethod
+    def _schema():
+        import pyarrow as pa
+        # store and month live in the partition path, not in the files
+        return pa.schema([
+            ("id", pa.int64()),
+            ("product_id", pa.dictionary(pa.int32(), pa.string())),
+            ("product_name", pa.string()),
+            ("price", pa.float64()),
+            ("unit_price", pa.float64()),
+            ("currency", pa.dictionary(pa.int8(), pa.string())),
+            ("stock", pa.string()),
+            ("unit", pa.dictionary(pa.int8(), pa.string())),
+            ("quantity", pa.float64()),
+            ("standard_unit", pa.dictionary(pa.int8(), pa.string())),
+            ("timestamp", pa.timestamp("us")),
+            ("url", pa.string()),
+        ])
+
+    @staticmethod
+    def _daily_schema():
+        import pyarrow as pa
+        return pa.schema([
+            ("product_id", pa.dictionary(pa.int32(), pa.string())),
+            ("date", pa.date32()),
+            ("product_name", pa.string()),
+            ("standard_unit", pa.dictionary(pa.int8(), pa.string())),
+            ("open_price", pa.float64()),
+            ("close_price", pa.float64()),
+            ("min_price", pa.float64()),
+            ("max_price", pa.float64()),
+        ])
+
+    @staticmethod
+    def _parse_ts(value):
+        try:
+            return datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            return None
+
+    # ── Export ────────────────────────────────────────────────
+    def _write_partition(self, schema, store, month, rows):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        part_dir = os.path.join(self.out_dir, f"store={store}", f"month={month}")
+        os.makedirs(part_dir, exist_ok=True)
+        file_name = f"part-{rows[0]['id']:010d}-{rows[-1]['id']:010d}.parquet"
+
+        columns = {}
+        for field in schema:
+            if field.name == "timestamp":
+                columns[field.name] = [self._parse_ts(r["timestamp"]) for r in rows]
+            elif field.name == "stock":
+                columns[field.name] = [None if r["stock"] is None else str(r["stock"]) for r in rows]
+            else:
+                columns[field.name] = [r[field.name] for r in rows]
+
+        table = pa.Table.from_pydict(columns, schema=schema)
+        tmp_path = os.path.join(part_dir, file_name + ".tmp")
+        pq.write_table(table, tmp_path, compression="zstd")
+        os.replace(tmp_path, os.path.join(part_dir, file_name))
+
+    def _flush(self, schema, chunk):
+        partitions = {}
+        for row in chunk:
+            month = (row["timestamp"] or "")[:7] or "unknown"
+            partitions.setdefault((row["store"], month), []).append(row)
+        for (store, month), rows in partitions.items():
+            self._write_partition(schema, store, month, rows)
+
+    def export(self, full=False):
+        """
+        Writes new price_history rows to the partitioned dataset.
+        With full=True, existing part files are removed and everything is re-exported.
+        Returns a summary dict.
+        """
+        os.makedirs(self.out_dir, exist_ok=True)
+        if full:
+            self._remove_parts()
+            state = {"last_id": 0}
+        else:
+            state = self._load_state()
+
+        if self.db.storage_mode == "spells":
+            return self._export_daily(state)
+
+        schema = self._schema()
+        exported = 0
+        chunk = []
+        for row in self.db.iter_history(since_id=state["last_id"]):
+            chunk.append(row)
+            if len(chunk) >= self.chunk_size:
+                self._flush(schema, chunk)
+                exported += len(chunk)
+                state = {"last_id": chunk[-1]["id"], "exported_at": datetime.now().isoformat()}
+                self._save_state(state)
+                chunk = []
+
+        if chunk:
+            self._flush(schema, chunk)
+            exported += len(chunk)
+            state = {"last_id": chunk[-1]["id"], "exported_at": datetime.now().isoformat()}
+            self._save_state(state)
+
+        logger.info(f"Exported {exported} rows to {self.out_dir} (last_id={state['last_id']})")
+        return {"exported": exported, "last_id": state["last_id"], "out_dir": self.out_dir}
+
+    def _export_daily(self, state):
+        """Spells mode: writes completed product-days after state["last_date"]."""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._relocate_daily_parts()
+        schema = self._daily_schema()
+        last_date = state.get("last_date")
+        start = (date.fromisoformat(last_date) + timedelta(days=1)).isoformat() if last_date else None
+        end = (date.today() - timedelta(days=1)).isoformat()
+        rows = self.db.get_daily(start=start, end=end) if not start or start <= end else []
+
+        daily_root = os.path.join(self.out_dir, self.DAILY_DIR)
+        partitions = {}
+        for row in rows:
+            partitions.setdefault((row["store"], row["date"][:7]), []).append(row)
+        for (store, month), part_rows in partitions.items():
+            part_dir = os.path.join(daily_root, f"store={store}", f"month={month}")
+            os.makedirs(part_dir, exist_ok=True)
+            dates = sorted(r["date"] for r in part_rows)
+            file_name = f"part-daily-{dates[0]}-{dates[-1]}.parquet"
+            columns = {f.name: [r[f.name] for r in part_rows] for f in schema if f.name != "date"}
+            columns["date"] = [date.fromisoformat(r["date"]) for r in part_rows]
+            table = pa.Table.from_pydict(columns, schema=schema)
+            tmp_path = os.path.join(part_dir, file_name + ".tmp")
+            pq.write_table(table, tmp_path, compression="zstd")
+            os.replace(tmp_path, os.path.join(part_dir, file_name))
+
+        if rows:
+            state = {"last_id": state.get("last_id", 0), "last_date": max(r["date"] for r in rows),
+                     "exported_at": datetime.now().isoformat()}
+            self._save_state(state)
+        logger.info(f"Exported {len(rows)} daily rows to {daily_root} (last_date={state.get('last_date')})")
+        return {"exported": len(rows), "last_id": state.get("last_id", 0), "out_dir": daily_root}
+
+    def _relocate_daily_parts(self):
+        """Moves daily part files earlier versions wrote into the raw partitions to the daily root."""
+        daily_root = os.path.join(self.out_dir, self.DAILY_DIR)
+        for root, dirs, files in os.walk(self.out_dir):
+            if root == self.out_dir and self.DAILY_DIR in dirs:
+                dirs.remove(self.DAILY_DIR)
+            for name in files:
+                if name.startswith("part-daily-") and name.endswith(".parquet"):
+                    target_dir = os.path.join(daily_root, os.path.relpath(root, self.out_dir))
+                    os.makedirs(target_dir, exist_ok=True)
+                    os.replace(os.path.join(root, name), os.path.join(target_dir, name))
+                    logger.info(f"Moved {name} to {target_dir}")
+
+    def _remove_parts(self):
+        for root, _, files in os.walk(self.out_dir):
+            for name in files:
+                if name.startswith("part-") and name.endswith(".parquet"):
+                    os.remove(os.path.join(root, name))
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
@@ -0,0 +1,301 @@
+import copy
+import fnmatch
+import json
+import os
+import re
+import tempfile
+import threading
+from contextlib import contextmanager
+
+class ProductCatalog:
+    """
+    config/products.json loaded once and indexed by id, URL, store and PDP code.
+
+    The file is re-read only when its mtime/size change (e.g. edited by hand or by another
+    process). Writes go through a temp file + rename, so readers never see a half-written
+    file, and are serialized by a lock, so concurrent UI edits can't lose each other's changes.
+    Readers get copies; edit the catalog through the methods below.
+    """
+
+    # Product pages end in /p/<code> on all supported banners (e.g. .../p/20654124_KG)
+    PDP_CODE_PATTERN = re.compile(r"/p/([^/?#]+)")
+
+    def __init__(self, path="/Users/carlosborda/Documents/Python/Learning/scraping/config/products.json"):
+        self.path = path
+        self._lock = threading.RLock()
+        self._signature = None
+        self._products = []
+        self._by_id = {}
+        self._by_url = {}
+        self._by_store = {}
+        self._by_code = {}
+
+    @classmethod
+    def pdp_code(cls, url):
+        match = cls.PDP_CODE_PATTERN.search(url or "")
+        return match.group(1) if match else None
+
+    # ── Loading ───────────────────────────────────────────────
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _refresh(self):
+        signature = self._stat()
+        if signature == self._signature:
+            return
+        products = []
+        if signature is not None:
+            with open(self.path, "r") as f:
+                products = json.load(f)
+        self._index(products)
+        self._signature = signature
+
+    def _index(self, products):
+        self._products = products
+        self._by_id = {p.get("id"): p for p in products}
+        self._by_url = {p["url"]: p for p in products if p.get("url")}
+        self._by_store = {}
+        self._by_code = {}
+        for p in products:
+            self._by_store.setdefault(p.get("store"), []).append(p)
+            code = self.pdp_code(p.get("url"))
+            if code:
+                self._by_code[code] = p
+
+    # ── Reading ───────────────────────────────────────────────
+    def all(self, active_only=False, stores=None):
+        """All products in file order, optionally only active ones and/or only some stores."""
+        with self._lock:
+            self._refresh()
+            return [
+                copy.deepcopy(p) for p in self._products
+                if (not active_only or p.get("active", True)) and (stores is None or p.get("store") in stores)
+            ]
+
+    def get(self, product_id):
+        with self._lock:
+            self._refresh()
+            p = self._by_id.get(product_id)
+            return copy.deepcopy(p) if p else None
+
+    def by_url(self, url):
+        with self._lock:
+            self._refresh()
+            p = self._by_url.get(url)
+            return copy.deepcopy(p) if p else None
+
+    def by_code(self, code):
+        with self._lock:
+            self._refresh()
+            p = self._by_code.get(code)
+            return copy.deepcopy(p) if p else None
+
+    def by_store(self, store):
+        with self._lock:
+            self._refresh()
+            return copy.deepcopy(self._by_store.get(store, []))
+
+    def active_ids(self):
+        with self._lock:
+            self._refresh()
+            return {p.get("id") for p in self._products if p.get("active", True)}
+
+    def version(self):
+        """Changes whenever products.json does; lets callers key caches on the catalog contents."""
+        with self._lock:
+            self._refresh()
+            return self._signature
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return len(self._products)
+
+    # ── Writing ───────────────────────────────────────────────
+    def _save(self, products):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix=".products-", suffix=".json.tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(products, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._index(products)
+        self._signature = self._stat()
+
+    @contextmanager
+    def edit(self):
+        """
+        Yields a working copy of the product list; it is written back (atomically, once)
+        when the block exits without an exception.
+        """
+        with self._lock:
+            self._refresh()
+            products = copy.deepcopy(self._products)
+            yield products
+            self._save(products)
+
+    def add(self, product: dict):
+        """Appends a product. Raises ValueError if the id is taken."""
+        with self.edit() as products:
+            if any(p.get("id") == product["id"] for p in products):
+                raise ValueError("Product ID already exists")
+            products.append(dict(product))
+        return copy.deepcopy(product)
+
+    def update(self, product_id, updates: dict, remove=()):
+        """Applies field updates (and removes the `remove` fields). Raises KeyError if not found."""
+        with self.edit() as products:
+            for p in products:
+                if p.get("id") == product_id:
+                    p.update(updates)
+                    for field in remove:
+                        p.pop(field, None)
+                    return copy.deepcopy(p)
+            raise KeyError(product_id)
+
+    def delete(self, product_id):
+        """Removes a product. Raises KeyError if not found."""
+        with self.edit() as products:
+            remaining = [p for p in products if p.get("id") != product_id]
+            if len(remaining) == len(products):
+                raise KeyError(product_id)
+            products[:] = remaining
+
+    # ── Bulk edits ────────────────────────────────────────────
+    # Each applies a whole batch to one working copy and writes products.json once (or not at all
+    # if nothing changed / dry_run). They return the diff of what the batch did.
+    REQUIRED_FIELDS = ("id", "name", "store", "url")
+
+    @staticmethod
+    def diff(before, after):
+        """Added and removed ids plus {id: {field: [old, new]}} for products present in both."""
+        old = {p.get("id"): p for p in before}
+        new = {p.get("id"): p for p in after}
+        updated = {}
+        for product_id in old.keys() & new.keys():
+            a, b = old[product_id], new[product_id]
+            fields = {f: [a.get(f), b.get(f)] for f in sorted(a.keys() | b.keys()) if a.get(f) != b.get(f)}
+            if fields:
+                updated[product_id] = fields
+        return {
+            "added": [i for i in new if i not in old],
+            "removed": [i for i in old if i not in new],
+            "updated": dict(sorted(updated.items())),
+            "unchanged": len(old.keys() & new.keys()) - len(updated),
+        }
+
+    def _bulk(self, mutate, dry_run=False):
+        with self._lock:
+            self._refresh()
+            products = copy.deepcopy(self._products)
+            mutate(products)
+            diff = self.diff(self._products, products)
+            changed = bool(diff["added"] or diff["removed"] or diff["updated"])
+            if changed and not dry_run:
+                self._save(products)
+            diff["written"] = changed and not dry_run
+            return diff
+
+    def set_active(self, active: bool, ids=None, stores=None, pattern=None, dry_run=False):
+        """
+        Activates or pauses every product matching all the given filters: ids, stores, and a
+        case-insensitive glob `pattern` (e.g. "*milk*") matched against id and name.
+        Raises ValueError if no filter is given.
+        """
+        if ids is None and stores is None and not pattern:
+            raise ValueError("Give ids, stores or a pattern to select products")
+        ids = set(ids) if ids is not None else None
+        pattern = pattern.lower() if pattern else None
+
+        def selected(p):
+            return ((ids is None or p.get("id") in ids)
+                    and (stores is None or p.get("store") in stores)
+                    and (pattern is None or fnmatch.fnmatchcase(str(p.get("id", "")).lower(), pattern)
+                         or fnmatch.fnmatchcase(str(p.get("name", "")).lower(), pattern)))
+
+        def mutate(products):
+            for p in products:
+                if selected(p):
+                    p["active"] = active
+        return self._bulk(mutate, dry_run)
+
+    def import_products(self, rows, mode="upsert", dry_run=False):
+        """
+        Adds the products in `rows` (dicts) and, in "upsert" mode, updates existing ones with the
+        fields a row gives ("add" mode rejects existing ids). New products need id, name, store
+        and url; a URL may belong to one product only. Nothing is written if any row is invalid:
+        raises ValueError listing the problems.
+        """
+        if mode not in ("upsert", "add"):
+            raise ValueError(f"Unknown import mode '{mode}', expected 'upsert' or 'add'")
+
+        def mutate(products):
+            by_id = {p.get("id"): p for p in products}
+            url_owner = {p["url"]: p.get("id") for p in products if p.get("url")}
+            seen, errors = set(), []
+            for line, row in enumerate(rows, 1):
+                product_id = row.get("id")
+                if not product_id:
+                    errors.append(f"row {line}: missing id")
+                    continue
+                if product_id in seen:
+                    errors.append(f"row {line}: duplicate id '{product_id}'")
+                    continue
+                seen.add(product_id)
+                existing = by_id.get(product_id)
+                if existing is not None and mode == "add":
+                    errors.append(f"row {line}: product '{product_id}' already exists")
+                    continue
+                if existing is None:
+                    missing = [f for f in self.REQUIRED_FIELDS if not row.get(f)]
+                    if missing:
+                        errors.append(f"row {line}: new product '{product_id}' needs {', '.join(missing)}")
+                        continue
+                url = row.get("url")
+                if url and url_owner.get(url, product_id) != product_id:
+                    errors.append(f"row {line}: URL already used by '{url_owner[url]}'")
+                    continue
+                if existing is None:
+                    existing = by_id[product_id] = dict(row)
+                    products.append(existing)
+                else:
+                    if existing.get("url") and url:
+                        url_owner.pop(existing["url"], None)
+                    existing.update(row)
+                if url:
+                    url_owner[url] = product_id
+            if errors:
+                shown = errors[:20] + ([f"... and {len(errors) - 20} more"] if len(errors) > 20 else [])
+                raise ValueError("; ".join(shown))
+        return self._bulk(mutate, dry_run)
+
+    def set_pack_sizes(self, pack_sizes: dict, dry_run=False):
+        """
+        Sets pack_size per product id ({id: size}); None removes it. Raises KeyError listing
+        unknown ids and ValueError for sizes that aren't positive, before anything is written.
+        """
+        bad = [product_id for product_id, size in pack_sizes.items() if size is not None and not size > 0]
+        if bad:
+            raise ValueError(f"pack_size must be positive: {', '.join(bad)}")
+
+        def mutate(products):
+            by_id = {p.get("id"): p for p in products}
+            unknown = [product_id for product_id in pack_sizes if product_id not in by_id]
+            if unknown:
+                raise KeyError(", ".join(unknown))
+            for product_id, size in pack_sizes.items():
+                if size is None:
+                    by_id[product_id].pop("pack_size", None)
+                else:
+                    by_id[product_id]["pack_size"] = size
+        return self._bulk(mutate, dry_run)
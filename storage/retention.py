@@ -0,0 +1,136 @@
+import csv
+import gzip
+import os
+import sqlite3
+import logging
+
+from storage.db_manager import PRUNED_BEFORE_KEY
+
+logger = logging.getLogger("retention")
+
+ARCHIVE_COLUMNS = [
+    "id", "product_id", "store", "product_name", "price", "currency", "stock",
+    "unit", "quantity", "unit_price", "standard_unit", "timestamp", "url"
+]
+
+class RetentionManager:
+    """
+    Keeps price_history small:
+      - rows older than `collapse_after_days` are collapsed to the latest row per product per day
+      - rows older than `archive_after_days` are removed from the live DB entirely
+    Every removed row is first appended to a gzip CSV side file per month in `archive_dir`,
+    then the DB is vacuumed. The price_daily rollup is never touched, so daily series survive;
+    the collapse horizon is recorded in db_meta so rebuild_daily() leaves those days alone.
+    """
+
+    def __init__(self, db, archive_dir="/Users/carlosborda/Documents/Python/Learning/scraping/data/archive",
+                 collapse_after_days=14, archive_after_days=365):
+        self.db = db
+        self.archive_dir = archive_dir
+        self.collapse_after_days = collapse_after_days
+        self.archive_after_days = archive_after_days
+
+    @classmethod
+    def from_settings(cls, db, settings: dict, base_dir: str):
+        """Builds a manager from the "retention" section of settings.json."""
+        cfg = settings.get("retention", {})
+        archive_dir = cfg.get("archive_dir", "data/archive")
+        if not os.path.isabs(archive_dir):
+            archive_dir = os.path.join(base_dir, archive_dir)
+        return cls(
+            db,
+            archive_dir=archive_dir,
+            collapse_after_days=cfg.get("collapse_after_days", 14),
+            archive_after_days=cfg.get("archive_after_days", 365),
+        )
+
+    def _select_expired(self, conn):
+        """Fills temp table retention_ids with the ids this run will remove."""
+        conn.execute("DROP TABLE IF EXISTS temp.retention_ids")
+        conn.execute("CREATE TEMP TABLE retention_ids (id INTEGER PRIMARY KEY)")
+        # Intraday duplicates past the collapse horizon (keep the last scrape of each day)
+        conn.execute("""
+            INSERT INTO retention_ids (id)
+            SELECT id FROM (
+                SELECT id, ROW_NUMBER() OVER (
+                    PARTITION BY product_id, DATE(timestamp)
+                    ORDER BY timestamp DESC, id DESC
+                ) AS rn
+                FROM price_history
+                WHERE DATE(timestamp) < date('now', ?)
+            )
+            WHERE rn > 1
+        """, (f"-{int(self.collapse_after_days)} days",))
+        # Everything past the archive horizon
+        if self.archive_after_days:
+            conn.execute("""
+                INSERT OR IGNORE INTO retention_ids (id)
+                SELECT id FROM price_history
+                WHERE DATE(timestamp) < date('now', ?)
+            """, (f"-{int(self.archive_after_days)} days",))
+        return conn.execute("SELECT COUNT(*) FROM retention_ids").fetchone()[0]
+
+    def _archive(self, conn):
+        """Appends the selected rows to <archive_dir>/price_history_<YYYY-MM>.csv.gz."""
+        os.makedirs(self.archive_dir, exist_ok=True)
+        cursor = conn.execute(f"""
+            SELECT {', '.join('h.' + c for c in ARCHIVE_COLUMNS)}
+            FROM price_history h
+            JOIN retention_ids r ON r.id = h.id
+            ORDER BY h.timestamp, h.id
+        """)
+        handles = {}
+        try:
+            for row in cursor:
+                month = (row[11] or "unknown")[:7]
+                if month not in handles:
+                    path = os.path.join(self.archive_dir, f"price_history_{month}.csv.gz")
+                    is_new = not os.path.exists(path)
+                    # Append mode adds a new gzip member; gzip readers see one continuous file
+                    f = gzip.open(path, "at", newline="", encoding="utf-8")
+                    writer = csv.writer(f)
+                    if is_new:
+                        writer.writerow(ARCHIVE_COLUMNS)
+                    handles[month] = (f, writer)
+                handles[month][1].writerow(row)
+        finally:
+            for f, _ in handles.values():
+                f.close()
+        return sorted(handles)
+
+    def run(self, dry_run=False):
+        """Applies the policy and returns a summary dict."""
+        size_before = os.path.getsize(self.db.db_path)
+        conn = sqlite3.connect(self.db.db_path)
+        try:
+            expired = self._select_expired(conn)
+            if dry_run or not expired:
+                conn.rollback()
+                return {"expired": expired, "removed": 0, "archived_months": [],
+                        "dry_run": dry_run, "bytes_before": size_before, "bytes_after": size_before}
+
+            # Archive first: if the delete fails we may hold a duplicate in the archive, never a loss
+            months = self._archive(conn)
+            conn.execute("DELETE FROM price_fact WHERE id IN (SELECT id FROM retention_ids)")
+            # Days before the horizon now hold at most one raw row: the rollup is their only full record
+            conn.execute("""
+                INSERT INTO db_meta (key, value) VALUES (?, date('now', ?))
+                ON CONFLICT(key) DO UPDATE SET value = MAX(value, excluded.value)
+            """, (PRUNED_BEFORE_KEY, f"-{int(self.collapse_after_days)} days"))
+            conn.commit()
+        finally:
+            conn.close()
+
+        # Reclaim space and refresh planner stats outside the transaction
+        conn = sqlite3.connect(self.db.db_path)
+        try:
+            conn.execute("VACUUM")
+            conn.execute("ANALYZE")
+        finally:
+            conn.close()
+
+        size_after = os.path.getsize(self.db.db_path)
+        logger.info(f"Retention removed {expired} rows (archived months: {months}); "
+                    f"DB size {size_before} -> {size_after} bytes")
+        return {"expired": expired, "removed": expired, "archived_months": months, "dry_run": False,
+                "bytes_before": size_before, "bytes_after": size_after}
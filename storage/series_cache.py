@@ -0,0 +1,75 @@
+import threading
+from datetime import date
+
+import numpy as np
+
+class DailySeriesCache:
+    """
+    Daily close prices of every product as one dense NumPy matrix (rows: days, columns:
+    products, NaN: no price that day), rebuilt only when the database's write_seq moves.
+
+    /api/series slices and downsamples this matrix, so long-range charts don't re-read
+    hundreds of thousands of rollup rows on every request, only once per scrape.
+    """
+
+    EPOCH = date(1970, 1, 1)
+
+    def __init__(self, db):
+        self.db = db
+        self._lock = threading.Lock()
+        self._version = None
+        self._ids = np.array([], dtype=object)
+        self._columns = {}
+        self._first_day = 0
+        self._matrix = np.empty((0, 0))
+
+    def _build(self):
+        rows = self.db.daily_points()
+        columns = {}
+        column_of = [columns.setdefault(p_id, len(columns)) for p_id, _, _ in rows]
+        days = np.fromiter((day for _, day, _ in rows), dtype=np.int64, count=len(rows))
+        prices = np.fromiter((price for _, _, price in rows), dtype=np.float64, count=len(rows))
+        first_day = int(days.min()) if len(rows) else 0
+        matrix = np.full(((int(days.max()) - first_day + 1) if len(rows) else 0, len(columns)), np.nan)
+        matrix[days - first_day, column_of] = prices
+        self._ids = np.array(list(columns), dtype=object)
+        self._columns = columns
+        self._first_day = first_day
+        self._matrix = matrix
+
+    def _refresh(self):
+        version = self.db.write_seq()
+        if version != self._version:
+            self._build()
+            self._version = version
+
+    def _day(self, iso):
+        return (date.fromisoformat(iso) - self.EPOCH).days
+
+    def select(self, start=None, end=None, product_ids=None):
+        """
+        (ids, days, matrix) for the products in product_ids (all if None) between the ISO dates
+        start and end (inclusive, either optional). days are days since 1970-01-01; products
+        without any price in the range are left out. The matrix is a copy.
+        """
+        with self._lock:
+            self._refresh()
+            n_days = self._matrix.shape[0]
+            lo = 0 if not start else min(max(self._day(start) - self._first_day, 0), n_days)
+            hi = n_days if not end else min(max(self._day(end) - self._first_day + 1, lo), n_days)
+            if product_ids is None:
+                cols = np.arange(len(self._ids))
+            else:
+                cols = np.array(sorted(self._columns[p] for p in set(product_ids) if p in self._columns), dtype=np.int64)
+            matrix = self._matrix[lo:hi][:, cols]
+            ids = self._ids[cols]
+            days = np.arange(self._first_day + lo, self._first_day + hi)
+
+        # Drop empty products, then trim days before the first / after the last price
+        present = ~np.isnan(matrix)
+        has_data = present.any(axis=0)
+        matrix, ids, present = matrix[:, has_data], ids[has_data], present[:, has_data]
+        rows = np.flatnonzero(present.any(axis=1))
+        if not len(rows):
+            return ids[:0], days[:0], matrix[:0, :0]
+        return ids, days[rows[0]:rows[-1] + 1], matrix[rows[0]:rows[-1] + 1]
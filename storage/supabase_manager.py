@@ -2,14 +2,19 @@
 Supabase PostgreSQL Manager for Price Tracker.
 Handles connections, alias lookups, and fact insertions 
 into the capstone schema on Supabase.
+
+With WAREHOUSE_BACKEND=sqlite the same operations run against an embedded
+copy of the schema instead (see storage/warehouse.py).
 """
 
-import psycopg2
-from psycopg2.extras import RealDictCursor
 from dotenv import load_dotenv
 from datetime import date, datetime
-import os
+import threading
 import logging
+import time
+
+from storage.warehouse import (SCRAPER_SOURCE_FILTER, SCRAPER_SOURCE_IDS, UNIQUE_KEYS, warehouse_backend_from_env,
+                               warehouse_configured)
 
 logger = logging.getLogger("supabase_manager")
 
@@ -36,21 +41,57 @@ class SupabaseManager:
 
     GEO_ID_BURLINGTON = 4  # Burlington, ON
 
-    def __init__(self):
+    # One fact per (source, product, day): reruns overwrite the day's price instead of duplicating it.
+    # The conflict target names the partial unique index over the scraper's sources (UNIQUE_KEYS).
+    FACT_UPSERT_SQL = f"""
+        INSERT INTO capstone.fact_market_price
+            (date_id, geo_id, vendor_id, source_id, product_id, unit_id, price_base, source_product_key)
+        VALUES %s
+        ON CONFLICT (source_id, source_product_key, date_id) WHERE {SCRAPER_SOURCE_FILTER} DO UPDATE SET
+            geo_id = EXCLUDED.geo_id,
+            vendor_id = EXCLUDED.vendor_id,
+            product_id = EXCLUDED.product_id,
+            unit_id = EXCLUDED.unit_id,
+            price_base = EXCLUDED.price_base
+    """
+
+    def __init__(self, pool_min=None, pool_max=None, health_check_after=30, backend=None, alias_miss_ttl=300):
+        """
+        pool_min / pool_max: connection pool bounds (env SUPABASE_POOL_MIN / SUPABASE_POOL_MAX, default 1 / 5).
+        health_check_after: seconds a pooled connection may sit idle before it is pinged on checkout.
+        backend: a storage.warehouse backend; by default chosen by WAREHOUSE_BACKEND (postgres or sqlite).
+        alias_miss_ttl: seconds an unmapped alias is trusted before the warehouse is asked again, so
+        aliases seeded later (by seed_aliases.py or another process) are picked up.
+        """
         load_dotenv()
-        self._dsn = (
-            f"host={os.getenv('DB_HOST')} "
-            f"dbname={os.getenv('DB_NAME')} "
-            f"user={os.getenv('DB_USER')} "
-            f"password={os.getenv('DB_PASSWORD')} "
-            f"port={os.getenv('DB_PORT')} "
-            f"sslmode=require"
-        )
+        self.backend = backend or warehouse_backend_from_env(pool_min, pool_max, health_check_after)
+        # Dimension caches: (source_product_key, source_id) -> (product_id, unit_id), when each
+        # unmapped key was last confirmed missing, and the dim_date ids known to exist.
+        self._cache_lock = threading.Lock()
+        self._alias_cache = {}
+        self._alias_misses = {}
+        self._aliases_loaded_at = None
+        self.alias_miss_ttl = alias_miss_ttl
+        self._known_dates = set()
+        self._fact_key_ready = False
+        self._alias_key_ready = False
         self._load_vendor_map()
+        self._load_alias_cache()
+
+    @staticmethod
+    def is_configured():
+        """(configured, reason): False when no warehouse is set up (e.g. a local-only install)."""
+        load_dotenv()
+        return warehouse_configured()
 
     # ── Connection ────────────────────────────────────────────
     def _conn(self):
-        return psycopg2.connect(self._dsn)
+        """Borrows a backend connection. Commits on success, rolls back on error."""
+        return self.backend.connection()
+
+    def close(self):
+        """Closes every pooled connection."""
+        self.backend.close()
 
     def _load_vendor_map(self):
         """Load vendor_id mappings for our retailers."""
@@ -73,9 +114,51 @@ class SupabaseManager:
         except Exception as e:
             logger.warning(f"Could not load vendor map: {e}")
 
+    # ── Dimension Caches ──────────────────────────────────────
+    def _load_alias_cache(self):
+        """Loads the whole product_alias table (a few hundred rows at most) into memory."""
+        loaded_at = time.monotonic()
+        try:
+            with self._conn() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        SELECT source_product_key, source_id, product_id, unit_id
+                        FROM capstone.product_alias
+                    """)
+                    rows = cur.fetchall()
+        except Exception as e:
+            logger.warning(f"Could not preload aliases, falling back to per-key lookups: {e}")
+            return
+        with self._cache_lock:
+            self._alias_cache = {(key, sid): (pid, uid) for key, sid, pid, uid in rows}
+            self._alias_misses = {}
+            self._aliases_loaded_at = loaded_at
+
+    def invalidate_caches(self):
+        """Drops the alias and date caches and reloads the aliases."""
+        with self._cache_lock:
+            self._alias_cache = {}
+            self._alias_misses = {}
+            self._aliases_loaded_at = None
+            self._known_dates = set()
+        self._load_alias_cache()
+
     # ── Alias Resolution ──────────────────────────────────────
     def resolve_alias(self, source_product_key: str, source_id: int):
-        """Looks up a product alias and returns (product_id, unit_id) or None."""
+        """
+        Looks up a product alias and returns (product_id, unit_id) or None.
+        A miss is trusted for alias_miss_ttl seconds (counted from the preload or the last lookup),
+        then the warehouse is asked again.
+        """
+        key = (source_product_key, source_id)
+        now = time.monotonic()
+        with self._cache_lock:
+            if key in self._alias_cache:
+                return self._alias_cache[key]
+            checked_at = self._alias_misses.get(key, self._aliases_loaded_at)
+            if checked_at is not None and now - checked_at < self.alias_miss_ttl:
+                return None
+
         with self._conn() as conn:
             with conn.cursor() as cur:
                 cur.execute("""
@@ -84,51 +167,73 @@ class SupabaseManager:
                     WHERE source_product_key = %s AND source_id = %s
                 """, (source_product_key, source_id))
                 row = cur.fetchone()
-                return row if row else None
+        alias = tuple(row) if row else None
+        with self._cache_lock:
+            if alias:
+                self._alias_cache[key] = alias
+                self._alias_misses.pop(key, None)
+            else:
+                self._alias_misses[key] = now
+        return alias
 
     # ── Date Management ───────────────────────────────────────
+    @staticmethod
+    def _date_row(dt: date):
+        """Builds the dim_date row for a date."""
+        # Determine season (Northern Hemisphere)
+        month = dt.month
+        if month in (12, 1, 2):
+            season = "Winter"
+        elif month in (3, 4, 5):
+            season = "Spring"
+        elif month in (6, 7, 8):
+            season = "Summer"
+        else:
+            season = "Fall"
+        return (dt, dt.strftime("%B"), dt.strftime("%A"), season, dt.year, dt.isocalendar()[1])
+
     def ensure_date(self, dt: date):
         """Inserts a date into dim_date if it doesn't already exist."""
+        self.ensure_dates([dt])
+
+    def ensure_dates(self, dates):
+        """Inserts any dates not already known to exist, in one statement."""
+        missing = sorted(set(dates) - self._known_dates)
+        if not missing:
+            return
         with self._conn() as conn:
             with conn.cursor() as cur:
-                cur.execute("SELECT 1 FROM capstone.dim_date WHERE date_id = %s", (dt,))
-                if cur.fetchone():
-                    return
-                
-                month_name = dt.strftime("%B")
-                day_name = dt.strftime("%A")
-                year = dt.year
-                week = dt.isocalendar()[1]
-                
-                # Determine season (Northern Hemisphere)
-                month = dt.month
-                if month in (12, 1, 2):
-                    season = "Winter"
-                elif month in (3, 4, 5):
-                    season = "Spring"
-                elif month in (6, 7, 8):
-                    season = "Summer"
-                else:
-                    season = "Fall"
-
-                cur.execute("""
+                self.backend.execute_values(cur, """
                     INSERT INTO capstone.dim_date (date_id, month_name, day_name, season, year, week_number)
-                    VALUES (%s, %s, %s, %s, %s, %s)
+                    VALUES %s
                     ON CONFLICT DO NOTHING
-                """, (dt, month_name, day_name, season, year, week))
-                conn.commit()
+                """, [self._date_row(dt) for dt in missing])
+        self._known_dates.update(missing)
 
     # ── Fact Insertion ────────────────────────────────────────
-    def insert_market_price(self, data: dict):
+    def _require_unique_key(self, cur, table):
         """
-        Inserts a record into fact_market_price.
-        
-        data should contain:
-            - product_id (from scraper, e.g. 'nf-chicken-breast')
-            - store (e.g. 'nofrills')
-            - unit_price (normalized price)
-            - standard_unit (e.g. 'kg')
-            - timestamp (ISO string or datetime)
+        Raises if the unique index the upserts into `table` rely on is missing. It is never created
+        (nor the table de-duplicated) implicitly: see scripts/migrate_warehouse_keys.py.
+        """
+        index = UNIQUE_KEYS[table]["index"]
+        if not self.backend.has_index(cur, index):
+            raise RuntimeError(f"capstone.{table} has no unique index {index}; "
+                               f"run scripts/migrate_warehouse_keys.py")
+
+    def require_fact_unique_key(self):
+        """Checks (once per process) that fact_market_price has its upsert key."""
+        if self._fact_key_ready:
+            return
+        with self._conn() as conn:
+            with conn.cursor() as cur:
+                self._require_unique_key(cur, "fact_market_price")
+        self._fact_key_ready = True
+
+    def _fact_row(self, data: dict):
+        """
+        Maps a scraper record to a fact_market_price row, using only cached dimensions.
+        Returns (row, None), or (None, reason) when the record can't be uploaded.
         """
         store = data.get("store")
         source_id = self.SOURCE_MAP.get(store)
@@ -136,14 +241,12 @@ class SupabaseManager:
         scraper_product_key = data.get("product_id")
 
         if not source_id or not vendor_id:
-            logger.warning(f"No source/vendor mapping for store '{store}'. Skipping upload.")
-            return False
+            return None, f"no source/vendor mapping for store '{store}'"
 
         # Resolve the alias
         alias = self.resolve_alias(scraper_product_key, source_id)
         if not alias:
-            logger.warning(f"No alias found for product '{scraper_product_key}' (source_id={source_id}). Skipping.")
-            return False
+            return None, f"no alias for product '{scraper_product_key}' (source_id={source_id})"
 
         dim_product_id, alias_unit_id = alias
 
@@ -156,62 +259,191 @@ class SupabaseManager:
         else:
             scrape_date = date.today()
 
-        # Ensure dim_date exists
-        self.ensure_date(scrape_date)
-
         # Determine unit_id
         std_unit = data.get("standard_unit", "each")
         unit_id = alias_unit_id or self.UNIT_MAP.get(std_unit, 3)
 
-        # Price
-        price_base = data.get("unit_price", data.get("price", 0.0))
+        # Price: the shelf price only stands in when no unit price was parsed (0 is a real price)
+        price_base = data.get("unit_price")
+        if price_base is None:
+            price_base = data.get("price")
+        if price_base is None:
+            # Retrying can't fix this record: report it as skipped (parked), not failed
+            return None, f"no price for product '{scraper_product_key}'"
+
+        return (
+            scrape_date,
+            self.GEO_ID_BURLINGTON,
+            vendor_id,
+            source_id,
+            dim_product_id,
+            unit_id,
+            round(price_base, 2),
+            scraper_product_key
+        ), None
+
+    def insert_market_price(self, data: dict):
+        """
+        Inserts a record into fact_market_price.
+        
+        data should contain:
+            - product_id (from scraper, e.g. 'nf-chicken-breast')
+            - store (e.g. 'nofrills')
+            - unit_price (normalized price)
+            - standard_unit (e.g. 'kg')
+            - timestamp (ISO string or datetime)
+        """
+        row, reason = self._fact_row(data)
+        if row is None:
+            logger.warning(f"Skipping upload: {reason}.")
+            return False
+
+        # Ensure dim_date exists
+        self.ensure_date(row[0])
+        self.require_fact_unique_key()
 
         with self._conn() as conn:
             with conn.cursor() as cur:
-                cur.execute("""
-                    INSERT INTO capstone.fact_market_price 
-                        (date_id, geo_id, vendor_id, source_id, product_id, unit_id, price_base, source_product_key)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                """, (
-                    scrape_date,
-                    self.GEO_ID_BURLINGTON,
-                    vendor_id,
-                    source_id,
-                    dim_product_id,
-                    unit_id,
-                    round(price_base, 2),
-                    scraper_product_key
-                ))
-                conn.commit()
-                logger.info(f"Uploaded {scraper_product_key} -> product_id={dim_product_id} @ ${price_base:.2f} for {scrape_date}")
-                return True
+                self.backend.execute_values(cur, self.FACT_UPSERT_SQL, [row])
+        logger.info(f"Uploaded {row[7]} -> product_id={row[4]} @ ${row[6]:.2f} for {row[0]}")
+        return True
+
+    def insert_market_prices(self, batch, chunk_size=500):
+        """
+        Upserts many records into fact_market_price with multi-row INSERT ... ON CONFLICT, one
+        transaction per chunk of `chunk_size` rows. A failing chunk is rolled back without affecting
+        the others. Records for the same product-day collapse to the last one in the batch.
+
+        Returns one outcome per input record, in order:
+            {"status": "inserted" | "skipped" | "failed", "reason": str or None}
+        """
+        outcomes = [None] * len(batch)
+        # A statement can't touch the same conflict key twice, so each product-day gets one row
+        rows, positions, slots = [], [], {}
+        for i, data in enumerate(batch):
+            try:
+                row, reason = self._fact_row(data)
+            except (TypeError, ValueError) as e:
+                # A malformed record (bad timestamp or price) fails the same way on every retry
+                outcomes[i] = {"status": "skipped", "reason": f"invalid record: {e}"}
+                continue
+            if row is None:
+                outcomes[i] = {"status": "skipped", "reason": reason}
+                continue
+            key = (row[3], row[7], row[0])
+            if key in slots:
+                rows[slots[key]] = row
+                positions[slots[key]].append(i)
+            else:
+                slots[key] = len(rows)
+                rows.append(row)
+                positions.append([i])
+
+        if rows:
+            try:
+                self.ensure_dates(row[0] for row in rows)
+                self.require_fact_unique_key()
+            except Exception as e:
+                logger.error(f"Could not prepare the warehouse for upload: {e}")
+                for group in positions:
+                    for i in group:
+                        outcomes[i] = {"status": "failed", "reason": str(e)}
+                return outcomes
+
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            chunk_positions = positions[start:start + chunk_size]
+            try:
+                with self._conn() as conn:
+                    with conn.cursor() as cur:
+                        self.backend.execute_values(cur, self.FACT_UPSERT_SQL, chunk, page_size=chunk_size)
+                outcome = {"status": "inserted", "reason": None}
+            except Exception as e:
+                logger.error(f"Chunk of {len(chunk)} fact rows failed: {e}")
+                outcome = {"status": "failed", "reason": str(e)}
+            for group in chunk_positions:
+                for i in group:
+                    outcomes[i] = dict(outcome)
+
+        inserted = sum(1 for o in outcomes if o["status"] == "inserted")
+        logger.info(f"Uploaded {inserted}/{len(batch)} fact rows in {(len(rows) + chunk_size - 1) // chunk_size} chunk(s)")
+        return outcomes
 
     # ── Alias Seeding ─────────────────────────────────────────
     def upsert_alias(self, source_id: int, product_id: int, source_product_key: str, 
                      source_product_name: str, unit_id: int):
         """Inserts or updates a product alias."""
+        self.upsert_aliases([{
+            "source_id": source_id,
+            "product_id": product_id,
+            "source_product_key": source_product_key,
+            "source_product_name": source_product_name,
+            "unit_id": unit_id,
+        }])
+
+    def upsert_aliases(self, aliases, chunk_size=500):
+        """
+        Inserts or updates many aliases in one transaction, one INSERT ... ON CONFLICT DO UPDATE
+        per chunk. Only new or changed aliases are written.
+
+        aliases: dicts with source_id, product_id, source_product_key, source_product_name, unit_id.
+        source_id must be one of the scraper's sources (SCRAPER_SOURCE_IDS), else ValueError.
+        Returns {"added": [...], "changed": [...], "unchanged": [...]} of (source_id, source_product_key).
+        """
+        # Later entries for the same key win, as they would with row-by-row upserts
+        wanted = {}
+        for a in aliases:
+            key = (int(a["source_id"]), a["source_product_key"])
+            if key[0] not in SCRAPER_SOURCE_IDS:
+                # The upsert key only covers the scraper's sources; other loaders own the rest
+                raise ValueError(f"source_id {key[0]} is not a scraper source {SCRAPER_SOURCE_IDS}")
+            wanted[key] = (int(a["product_id"]), a.get("source_product_name"),
+                           None if a.get("unit_id") in (None, "") else int(a["unit_id"]))
+
+        diff = {"added": [], "changed": [], "unchanged": []}
         with self._conn() as conn:
             with conn.cursor() as cur:
-                # Check if exists
-                cur.execute("""
-                    SELECT alias_id FROM capstone.product_alias 
-                    WHERE source_product_key = %s AND source_id = %s
-                """, (source_product_key, source_id))
-                
-                if cur.fetchone():
-                    cur.execute("""
-                        UPDATE capstone.product_alias 
-                        SET product_id = %s, source_product_name = %s, unit_id = %s, updated_at = now()
-                        WHERE source_product_key = %s AND source_id = %s
-                    """, (product_id, source_product_name, unit_id, source_product_key, source_id))
-                else:
-                    cur.execute("""
-                        INSERT INTO capstone.product_alias 
+                if not self._alias_key_ready:
+                    self._require_unique_key(cur, "product_alias")
+                    self._alias_key_ready = True
+                cur.execute(f"""
+                    SELECT source_id, source_product_key, product_id, source_product_name, unit_id
+                    FROM capstone.product_alias
+                    WHERE {SCRAPER_SOURCE_FILTER}
+                """)
+                current = {(sid, key): (pid, name, uid) for sid, key, pid, name, uid in cur.fetchall()}
+
+                rows = []
+                for key, values in sorted(wanted.items()):
+                    if key not in current:
+                        diff["added"].append(key)
+                    elif current[key] != values:
+                        diff["changed"].append(key)
+                    else:
+                        diff["unchanged"].append(key)
+                        continue
+                    rows.append((key[0], values[0], key[1], values[1], values[2]))
+
+                for start in range(0, len(rows), chunk_size):
+                    self.backend.execute_values(cur, f"""
+                        INSERT INTO capstone.product_alias
                             (source_id, product_id, source_product_key, source_product_name, unit_id)
-                        VALUES (%s, %s, %s, %s, %s)
-                    """, (source_id, product_id, source_product_key, source_product_name, unit_id))
-                
-                conn.commit()
+                        VALUES %s
+                        ON CONFLICT (source_id, source_product_key) WHERE {SCRAPER_SOURCE_FILTER} DO UPDATE SET
+                            product_id = EXCLUDED.product_id,
+                            source_product_name = EXCLUDED.source_product_name,
+                            unit_id = EXCLUDED.unit_id,
+                            updated_at = now()
+                    """, rows[start:start + chunk_size], page_size=chunk_size)
+
+        # Write-through, so a key that was cached as unmapped starts uploading immediately
+        with self._cache_lock:
+            for (source_id, source_product_key), (product_id, _, unit_id) in wanted.items():
+                self._alias_cache[(source_product_key, source_id)] = (product_id, unit_id)
+                self._alias_misses.pop((source_product_key, source_id), None)
+        logger.info(f"Aliases: {len(diff['added'])} added, {len(diff['changed'])} changed, "
+                    f"{len(diff['unchanged'])} unchanged")
+        return diff
 
     # ── Vendor Seeding ────────────────────────────────────────
     def ensure_vendors(self):
@@ -230,6 +462,7 @@ class SupabaseManager:
                         ON CONFLICT DO NOTHING
                     """, (name, vtype))
                 conn.commit()
-        # Reload the vendor map
+        # Reload the vendor map and the dimension caches
         self._load_vendor_map()
+        self.invalidate_caches()
         return self.VENDOR_MAP
@@ -0,0 +1,440 @@
+"""
+Warehouse backends for SupabaseManager.
+
+PostgresBackend talks to the capstone schema on Supabase through a connection pool.
+SQLiteWarehouse is an embedded stand-in for data/final_schema.sql (dimensions, fact_market_price
+and product_alias in one local file), so the upload and sync paths can be exercised and
+benchmarked offline. Pick one with WAREHOUSE_BACKEND=postgres (default) or sqlite; the SQLite
+file location comes from WAREHOUSE_SQLITE_PATH.
+
+Both backends hand out connections whose cursors accept the same SQL: %s placeholders,
+capstone.-qualified table names, now() and INSERT ... ON CONFLICT.
+"""
+
+import csv
+import os
+import re
+import sqlite3
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from datetime import date, datetime
+
+logger = logging.getLogger("warehouse")
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Unique keys behind the uploader's ON CONFLICT upserts. They are partial indexes over the
+# scraper's own sources (SupabaseManager.SOURCE_MAP), so rows other capstone loaders write to
+# the same tables are never constrained by them. On an existing warehouse they are created by
+# scripts/migrate_warehouse_keys.py; uploads refuse to run until they exist.
+SCRAPER_SOURCE_IDS = (4, 5, 6)
+SCRAPER_SOURCE_FILTER = f"source_id IN ({', '.join(map(str, SCRAPER_SOURCE_IDS))})"
+UNIQUE_KEYS = {
+    "fact_market_price": {
+        "index": "fact_market_price_scraper_key_uidx",
+        "id_column": "market_fact_id",
+        "columns": ("source_id", "source_product_key", "date_id"),
+        # Table-wide index an earlier version created on first upload
+        "legacy_index": "fact_market_price_source_key_date_uidx",
+    },
+    "product_alias": {
+        "index": "product_alias_scraper_key_uidx",
+        "id_column": "alias_id",
+        "columns": ("source_id", "source_product_key"),
+        "legacy_index": "product_alias_source_key_uidx",
+    },
+}
+
+
+def warehouse_configured():
+    """
+    Whether WAREHOUSE_BACKEND can be reached at all (call after load_dotenv): the sqlite backend
+    always can, postgres needs its connection settings. Returns (configured, reason).
+    """
+    kind = os.getenv("WAREHOUSE_BACKEND", "postgres").lower()
+    if kind == "sqlite":
+        return True, None
+    missing = [name for name in ("DB_HOST", "DB_NAME", "DB_USER", "DB_PASSWORD") if not os.getenv(name)]
+    if missing:
+        return False, f"{', '.join(missing)} not set"
+    return True, None
+
+
+def warehouse_backend_from_env(pool_min=None, pool_max=None, health_check_after=30):
+    """Builds the backend named by WAREHOUSE_BACKEND (call after load_dotenv)."""
+    kind = os.getenv("WAREHOUSE_BACKEND", "postgres").lower()
+    if kind == "sqlite":
+        return SQLiteWarehouse(os.getenv("WAREHOUSE_SQLITE_PATH") or SQLiteWarehouse.DEFAULT_PATH)
+    if kind in ("postgres", "supabase"):
+        dsn = (
+            f"host={os.getenv('DB_HOST')} "
+            f"dbname={os.getenv('DB_NAME')} "
+            f"user={os.getenv('DB_USER')} "
+            f"password={os.getenv('DB_PASSWORD')} "
+            f"port={os.getenv('DB_PORT')} "
+            f"sslmode=require"
+        )
+        return PostgresBackend(
+            dsn,
+            pool_min=int(pool_min or os.getenv("SUPABASE_POOL_MIN", 1)),
+            pool_max=int(pool_max or os.getenv("SUPABASE_POOL_MAX", 5)),
+            health_check_after=health_check_after,
+        )
+    raise ValueError(f"Unknown WAREHOUSE_BACKEND '{kind}', expected 'postgres' or 'sqlite'")
+
+
+class PostgresBackend:
+    """Pooled psycopg2 connections to the remote warehouse."""
+
+    name = "postgres"
+
+    def __init__(self, dsn, pool_min=1, pool_max=5, health_check_after=30):
+        """health_check_after: seconds a pooled connection may sit idle before it is pinged on checkout."""
+        self._dsn = dsn
+        self._pool_min = pool_min
+        self._pool_max = pool_max
+        self._health_check_after = health_check_after
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._last_used = {}
+        # ThreadedConnectionPool raises when exhausted; this makes callers wait for a free slot instead
+        self._slots = threading.BoundedSemaphore(pool_max)
+
+    def _get_pool(self):
+        from psycopg2 import pool as pg_pool
+        with self._pool_lock:
+            if self._pool is None or self._pool.closed:
+                self._pool = pg_pool.ThreadedConnectionPool(self._pool_min, self._pool_max, self._dsn)
+            return self._pool
+
+    def _is_healthy(self, conn):
+        import psycopg2
+        if conn.closed:
+            return False
+        last_used = self._last_used.get(id(conn))
+        # Freshly opened connections, and recently used ones, skip the round-trip ping
+        if last_used is None or time.monotonic() - last_used < self._health_check_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _checkout(self):
+        """Takes a healthy connection from the pool, replacing dead ones."""
+        import psycopg2
+        pool = self._get_pool()
+        for _ in range(self._pool_max + 1):
+            conn = pool.getconn()
+            if self._is_healthy(conn):
+                return conn
+            logger.info("Discarding stale pooled connection, reconnecting.")
+            self._last_used.pop(id(conn), None)
+            pool.putconn(conn, close=True)
+        raise psycopg2.OperationalError("Could not obtain a healthy connection from the pool")
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrows a pooled connection. Commits on success, rolls back on error,
+        and drops the connection instead of returning it if it broke.
+        """
+        import psycopg2
+        self._slots.acquire()
+        try:
+            pool = self._get_pool()
+            conn = self._checkout()
+        except Exception:
+            self._slots.release()
+            raise
+        broken = False
+        try:
+            yield conn
+            conn.commit()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            broken = broken or bool(conn.closed)
+            if broken:
+                self._last_used.pop(id(conn), None)
+            else:
+                self._last_used[id(conn)] = time.monotonic()
+            pool.putconn(conn, close=broken)
+            self._slots.release()
+
+    def execute_values(self, cur, sql, rows, page_size=100):
+        from psycopg2.extras import execute_values
+        execute_values(cur, sql, rows, page_size=page_size)
+
+    def has_index(self, cur, name):
+        cur.execute("SELECT 1 FROM pg_indexes WHERE schemaname = 'capstone' AND indexname = %s", (name,))
+        return cur.fetchone() is not None
+
+    def create_unique_index(self, cur, name, table, columns, where=None):
+        cur.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {name} ON capstone.{table} ({', '.join(columns)})"
+                    + (f" WHERE {where}" if where else ""))
+
+    def close(self):
+        """Closes every pooled connection."""
+        with self._pool_lock:
+            if self._pool is not None and not self._pool.closed:
+                self._pool.closeall()
+
+
+class _SQLiteCursor:
+    """Adapts Postgres-flavoured SQL (%s, now()) and date parameters to sqlite3."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    @staticmethod
+    def translate(sql):
+        return re.sub(r"\bnow\(\)", "CURRENT_TIMESTAMP", sql.replace("%s", "?"), flags=re.IGNORECASE)
+
+    @staticmethod
+    def _param(value):
+        if isinstance(value, (date, datetime)):
+            return value.isoformat()
+        return value
+
+    def execute(self, sql, params=()):
+        self._cursor.execute(self.translate(sql), [self._param(v) for v in params])
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._cursor.close()
+
+
+class _SQLiteConnection:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self):
+        return _SQLiteCursor(self._conn.cursor())
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+
+class SQLiteWarehouse:
+    """
+    Embedded copy of the capstone schema in a single SQLite file, attached as `capstone`
+    so the same qualified table names work. Dimensions the uploader depends on (sources,
+    units, the Burlington geo, retailer vendors, and dim_product from data/products.csv
+    when present) are seeded on first use.
+    """
+
+    name = "sqlite"
+    DEFAULT_PATH = os.path.join(ROOT_DIR, "data", "warehouse.db")
+    # SQLite's default limit on bound parameters per statement
+    MAX_VARIABLES = 32766
+
+    SCHEMA = [
+        """
+        CREATE TABLE IF NOT EXISTS capstone.dim_date (
+            date_id TEXT PRIMARY KEY,
+            month_name TEXT,
+            day_name TEXT,
+            season TEXT,
+            year INTEGER,
+            week_number INTEGER
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS capstone.dim_geo (
+            geo_id INTEGER PRIMARY KEY,
+            geo_name TEXT NOT NULL,
+            geo_level TEXT NOT NULL DEFAULT 'UNKNOWN',
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS capstone.dim_unit (
+            unit_id INTEGER PRIMARY KEY,
+            unit_base TEXT NOT NULL,
+            unit_desc TEXT,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS capstone.dim_product (
+            product_id INTEGER PRIMARY KEY,
+            product_name TEXT NOT NULL,
+            category TEXT,
+            unit_id INTEGER REFERENCES dim_unit(unit_id),
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS capstone.dim_source (
+            source_id INTEGER PRIMARY KEY,
+            source_name TEXT NOT NULL,
+            source_type TEXT NOT NULL DEFAULT 'UNKNOWN',
+            frequency TEXT NOT NULL DEFAULT 'UNKNOWN',
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS capstone.dim_vendor (
+            vendor_id INTEGER PRIMARY KEY,
+            vendor_name TEXT NOT NULL,
+            vendor_type TEXT NOT NULL DEFAULT 'UNKNOWN',
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS capstone.fact_market_price (
+            market_fact_id INTEGER PRIMARY KEY,
+            date_id TEXT NOT NULL REFERENCES dim_date(date_id),
+            geo_id INTEGER NOT NULL REFERENCES dim_geo(geo_id),
+            vendor_id INTEGER NOT NULL REFERENCES dim_vendor(vendor_id),
+            source_id INTEGER NOT NULL REFERENCES dim_source(source_id),
+            product_id INTEGER NOT NULL REFERENCES dim_product(product_id),
+            unit_id INTEGER REFERENCES dim_unit(unit_id),
+            price_base REAL NOT NULL CHECK (price_base >= 0),
+            source_product_key TEXT,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS capstone.product_alias (
+            alias_id INTEGER PRIMARY KEY,
+            source_id INTEGER NOT NULL REFERENCES dim_source(source_id),
+            product_id INTEGER NOT NULL REFERENCES dim_product(product_id),
+            source_product_key TEXT NOT NULL,
+            source_product_name TEXT,
+            unit_id INTEGER REFERENCES dim_unit(unit_id),
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]
+
+    # Ids match SupabaseManager.SOURCE_MAP / UNIT_MAP / GEO_ID_BURLINGTON
+    SEED = {
+        "dim_unit (unit_id, unit_base, unit_desc)": [(1, "kg", "Kilogram"), (2, "l", "Litre"), (3, "unit", "Each")],
+        "dim_geo (geo_id, geo_name, geo_level)": [(4, "Burlington, ON", "CITY")],
+        "dim_source (source_id, source_name, source_type, frequency)": [
+            (4, "No Frills", "SCRAPING", "DAILY"),
+            (5, "Metro", "SCRAPING", "DAILY"),
+            (6, "Food Basics", "SCRAPING", "DAILY"),
+        ],
+        "dim_vendor (vendor_id, vendor_name, vendor_type)": [
+            (1, "No Frills", "RETAILER"),
+            (2, "Metro", "RETAILER"),
+            (3, "Food Basics", "RETAILER"),
+        ],
+    }
+
+    PRODUCTS_CSV = os.path.join(ROOT_DIR, "data", "products.csv")
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._init_db()
+
+    def _connect(self):
+        conn = sqlite3.connect(":memory:")
+        conn.execute("ATTACH DATABASE ? AS capstone", (self.path,))
+        return conn
+
+    def _init_db(self):
+        conn = self._connect()
+        try:
+            for statement in self.SCHEMA:
+                conn.execute(statement)
+            # Same scoped upsert keys as the Postgres schema (the table-wide index older files
+            # have is dropped so the two can't diverge). Rows are never deleted to make room:
+            # a file with duplicate keys keeps working for reads and is left to the migration.
+            cur = _SQLiteCursor(conn.cursor())
+            for table, key in UNIQUE_KEYS.items():
+                if key.get("legacy_index"):
+                    cur.execute(f"DROP INDEX IF EXISTS capstone.{key['legacy_index']}")
+                try:
+                    self.create_unique_index(cur, key["index"], table, key["columns"], where=SCRAPER_SOURCE_FILTER)
+                except sqlite3.IntegrityError:
+                    logger.warning(f"capstone.{table} has duplicate keys, {key['index']} not created; "
+                                   f"run scripts/migrate_warehouse_keys.py")
+            for target, rows in self.SEED.items():
+                placeholders = ", ".join("?" for _ in rows[0])
+                conn.executemany(f"INSERT OR IGNORE INTO capstone.{target} VALUES ({placeholders})", rows)
+            if os.path.exists(self.PRODUCTS_CSV):
+                with open(self.PRODUCTS_CSV, "r", encoding="utf-8-sig") as f:
+                    products = [
+                        (int(r["product_id"]), r["product_name"].strip(), r["category"].strip(), int(r["unit_id"]))
+                        for r in csv.DictReader(f)
+                    ]
+                conn.executemany("""
+                    INSERT OR IGNORE INTO capstone.dim_product (product_id, product_name, category, unit_id)
+                    VALUES (?, ?, ?, ?)
+                """, products)
+            conn.commit()
+        finally:
+            conn.close()
+
+    @contextmanager
+    def connection(self):
+        """A fresh connection per use (opening a local file is cheap). Commits on success."""
+        conn = self._connect()
+        try:
+            yield _SQLiteConnection(conn)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def execute_values(self, cur, sql, rows, page_size=100):
+        """Expands `VALUES %s` into multi-row VALUES lists, like psycopg2.extras.execute_values."""
+        rows = [tuple(row) for row in rows]
+        if not rows:
+            return
+        width = len(rows[0])
+        page_size = max(1, min(page_size, self.MAX_VARIABLES // width))
+        group = "(" + ", ".join("%s" for _ in range(width)) + ")"
+        for start in range(0, len(rows), page_size):
+            page = rows[start:start + page_size]
+            cur.execute(sql.replace("VALUES %s", "VALUES " + ", ".join(group for _ in page), 1),
+                        [value for row in page for value in row])
+
+    def has_index(self, cur, name):
+        cur.execute("SELECT 1 FROM capstone.sqlite_master WHERE type = 'index' AND name = %s", (name,))
+        return cur.fetchone() is not None
+
+    def create_unique_index(self, cur, name, table, columns, where=None):
+        cur.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS capstone.{name} ON {table} ({', '.join(columns)})"
+                    + (f" WHERE {where}" if where else ""))
+
+    def close(self):
+        pass
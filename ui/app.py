@@ -1,18 +1,27 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from pydantic import BaseModel
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from pydantic import BaseModel, ValidationError
+import asyncio
+import csv
+import hashlib
+import io
 import json
 import os
+import re
 import sys
 import copy
+import numpy as np
+from datetime import date, datetime, timedelta
 
 app = FastAPI(title="Price Tracker Control UI")
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 PRODUCTS_FILE = os.path.join(BASE_DIR, "config", "products.json")
 SETTINGS_FILE = os.path.join(BASE_DIR, "config", "settings.json")
-STATE_FILE = os.path.join(BASE_DIR, "data", "scraper_state.json")
+EVENTS_FILE = os.path.join(BASE_DIR, "data", "scraper_events.jsonl")
+JOBS_FILE = os.path.join(BASE_DIR, "data", "scrape_jobs.json")
 STATIC_DIR = os.path.join(BASE_DIR, "ui", "static")
 
 # Add storage path to sys.path so we can import db_manager
@@ -21,19 +30,69 @@ if BASE_DIR not in sys.path:
 from storage.db_manager import DatabaseManager
 from storage.csv_manager import CSVManager
 from storage.supabase_manager import SupabaseManager
+from storage.outbox import UploadOutbox, OutboxDrainer
+from storage.product_catalog import ProductCatalog
+from storage.series_cache import DailySeriesCache
+from storage.history_export import HistoryExport
+from utils.progress_log import ProgressLog
+from utils.downsample import METHODS as DOWNSAMPLE_METHODS, downsample, basket as basket_totals
+from ui.jobs import ScrapeJobManager
+from ui.metrics import LatencyMetrics, run_blocking, install as install_metrics
 import logging
 
 logger = logging.getLogger("ui_app")
 
-db = DatabaseManager()
+db = DatabaseManager(storage_mode=DatabaseManager.storage_mode_from_settings(SETTINGS_FILE))
 csv_manager = CSVManager()
+catalog = ProductCatalog(PRODUCTS_FILE)
+# Dense daily price matrix for /api/series, rebuilt when price data changes
+series_cache = DailySeriesCache(db)
 
-# Initialize Supabase manager
-try:
-    sb = SupabaseManager()
-except Exception as e:
-    logger.warning(f"Supabase init failed in UI: {e}")
-    sb = None
+# Warehouse uploads go through the local outbox; the drainer ships them in the background.
+# A local-only install (no warehouse configured) queues nothing.
+outbox = drainer = None
+warehouse_ready, warehouse_reason = SupabaseManager.is_configured()
+if warehouse_ready:
+    outbox = UploadOutbox(db.db_path)
+    drainer = OutboxDrainer(outbox, SupabaseManager)
+else:
+    logger.info(f"Warehouse uploads disabled ({warehouse_reason}); prices are stored locally only.")
+
+# Scrape progress: main.py --ui-mode appends events, /api/scrape/events streams them
+progress_log = ProgressLog(EVENTS_FILE)
+SSE_TAIL_INTERVAL = 0.5
+SSE_KEEPALIVE = 15
+
+# Scans run as tracked, queued jobs (see ui/jobs.py)
+scrape_jobs = ScrapeJobManager(
+    main_script=os.path.join(BASE_DIR, "main.py"),
+    progress_log=progress_log,
+    history_path=JOBS_FILE,
+    log_dir=os.path.join(BASE_DIR, "logs", "scrape_jobs"),
+)
+
+@app.on_event("startup")
+def start_background_workers():
+    if drainer:
+        drainer.start()
+    scrape_jobs.start()
+
+@app.on_event("shutdown")
+def close_csv_manager():
+    csv_manager.close()
+    if drainer:
+        drainer.stop()
+    scrape_jobs.stop()
+
+# Per-endpoint latency, exposed at /api/metrics
+metrics = LatencyMetrics()
+install_metrics(app, metrics)
+
+# Compress JSON/HTML/JS responses (the history pivot shrinks ~10x)
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
+RANGE_PATTERN = re.compile(r"^(\d+)([dwmy])$")
+RANGE_UNITS = {"d": 1, "w": 7, "m": 30, "y": 365}
 
 # Mount static files
 app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
@@ -74,92 +133,160 @@ class PersistRequest(BaseModel):
 class ToggleStatus(BaseModel):
     active: bool
 
-# Helpers
-def load_products():
-    if not os.path.exists(PRODUCTS_FILE):
-        return []
-    with open(PRODUCTS_FILE, "r") as f:
-        return json.load(f)
+class BulkActiveRequest(BaseModel):
+    active: bool
+    ids: list[str] | None = None
+    stores: list[str] | None = None
+    pattern: str | None = None
+    dry_run: bool = False
 
-def save_products(products):
-    with open(PRODUCTS_FILE, "w") as f:
-        json.dump(products, f, indent=4)
+class BulkPackSizeRequest(BaseModel):
+    pack_sizes: dict[str, float | None]
+    dry_run: bool = False
+
+class ProductImportRow(BaseModel):
+    id: str
+    name: str | None = None
+    store: str | None = None
+    url: str | None = None
+    active: bool | None = None
+    pack_size: float | None = None
+
+class ScrapeRequest(BaseModel):
+    stores: list[str] | None = None
+
+class BatchTestRequest(BaseModel):
+    product_ids: list[str] | None = None  # None: every active product
+    stores: list[str] | None = None
+    workers: int = 3
+    per_host: int = 2
 
 @app.get("/")
 async def read_index():
     return FileResponse(os.path.join(STATIC_DIR, "index.html"))
 
+# Helpers (synchronous; endpoints call them through run_blocking)
+def read_settings():
+    if not os.path.exists(SETTINGS_FILE):
+        return {"enabled_stores": ["nofrills", "foodbasics", "metro"]}
+    with open(SETTINGS_FILE, "r") as f:
+        return json.load(f)
+
+def write_settings(update: dict):
+    # Merge so sections the UI doesn't edit (e.g. "retention") are preserved
+    current = {}
+    if os.path.exists(SETTINGS_FILE):
+        with open(SETTINGS_FILE, "r") as f:
+            current = json.load(f)
+    current.update(update)
+    with open(SETTINGS_FILE, "w") as f:
+        json.dump(current, f, indent=4)
+    return current
+
 @app.get("/api/products")
 async def get_products():
-    return load_products()
+    return await run_blocking(catalog.all)
 
 @app.post("/api/products")
 async def add_product(product: Product):
-    products = load_products()
-    if any(p.get("id") == product.id for p in products):
-        raise HTTPException(status_code=400, detail="Product ID already exists")
-    
-    new_product = product.model_dump(exclude_none=True)
-    products.append(new_product)
-    save_products(products)
-    return new_product
+    try:
+        return await run_blocking(catalog.add, product.model_dump(exclude_none=True))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.put("/api/products/{product_id}")
 async def update_product(product_id: str, product_update: ProductUpdate):
-    products = load_products()
-    for i, p in enumerate(products):
-        if p.get("id") == product_id:
-            updates = product_update.model_dump(exclude_unset=True, exclude_none=True)
-            products[i].update(updates)
-            
-            # Handle pack_size removal if explicitly set to null/empty in a real form (here we just use exclude_unset)
-            if "pack_size" in product_update.model_fields_set and product_update.pack_size is None:
-               if "pack_size" in products[i]:
-                   del products[i]["pack_size"]
-
-            save_products(products)
-            return products[i]
-    raise HTTPException(status_code=404, detail="Product not found")
+    updates = product_update.model_dump(exclude_unset=True, exclude_none=True)
+    # Handle pack_size removal if explicitly set to null/empty in a real form (here we just use exclude_unset)
+    remove = []
+    if "pack_size" in product_update.model_fields_set and product_update.pack_size is None:
+        remove.append("pack_size")
+    try:
+        return await run_blocking(catalog.update, product_id, updates, remove=remove)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Product not found")
 
 @app.patch("/api/products/{product_id}/toggle")
 async def toggle_product(product_id: str, status: ToggleStatus):
-    products = load_products()
-    for i, p in enumerate(products):
-        if p.get("id") == product_id:
-            products[i]["active"] = status.active
-            save_products(products)
-            return {"id": product_id, "active": status.active}
-    raise HTTPException(status_code=404, detail="Product not found")
+    try:
+        await run_blocking(catalog.update, product_id, {"active": status.active})
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return {"id": product_id, "active": status.active}
 
 @app.delete("/api/products/{product_id}")
 async def delete_product(product_id: str):
-    products = load_products()
-    initial_len = len(products)
-    products = [p for p in products if p.get("id") != product_id]
-    if len(products) == initial_len:
+    try:
+        await run_blocking(catalog.delete, product_id)
+    except KeyError:
         raise HTTPException(status_code=404, detail="Product not found")
-    
-    save_products(products)
     return {"message": "Product deleted successfully"}
 
+# Bulk catalog edits: one products.json write per batch, each returns the diff it applied
+def parse_product_import(body: bytes, fmt: str):
+    """Rows of a CSV (header: id,name,store,url,active,pack_size) or JSON (list of objects) import."""
+    text = body.decode("utf-8-sig")
+    if fmt == "csv":
+        # Empty cells mean "not given", so an upsert row can carry only the fields it changes
+        raw = [{k.strip(): v.strip() for k, v in row.items() if k and v and v.strip()}
+               for row in csv.DictReader(io.StringIO(text))]
+    else:
+        raw = json.loads(text)
+        if isinstance(raw, dict):
+            raw = raw.get("products")
+        if not isinstance(raw, list):
+            raise ValueError("Expected a JSON list of products (or {\"products\": [...]})")
+    rows, errors = [], []
+    for line, item in enumerate(raw, 1):
+        try:
+            rows.append(ProductImportRow.model_validate(item).model_dump(exclude_none=True))
+        except ValidationError as e:
+            errors += [f"row {line}: {'.'.join(map(str, err['loc'])) or 'row'} {err['msg'].lower()}" for err in e.errors()]
+    if errors:
+        raise ValueError("; ".join(errors[:20]))
+    return rows
+
+@app.post("/api/products/bulk/active")
+async def bulk_set_active(request: BulkActiveRequest):
+    try:
+        return await run_blocking(catalog.set_active, request.active, ids=request.ids, stores=request.stores,
+                                  pattern=request.pattern, dry_run=request.dry_run)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/api/products/bulk/pack-sizes")
+async def bulk_set_pack_sizes(request: BulkPackSizeRequest):
+    try:
+        return await run_blocking(catalog.set_pack_sizes, request.pack_sizes, dry_run=request.dry_run)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=f"Products not found: {e.args[0]}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/api/products/bulk/import")
+async def bulk_import_products(request: Request, mode: str = "upsert", dry_run: bool = False,
+                               format: str | None = Query(None, pattern="^(csv|json)$")):
+    """Imports a CSV or JSON body (format from ?format= or the Content-Type) in one write."""
+    fmt = format or ("csv" if "csv" in request.headers.get("content-type", "") else "json")
+    body = await request.body()
+    try:
+        rows = parse_product_import(body, fmt)
+        return await run_blocking(catalog.import_products, rows, mode=mode, dry_run=dry_run)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.get("/api/settings")
 async def get_settings():
-    if not os.path.exists(SETTINGS_FILE):
-        return {"enabled_stores": ["nofrills", "foodbasics", "metro"]}
-    with open(SETTINGS_FILE, "r") as f:
-        return json.load(f)
+    return await run_blocking(read_settings)
 
 @app.put("/api/settings")
 async def update_settings(settings: SettingsUpdate):
-    with open(SETTINGS_FILE, "w") as f:
-        json.dump(settings.model_dump(), f, indent=4)
-    return settings.model_dump()
+    return await run_blocking(write_settings, settings.model_dump())
 
 @app.post("/api/products/{product_id}/test")
 async def test_product(product_id: str):
     import subprocess
-    products = load_products()
-    product = next((p for p in products if p.get("id") == product_id), None)
+    product = await run_blocking(catalog.get, product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
         
@@ -178,7 +305,7 @@ async def test_product(product_id: str):
         
     try:
         # Run subprocess and capture output
-        process = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        process = await run_blocking(subprocess.run, cmd, capture_output=True, text=True, check=True)
         # Parse JSON output from the tester script
         result = json.loads(process.stdout.strip().split("\n")[-1])
         return result
@@ -187,79 +314,316 @@ async def test_product(product_id: str):
     except json.JSONDecodeError as e:
          raise HTTPException(status_code=500, detail=f"Failed to parse scraper output. Output was: {process.stdout}")
 
+@app.post("/api/products/test-batch")
+async def test_products_batch(request: BatchTestRequest | None = None):
+    """
+    Tests many products in one tester.py --batch run (a warm browser pool instead of one browser
+    per product) and streams its NDJSON: one line per product as it finishes, then a summary line.
+    """
+    request = request or BatchTestRequest()
+    if not 1 <= request.workers <= 8 or not 1 <= request.per_host <= 8:
+        raise HTTPException(status_code=400, detail="workers and per_host must be between 1 and 8")
+    cmd = [sys.executable, os.path.join(BASE_DIR, "utils", "tester.py"), "--batch",
+           "--workers", str(request.workers), "--per-host", str(request.per_host)]
+    if request.product_ids is not None:
+        if not request.product_ids:
+            raise HTTPException(status_code=400, detail="product_ids is empty")
+        cmd += ["--ids", ",".join(request.product_ids)]
+    if request.stores:
+        cmd += ["--stores", ",".join(request.stores)]
+
+    process = await asyncio.create_subprocess_exec(*cmd, stdout=asyncio.subprocess.PIPE,
+                                                   stderr=asyncio.subprocess.DEVNULL, cwd=BASE_DIR)
+
+    async def stream():
+        try:
+            async for line in process.stdout:
+                # Scrapers may print to stdout too; only pass JSON lines on
+                if line.startswith(b"{"):
+                    yield line
+            if await process.wait() != 0:
+                yield (json.dumps({"status": "error", "error": f"tester.py exited with code {process.returncode}"}) + "\n").encode()
+        finally:
+            # Client went away: don't leave browsers running
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson",
+                             headers={"Cache-Control": "no-cache", "Content-Encoding": "identity"})
+
+def parse_range(value: str):
+    """History range: "all" or <n><d|w|m|y> (e.g. 7d, 12w, 6m, 1y). Returns days, or None for all time."""
+    value = (value or "").strip().lower()
+    if value == "all":
+        return None
+    match = RANGE_PATTERN.match(value)
+    if not match or int(match.group(1)) == 0:
+        raise HTTPException(status_code=400, detail=f"Invalid range '{value}', expected e.g. 7d, 4w, 6m, 1y or all")
+    return int(match.group(1)) * RANGE_UNITS[match.group(2)]
+
+def history_etag(params: dict, active_only: bool, catalog_fields: bool = False):
+    # Changes with any price write, with the catalog (active filter, or names/stores in the
+    # response) and with the day (relative ranges)
+    parts = [db.write_seq(), date.today().isoformat(), sorted(params.items())]
+    if active_only or catalog_fields:
+        parts.append(catalog.version())
+    return '"' + hashlib.sha1(json.dumps(parts, default=str).encode()).hexdigest()[:20] + '"'
+
+def history_filter_ids(active_only, product_ids):
+    """Product ids the history endpoints are limited to (None: no limit)."""
+    if active_only:
+        # Filter to active products (the catalog only re-reads products.json when it changes)
+        try:
+            active_ids = catalog.active_ids()
+        except Exception:
+            active_ids = set()
+        if active_ids:
+            return sorted(active_ids & set(product_ids)) if product_ids is not None else sorted(active_ids)
+    return product_ids
+
+def load_history_page(days, active_only, store, product_ids, cursor, limit):
+    product_ids = history_filter_ids(active_only, product_ids)
+    return db.get_history_page(days=days, product_ids=product_ids, store=store, cursor=cursor, limit=limit)
+
 @app.get("/api/history")
-async def get_history(days: int = 7, active_only: bool = True):
+async def get_history(
+    request: Request,
+    range_: str = Query("7d", alias="range"),
+    active_only: bool = True,
+    store: str | None = None,
+    product: str | None = None,
+    cursor: str | None = None,
+    limit: int = Query(200, ge=1, le=1000),
+):
+    """
+    Price history pivot, one item per product, paginated by product id: {items, next_cursor}.
+    product: comma-separated product ids. Answers 304 when the If-None-Match ETag is still current.
+    """
+    days = parse_range(range_)
+    product_ids = [p.strip() for p in product.split(",") if p.strip()] if product else None
+    params = {"days": days, "store": store, "product": product_ids, "cursor": cursor, "limit": limit}
     try:
-        # If days is 0, fetch all time
-        fetch_days = None if days == 0 else days
-        data = db.get_history(days=fetch_days)
-        
-        if active_only:
-            # Read products.json to filter only active ones
-            active_ids = set()
-            try:
-                with open(PRODUCTS_FILE, "r") as f:
-                    products = json.load(f)
-                    for p in products:
-                        if p.get("active", True):
-                            active_ids.add(p.get("id"))
-            except Exception:
-                pass
-                
-            if active_ids:
-                data = [d for d in data if d["id"] in active_ids]
-                
-        return data
+        etag = await run_blocking(history_etag, params, active_only)
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag in [tag.strip().removeprefix("W/") for tag in request.headers.get("if-none-match", "").split(",")]:
+            return Response(status_code=304, headers=headers)
+
+        page = await run_blocking(load_history_page, days, active_only, store, product_ids, cursor, limit)
+        return JSONResponse(page, headers=headers)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/api/scrape/start")
-async def start_scraper():
-    import subprocess
-    # Check if a scrape is already running by checking the state file
-    if os.path.exists(STATE_FILE):
-        try:
-            with open(STATE_FILE, "r") as f:
-                state = json.load(f)
-                if state.get("status") == "running":
-                    raise HTTPException(status_code=400, detail="Scraper is already running")
-        except json.JSONDecodeError:
-            pass # File corrupted, let's start a new one
-            
-    # Initialize state file
-    with open(STATE_FILE, "w") as f:
-        json.dump({
-            "status": "running",
-            "progress": 0,
-            "total": 0,
-            "current_product": "Initializing...",
-            "completed_ids": []
-        }, f)
-        
-    main_script = os.path.join(BASE_DIR, "main.py")
-    
-    # Launch main.py with --ui-mode in the background
-    # We don't block the API, we just spin it up
+def iter_history_csv(days, active_only, store, product_ids, page_size=500):
+    """The history pivot as CSV lines (Store, Product Name, one column per date), a page of products at a time."""
+    product_ids = history_filter_ids(active_only, product_ids)
+    dates = db.history_dates(days=days, product_ids=product_ids, store=store)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["Store", "Product Name"] + dates)
+    cursor = None
+    while True:
+        page = db.get_history_page(days=days, product_ids=product_ids, store=store, cursor=cursor, limit=page_size)
+        for item in page["items"]:
+            history = item["history"]
+            writer.writerow([item["store"], item["name"]] +
+                            ["" if history.get(d) is None else f"{history[d]:.2f}" for d in dates])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        cursor = page["next_cursor"]
+        if not cursor:
+            return
+
+@app.get("/api/history/export.csv")
+async def export_history_csv(
+    range_: str = Query("7d", alias="range"),
+    active_only: bool = True,
+    store: str | None = None,
+    product: str | None = None,
+):
+    """Streams the full history pivot as CSV without building it in memory (or in the browser)."""
+    days = parse_range(range_)
+    product_ids = [p.strip() for p in product.split(",") if p.strip()] if product else None
+    return StreamingResponse(
+        iter_history_csv(days, active_only, store, product_ids),
+        media_type="text/csv",
+        headers={"Content-Disposition": 'attachment; filename="price_history_export.csv"'},
+    )
+
+@app.get("/api/export")
+async def export_data(
+    dataset: str = "raw",
+    format: str = "csv",
+    range_: str = Query("all", alias="range"),
+    start: date | None = None,
+    end: date | None = None,
+    store: str | None = None,
+    product: str | None = None,
+):
+    """
+    Streams price_history ("raw") or the daily rollup ("daily") as CSV or Parquet straight from
+    a SQLite cursor, in constant memory. start/end (ISO dates) override range. product: comma-separated ids.
+    """
+    if dataset not in ("raw", "daily"):
+        raise HTTPException(status_code=400, detail=f"Unknown dataset '{dataset}', expected raw or daily")
+    if format not in HistoryExport.FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format '{format}', expected one of {HistoryExport.FORMATS}")
+    if start is None:
+        days = parse_range(range_)
+        start = date.today() - timedelta(days=days) if days else None
+    product_ids = [p.strip() for p in product.split(",") if p.strip()] if product else None
+    export = HistoryExport(db, dataset=dataset, fmt=format, start=start and start.isoformat(),
+                           end=end and end.isoformat(), product_ids=product_ids, store=store)
+    headers = {"Content-Disposition": f'attachment; filename="{export.filename}"'}
+    if format == "parquet":
+        # Already zstd-compressed; keep GZipMiddleware from compressing it again
+        headers["Content-Encoding"] = "identity"
+    return StreamingResponse(iter(export), media_type=export.media_type, headers=headers)
+
+def load_series(start, end, active_only, store, product_ids, points, method, with_basket):
+    product_ids = history_filter_ids(active_only, product_ids)
+    if store:
+        product_ids = db.history_product_ids(product_ids=product_ids, store=store)
+    column_ids, grid, matrix = series_cache.select(start=start, end=end, product_ids=product_ids)
+    if not len(column_ids):
+        return {"start": start, "end": end, "method": method, "series": [], "basket": None}
+
+    labels = np.datetime_as_string(grid.astype("datetime64[D]"))
+    keep = downsample(grid, matrix, points, method)
+    series = []
+    for col, product_id in enumerate(column_ids):
+        rows_kept = np.flatnonzero(keep[:, col])
+        product = catalog.get(product_id) or {}
+        series.append({
+            "id": product_id,
+            "name": product.get("name"),
+            "store": product.get("store"),
+            "raw_points": int(np.count_nonzero(~np.isnan(matrix[:, col]))),
+            "x": labels[rows_kept].tolist(),
+            "y": np.round(matrix[rows_kept, col], 4).tolist(),
+        })
+
+    basket_series = None
+    if with_basket:
+        totals = basket_totals(matrix)
+        kept = np.flatnonzero(downsample(grid, totals, points, method))
+        basket_series = {"products": len(column_ids), "x": labels[kept].tolist(),
+                         "y": np.round(totals[kept], 4).tolist()}
+    return {"start": labels[0], "end": labels[-1], "method": method, "series": series, "basket": basket_series}
+
+@app.get("/api/series")
+async def get_series(
+    request: Request,
+    range_: str = Query("1y", alias="range"),
+    start: date | None = None,
+    end: date | None = None,
+    active_only: bool = True,
+    store: str | None = None,
+    product: str | None = None,
+    points: int = Query(500, ge=10, le=5000),
+    method: str = "lttb",
+    basket: bool = False,
+):
+    """
+    Daily close-price series per product (and optionally the basket total), downsampled to
+    about `points` points each. start/end (ISO dates) override range. product: comma-separated ids.
+    """
+    if method not in DOWNSAMPLE_METHODS:
+        raise HTTPException(status_code=400, detail=f"Unknown method '{method}', expected one of {DOWNSAMPLE_METHODS}")
+    if start is None:
+        days = parse_range(range_)
+        start = date.today() - timedelta(days=days) if days else None
+    product_ids = [p.strip() for p in product.split(",") if p.strip()] if product else None
+    params = {"start": start, "end": end, "store": store, "product": product_ids,
+              "points": points, "method": method, "basket": basket}
     try:
-        subprocess.Popen(
-            [sys.executable, main_script, "--ui-mode"],
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL
-        )
-        return {"message": "Scraper started"}
+        # Series carry catalog names and stores, so a rename must invalidate them too
+        etag = await run_blocking(history_etag, params, active_only, True)
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag in [tag.strip().removeprefix("W/") for tag in request.headers.get("if-none-match", "").split(",")]:
+            return Response(status_code=304, headers=headers)
+
+        result = await run_blocking(load_series, start and start.isoformat(), end and end.isoformat(),
+                                    active_only, store, product_ids, points, method, basket)
+        return JSONResponse(result, headers=headers)
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to start scraper: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/scrape/start")
+async def start_scraper(request: ScrapeRequest | None = None):
+    stores = request.stores if request else None
+    job, created = await run_blocking(scrape_jobs.enqueue, stores)
+    if created:
+        current = await run_blocking(scrape_jobs.current)
+        message = "Scraper started" if current is None or current["id"] == job["id"] else "Scan queued"
+    else:
+        message = "A scan covering these stores is already queued or running"
+    return {"message": message, "job": job, "created": created}
+
+@app.get("/api/scrape/jobs")
+async def list_scrape_jobs(limit: int = 20):
+    return await run_blocking(scrape_jobs.jobs, limit)
+
+@app.get("/api/scrape/jobs/{job_id}")
+async def get_scrape_job(job_id: str):
+    try:
+        return await run_blocking(scrape_jobs.get, job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+@app.post("/api/scrape/jobs/{job_id}/cancel")
+async def cancel_scrape_job(job_id: str):
+    try:
+        # Blocks on the manager's lock (held while a scan is spawned) and writes the job history
+        return await run_blocking(scrape_jobs.cancel, job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Job not found")
 
 @app.get("/api/scrape/status")
 async def get_scrape_status():
-    if not os.path.exists(STATE_FILE):
-        return {"status": "idle"}
-        
+    return await run_blocking(read_scrape_state)
+
+def read_scrape_state():
     try:
-        with open(STATE_FILE, "r") as f:
-            return json.load(f)
+        state = progress_log.state()
+        state["job"] = scrape_jobs.current()
+        return state
     except Exception:
-        return {"status": "error", "message": "Could not read status file"}
+        return {"status": "error", "message": "Could not read progress log"}
+
+@app.get("/api/scrape/events")
+async def stream_scrape_events(request: Request):
+    """
+    Server-Sent Events: a `state` snapshot on connect, then one `progress` message per
+    log event as main.py appends it. Only the log's first line and size are checked while nothing changes.
+    """
+    async def events():
+        state, cursor = await run_blocking(progress_log.snapshot)
+        yield f"event: state\ndata: {json.dumps(state)}\n\n"
+        idle = 0.0
+        while not await request.is_disconnected():
+            # A new run rewrites the log under a new run id; read_from then restarts at its run_requested event
+            new_events, cursor = await run_blocking(progress_log.read_from, cursor)
+            for event in new_events:
+                yield f"id: {event.get('seq')}\nevent: progress\ndata: {json.dumps(event)}\n\n"
+            if new_events:
+                idle = 0.0
+                continue
+            await asyncio.sleep(SSE_TAIL_INTERVAL)
+            idle += SSE_TAIL_INTERVAL
+            if idle >= SSE_KEEPALIVE:
+                idle = 0.0
+                yield ": keep-alive\n\n"
+
+    # Content-Encoding: identity keeps GZipMiddleware from buffering the stream
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no",
+                                      "Content-Encoding": "identity"})
 
 @app.post("/api/history/persist")
 async def persist_history(data: PersistRequest):
@@ -275,20 +639,27 @@ async def persist_history(data: PersistRequest):
         if not payload.get("timestamp"):
             payload["timestamp"] = datetime.now().isoformat()
             
-        db.save_price(payload)
-        csv_manager.append_price(payload)
-        
-        # Also upload to Supabase
-        if sb:
-            try:
-                sb.insert_market_price(payload)
-            except Exception as e:
-                logger.warning(f"Supabase upload failed during persist: {e}")
-        
+        await run_blocking(persist_price, payload)
         return {"status": "success", "message": "Price persisted to history"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def persist_price(payload: dict):
+    db.save_price(payload)
+    csv_manager.append_price(payload)
+    csv_manager.flush()  # single manual entry, don't leave it sitting in the buffer
+
+    # Queue for Supabase; the drainer uploads it (and retries while offline)
+    if outbox:
+        outbox.enqueue([payload])
+
+@app.get("/api/metrics")
+async def get_metrics():
+    """Per-endpoint latency (ms) and worker pool usage."""
+    snapshot = metrics.snapshot()
+    snapshot["outbox"] = await run_blocking(outbox.stats) if outbox else None
+    return snapshot
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
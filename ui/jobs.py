@@ -0,0 +1,346 @@
+"""
+Scrape jobs run by the UI server.
+
+Every "Run scraper" trigger becomes a job in an in-process queue instead of a detached
+`main.py --ui-mode`. One worker thread runs the queued jobs one at a time as tracked child
+processes (stdout/stderr go to logs/scrape_jobs/<id>.log), so the server always knows whether
+a scan is alive. Triggers that ask for work already queued or running are coalesced into the
+existing job. Jobs can be cancelled, and a scan whose process died or stopped reporting progress
+is marked stale and closed in the progress log, so the UI never stays stuck on "running".
+The job history is kept in data/scrape_jobs.json.
+"""
+
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+
+logger = logging.getLogger("scrape_jobs")
+
+ACTIVE = ("queued", "running")
+
+
+def _pid_alive(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _signal_group(pid, sig, fallback=True):
+    """
+    Signals a scan's process group: main.py runs in its own session, and its Playwright browsers
+    share it. Scans started before that (not group leaders) get the signal on their pid alone.
+    """
+    try:
+        os.killpg(pid, sig)
+    except ProcessLookupError:
+        if fallback:
+            try:
+                os.kill(pid, sig)
+            except ProcessLookupError:
+                pass
+
+
+class ScrapeJobManager:
+    """Queue, worker thread and history for main.py --ui-mode scans."""
+
+    def __init__(self, main_script, progress_log, history_path, log_dir,
+                 max_history=50, poll_interval=1.0, stale_after=900, kill_timeout=30):
+        self.main_script = main_script
+        self.progress_log = progress_log
+        self.history_path = history_path
+        self.log_dir = log_dir
+        self.max_history = max_history
+        self.poll_interval = poll_interval
+        # A scan that appends no progress event for this long is considered hung
+        self.stale_after = stale_after
+        # Grace period after SIGTERM (main.py drains its storage queues) before SIGKILL
+        self.kill_timeout = kill_timeout
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._jobs = []  # oldest first
+        self._cancel = set()
+        self._stopping = False
+        self._thread = None
+        self._load()
+
+    # ── History ───────────────────────────────────────────────
+    def _load(self):
+        if os.path.exists(self.history_path):
+            try:
+                with open(self.history_path, "r") as f:
+                    self._jobs = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not read job history, starting empty: {e}")
+                self._jobs = []
+
+    def _save(self):
+        # Called with the lock held; temp file + rename so a crash never leaves half a file
+        finished = [j for j in self._jobs if j["status"] not in ACTIVE]
+        keep = {j["id"] for j in finished[-self.max_history:]} | {j["id"] for j in self._jobs if j["status"] in ACTIVE}
+        self._jobs = [j for j in self._jobs if j["id"] in keep]
+        directory = os.path.dirname(os.path.abspath(self.history_path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".scrape_jobs-", suffix=".json.tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(self._jobs, f, indent=2)
+            os.replace(tmp_path, self.history_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _finish(self, job, status, returncode=None, error=None):
+        # Called with the lock held
+        job.update(status=status, returncode=returncode, error=error,
+                   finished_at=datetime.now().isoformat(timespec="seconds"))
+        self._cancel.discard(job["id"])
+        self._save()
+
+    # ── Public API ────────────────────────────────────────────
+    def enqueue(self, stores=None):
+        """
+        Queues a scan of `stores` (None: every enabled store). Returns (job, created): if a queued
+        or running job already covers those stores, that job is returned instead of a new one.
+        """
+        stores = sorted(set(stores)) if stores else None
+        with self._lock:
+            for job in self._jobs:
+                if job["status"] in ACTIVE and job["id"] not in self._cancel and self._covers(job, stores):
+                    return dict(job), False
+            job = {
+                "id": uuid.uuid4().hex[:12],
+                "stores": stores,
+                "status": "queued",
+                "created_at": datetime.now().isoformat(timespec="seconds"),
+                "started_at": None,
+                "finished_at": None,
+                "pid": None,
+                "returncode": None,
+                "error": None,
+                "summary": None,
+            }
+            job["log_path"] = os.path.join(self.log_dir, f"{job['id']}.log")
+            if not any(j["status"] in ACTIVE for j in self._jobs):
+                # Starts right away: open the run now so progress subscribers don't see the previous one
+                self.progress_log.begin()
+            self._jobs.append(job)
+            self._save()
+            self._wakeup.notify_all()
+            return dict(job), True
+
+    @staticmethod
+    def _covers(job, stores):
+        # A queued/running full scan covers everything; a partial one only the same or fewer stores
+        if job["stores"] is None:
+            return True
+        return stores is not None and set(stores) <= set(job["stores"])
+
+    def cancel(self, job_id):
+        """Cancels a queued job or stops a running one. Raises KeyError if unknown."""
+        with self._lock:
+            job = self._find(job_id)
+            if job["status"] == "queued":
+                self._finish(job, "cancelled")
+                if not any(j["status"] == "running" for j in self._jobs):
+                    self._close_progress("cancelled")
+            elif job["status"] == "running":
+                # The worker terminates the process on its next poll
+                self._cancel.add(job_id)
+                self._wakeup.notify_all()
+            return dict(job)
+
+    def _find(self, job_id):
+        for job in self._jobs:
+            if job["id"] == job_id:
+                return job
+        raise KeyError(job_id)
+
+    def get(self, job_id):
+        with self._lock:
+            return dict(self._find(job_id))
+
+    def jobs(self, limit=None):
+        """Job history, newest first."""
+        with self._lock:
+            jobs = [dict(j) for j in reversed(self._jobs)]
+        return jobs[:limit] if limit else jobs
+
+    def current(self):
+        with self._lock:
+            for job in self._jobs:
+                if job["status"] == "running":
+                    return dict(job)
+        return None
+
+    # ── Worker ────────────────────────────────────────────────
+    def start(self):
+        if self._thread is None:
+            self._stopping = False
+            self._recover()
+            self._thread = threading.Thread(target=self._run, name="scrape-jobs", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5):
+        """Stops the worker. A running scan keeps going and is picked up again by the next start()."""
+        with self._lock:
+            self._stopping = True
+            self._wakeup.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _recover(self):
+        """Jobs left 'running' by a previous server: adopt them if the process lives, else mark them stale."""
+        with self._lock:
+            for job in self._jobs:
+                if job["status"] == "running" and not _pid_alive(job["pid"]):
+                    self._finish(job, "stale", error="Scan process is gone (server restarted)")
+                    self._close_progress("stale")
+
+    def _next_job(self):
+        # Called with the lock held
+        for job in self._jobs:
+            if job["status"] == "running":
+                return job
+        for job in self._jobs:
+            if job["status"] == "queued":
+                return job
+        return None
+
+    def _run(self):
+        while True:
+            with self._lock:
+                job = self._next_job()
+                while job is None and not self._stopping:
+                    self._wakeup.wait()
+                    job = self._next_job()
+                if self._stopping:
+                    return
+            try:
+                if job["status"] == "running":
+                    self._watch_adopted(job)
+                else:
+                    self._execute(job)
+            except Exception as e:
+                logger.error(f"Scrape job {job['id']} failed: {e}")
+                with self._lock:
+                    if job["status"] in ACTIVE:
+                        self._finish(job, "failed", error=str(e))
+                self._close_progress("failed", str(e))
+
+    def _command(self, job):
+        cmd = [sys.executable, self.main_script, "--ui-mode"]
+        if job["stores"]:
+            cmd += ["--stores", ",".join(job["stores"])]
+        return cmd
+
+    def _execute(self, job):
+        os.makedirs(self.log_dir, exist_ok=True)
+        with self._lock:
+            if job["status"] != "queued":
+                return  # cancelled while the worker was picking it up
+            if self.progress_log.state().get("status") != "running":
+                self.progress_log.begin()
+            with open(job["log_path"], "ab") as log_file:
+                # Own session/process group, so stopping the scan also reaches its browsers
+                process = subprocess.Popen(self._command(job), stdout=log_file, stderr=subprocess.STDOUT,
+                                           cwd=os.path.dirname(self.main_script), start_new_session=True)
+            job.update(status="running", pid=process.pid, started_at=datetime.now().isoformat(timespec="seconds"))
+            self._save()
+        logger.info(f"Scrape job {job['id']} started (pid {process.pid}, stores: {job['stores'] or 'all'})")
+
+        status, error = self._supervise(job, process.poll, lambda: _signal_group(process.pid, signal.SIGTERM),
+                                        lambda: _signal_group(process.pid, signal.SIGKILL), process.wait)
+        if status != "running":
+            # Browsers main.py left behind (e.g. it was killed); never a stray pid, only the group
+            _signal_group(process.pid, signal.SIGKILL, fallback=False)
+        returncode = process.returncode
+        if status is None:
+            status = "succeeded" if returncode == 0 else "failed"
+            error = None if returncode == 0 else f"main.py exited with code {returncode}"
+        self._complete(job, status, returncode, error)
+
+    def _watch_adopted(self, job):
+        """Follows a scan started by a previous server process; only its pid is known."""
+        pid = job["pid"]
+
+        def poll():
+            return None if _pid_alive(pid) else -1
+
+        def sender(sig):
+            return lambda: _signal_group(pid, sig)
+
+        def wait(timeout=None):
+            deadline = time.monotonic() + (timeout or 0)
+            while _pid_alive(pid) and time.monotonic() < deadline:
+                time.sleep(0.2)
+
+        status, error = self._supervise(job, poll, sender(signal.SIGTERM), sender(signal.SIGKILL), wait)
+        if status is None:
+            # Exit code unknown; the progress log tells whether the run got to the end
+            finished = self.progress_log.state().get("status") == "completed"
+            status, error = ("succeeded", None) if finished else ("stale", "Scan process exited before completing")
+        self._complete(job, status, None, error)
+
+    def _supervise(self, job, poll, terminate, kill, wait):
+        """Waits for the process; returns (status, error) if it had to be stopped, else (None, None)."""
+        while poll() is None:
+            with self._lock:
+                if self._stopping:
+                    return "running", None
+                if job["id"] not in self._cancel:
+                    self._wakeup.wait(self.poll_interval)
+                cancelled = job["id"] in self._cancel
+            if cancelled:
+                reason = ("cancelled", None)
+            elif self._idle_seconds() > self.stale_after:
+                reason = ("stale", f"No progress for {self.stale_after}s")
+            else:
+                continue
+            logger.warning(f"Stopping scrape job {job['id']}: {reason[0]}")
+            terminate()
+            try:
+                wait(timeout=self.kill_timeout)
+            except subprocess.TimeoutExpired:
+                kill()
+                wait(timeout=self.kill_timeout)
+            if poll() is None:
+                kill()
+            return reason
+        return None, None
+
+    def _idle_seconds(self):
+        try:
+            return time.time() - os.path.getmtime(self.progress_log.path)
+        except OSError:
+            return 0
+
+    def _complete(self, job, status, returncode, error):
+        if status == "running":
+            return  # server shutting down; the next start() adopts the scan
+        summary = self.progress_log.state()
+        with self._lock:
+            job["summary"] = {k: summary.get(k) for k in ("progress", "total", "succeeded", "failed", "blocked")}
+            self._finish(job, status, returncode, error)
+        self._close_progress(status, error)
+        logger.info(f"Scrape job {job['id']} {status}" + (f": {error}" if error else ""))
+
+    def _close_progress(self, status, error=None):
+        # main.py writes run_completed itself on success; close the run for every other ending
+        if self.progress_log.state().get("status") == "running":
+            self.progress_log.emit("run_completed", status=status, error=error)
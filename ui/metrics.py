@@ -0,0 +1,93 @@
+import functools
+import os
+import threading
+import time
+from collections import deque
+
+import anyio
+import anyio.to_thread
+
+# Blocking work (SQLite, JSON files, subprocesses) is pushed to worker threads so the event loop
+# keeps serving other requests (e.g. status polling); the limiter bounds how many run at once.
+BLOCKING_THREADS = int(os.getenv("UI_BLOCKING_THREADS", 8))
+_limiter = None
+
+
+def _get_limiter():
+    global _limiter
+    # Created lazily: the limiter has to be built inside the running event loop
+    if _limiter is None:
+        _limiter = anyio.CapacityLimiter(BLOCKING_THREADS)
+    return _limiter
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Runs a synchronous callable on the bounded worker pool and returns its result."""
+    return await anyio.to_thread.run_sync(functools.partial(func, *args, **kwargs), limiter=_get_limiter())
+
+
+class LatencyMetrics:
+    """Per-endpoint request counts, errors and latency percentiles over the last `window` calls."""
+
+    def __init__(self, window=500):
+        self.window = window
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def record(self, route, seconds, status_code):
+        with self._lock:
+            entry = self._routes.get(route)
+            if entry is None:
+                entry = {"count": 0, "errors": 0, "total": 0.0, "max": 0.0, "recent": deque(maxlen=self.window)}
+                self._routes[route] = entry
+            entry["count"] += 1
+            entry["errors"] += status_code >= 500
+            entry["total"] += seconds
+            entry["max"] = max(entry["max"], seconds)
+            entry["recent"].append(seconds)
+
+    @staticmethod
+    def _percentile(values, pct):
+        if not values:
+            return 0.0
+        return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+    def snapshot(self):
+        """Latencies in milliseconds, slowest p95 first."""
+        with self._lock:
+            routes = {route: (dict(entry), sorted(entry["recent"])) for route, entry in self._routes.items()}
+        result = {}
+        for route, (entry, recent) in routes.items():
+            result[route] = {
+                "count": entry["count"],
+                "errors": entry["errors"],
+                "avg_ms": round(entry["total"] / entry["count"] * 1000, 2),
+                "p50_ms": round(self._percentile(recent, 50) * 1000, 2),
+                "p95_ms": round(self._percentile(recent, 95) * 1000, 2),
+                "max_ms": round(entry["max"] * 1000, 2),
+            }
+        limiter = _get_limiter()
+        return {
+            "endpoints": dict(sorted(result.items(), key=lambda item: item[1]["p95_ms"], reverse=True)),
+            "workers": {"busy": limiter.borrowed_tokens, "total": limiter.total_tokens},
+        }
+
+
+def install(app, metrics):
+    """Adds a middleware that records the latency of every request under its route template."""
+
+    @app.middleware("http")
+    async def record_latency(request, call_next):
+        start = time.perf_counter()
+        status_code = 500
+        try:
+            response = await call_next(request)
+            status_code = response.status_code
+            return response
+        finally:
+            # The matched route (e.g. /api/products/{product_id}) keeps the metric count bounded
+            route = request.scope.get("route")
+            path = getattr(route, "path", None)
+            if path is None:
+                path = "/static" if request.url.path.startswith("/static/") else "unmatched"
+            metrics.record(f"{request.method} {path}", time.perf_counter() - start, status_code)
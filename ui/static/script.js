@@ -20,16 +20,31 @@ document.addEventListener('DOMContentLoaded', () => {
     const headerTitle = document.getElementById('mainTitle');
     const headerDesc = document.getElementById('mainDesc');
     const btnAddProduct = document.getElementById('btnAddProduct');
+    const btnImportProducts = document.getElementById('btnImportProducts');
+    const importFile = document.getElementById('importFile');
 
     // History & Tracker Elements
     const historyTableBody = document.getElementById('historyTableBody');
     const historyTableHeader = document.getElementById('historyTableHeader');
+    const historyTableTitle = document.getElementById('historyTableTitle');
+    const historyRange = document.getElementById('historyRange');
+    const historyScroll = document.getElementById('historyScroll');
     const btnRunScraper = document.getElementById('btnRunScraper');
     const scraperTracker = document.getElementById('scraperTracker');
     const trackerMessage = document.getElementById('trackerMessage');
     const trackerProgressFill = document.getElementById('trackerProgressFill');
     const trackerStats = document.getElementById('trackerStats');
-    let trackingIntervalName = null;
+    let trackingSource = null;
+    let trackerState = null;
+
+    // Virtualized history table: only the rows/date columns inside the scroll viewport are in the DOM
+    const HISTORY_ROW_HEIGHT = 40;
+    const HISTORY_COL_WIDTH = 110;
+    const HISTORY_FIXED_WIDTHS = [150, 230];
+    const HISTORY_OVERSCAN = 6;
+    const HISTORY_PAGE_SIZE = 200;
+    let historyState = null;
+    let historyRenderQueued = false;
 
     // Forms & Inputs
     const productForm = document.getElementById('productForm');
@@ -128,6 +143,50 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    function describeDiff(diff) {
+        const parts = [];
+        if (diff.added.length) parts.push(`${diff.added.length} added`);
+        if (Object.keys(diff.updated).length) parts.push(`${Object.keys(diff.updated).length} updated`);
+        if (diff.removed.length) parts.push(`${diff.removed.length} removed`);
+        return parts.length ? parts.join(', ') : 'No changes';
+    }
+
+    async function bulkRequest(url, options) {
+        const res = await fetch(url, options);
+        const data = await res.json();
+        if (!res.ok) throw new Error(data.detail || 'Bulk update failed');
+        return data;
+    }
+
+    async function bulkSetStoreActive(store, active) {
+        try {
+            const diff = await bulkRequest('/api/products/bulk/active', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ active, stores: [store] })
+            });
+            showToast(`${describeDiff(diff)} (${active ? 'activated' : 'paused'})`);
+            fetchProducts();
+        } catch (error) {
+            showToast(error.message, 'error');
+        }
+    }
+
+    async function importProducts(file) {
+        try {
+            const format = file.name.toLowerCase().endsWith('.csv') ? 'csv' : 'json';
+            const diff = await bulkRequest(`/api/products/bulk/import?format=${format}`, {
+                method: 'POST',
+                headers: { 'Content-Type': format === 'csv' ? 'text/csv' : 'application/json' },
+                body: await file.text()
+            });
+            showToast(`Import: ${describeDiff(diff)}`);
+            fetchProducts();
+        } catch (error) {
+            showToast(error.message, 'error');
+        }
+    }
+
     async function deleteProduct(id) {
         try {
             const res = await fetch(`/api/products/${id}`, { method: 'DELETE' });
@@ -206,7 +265,6 @@ document.addEventListener('DOMContentLoaded', () => {
         });
 
         const navHistorySubmenu = document.getElementById('navHistorySubmenu');
-        const historyTableTitle = document.getElementById('historyTableTitle');
         const btnExportCsv = document.getElementById('btnExportCsv');
 
         navHistory.addEventListener('click', (e) => {
@@ -233,11 +291,15 @@ document.addEventListener('DOMContentLoaded', () => {
                 updateActiveNav(navHistory);
 
                 const type = item.getAttribute('data-history-type');
-                historyTableTitle.textContent = type === 'active' ? '7-Day Price History (Active)' : 'All Time Price History';
+                historyRange.value = type === 'active' ? '7d' : 'all';
                 fetchHistory(type);
             });
         });
 
+        historyRange.addEventListener('change', () => {
+            fetchHistory(currentHistoryType());
+        });
+
         btnExportCsv.addEventListener('click', exportCsv);
 
         settingsForm.addEventListener('submit', saveSettings);
@@ -254,6 +316,7 @@ document.addEventListener('DOMContentLoaded', () => {
             headerTitle.textContent = 'Product Management';
             headerDesc.textContent = 'Manage retail URLs and scraping configurations';
             btnAddProduct.style.display = 'inline-flex';
+            btnImportProducts.style.display = 'inline-flex';
         } else if (viewName === 'settings') {
             productsView.style.display = 'none';
             settingsView.style.display = 'block';
@@ -262,14 +325,16 @@ document.addEventListener('DOMContentLoaded', () => {
             headerTitle.textContent = 'Settings';
             headerDesc.textContent = 'Configure global tracker behaviors';
             btnAddProduct.style.display = 'none';
+            btnImportProducts.style.display = 'none';
         } else if (viewName === 'history') {
             productsView.style.display = 'none';
             settingsView.style.display = 'none';
             historyView.style.display = 'block';
             statsContainer.style.display = 'none';
             headerTitle.textContent = 'Historical Data';
-            headerDesc.textContent = 'View price trends over the last 7 recorded days';
+            headerDesc.textContent = 'View price trends over the selected range';
             btnAddProduct.style.display = 'none';
+            btnImportProducts.style.display = 'none';
         }
     }
 
@@ -397,6 +462,10 @@ document.addEventListener('DOMContentLoaded', () => {
                     <span style="color: var(--brand-${store})"><i class="fa-solid fa-store"></i></span>
                     ${storeNames[store] || store}
                     <span class="badge">${activeCount} / ${storeProducts.length}</span>
+                    <span class="store-bulk-actions">
+                        <button class="btn-icon" onclick="window.bulkSetStoreActive('${store}', true)" title="Activate all"><i class="fa-solid fa-play"></i></button>
+                        <button class="btn-icon pause" onclick="window.bulkSetStoreActive('${store}', false)" title="Pause all"><i class="fa-solid fa-pause"></i></button>
+                    </span>
                 </div>
                 <div style="overflow-x: auto;">
                     <table>
@@ -492,6 +561,13 @@ document.addEventListener('DOMContentLoaded', () => {
         openModal(productModal);
     });
 
+    // Bulk import: one catalog write for the whole CSV/JSON file
+    btnImportProducts.addEventListener('click', () => importFile.click());
+    importFile.addEventListener('change', () => {
+        if (importFile.files.length) importProducts(importFile.files[0]);
+        importFile.value = '';
+    });
+
     document.getElementById('btnCloseModal').addEventListener('click', () => closeModal(productModal));
     document.getElementById('btnCancelModal').addEventListener('click', () => closeModal(productModal));
 
@@ -541,6 +617,7 @@ document.addEventListener('DOMContentLoaded', () => {
     };
 
     window.toggleProduct = (id, currentStatus) => toggleActiveStatus(id, currentStatus);
+    window.bulkSetStoreActive = (store, active) => bulkSetStoreActive(store, active);
 
     window.confirmDelete = (id, name) => {
         deleteProductId.value = id;
@@ -644,35 +721,121 @@ document.addEventListener('DOMContentLoaded', () => {
     }
 
     // --- History & Scraper Execution ---
-    async function fetchHistory(type = 'active') {
-        try {
-            historyTableBody.innerHTML = '<tr><td colspan="9" style="text-align:center">Loading history...</td></tr>';
+    function currentHistoryType() {
+        const active = document.querySelector('#navHistorySubmenu .submenu-item.active');
+        return active ? active.getAttribute('data-history-type') : 'active';
+    }
 
-            const days = type === 'all' ? 0 : 7;
-            const activeOnly = type === 'all' ? 'false' : 'true';
+    async function fetchHistory(type = currentHistoryType()) {
+        const range = historyRange.value;
+        const activeOnly = type === 'all' ? 'false' : 'true';
+        const rangeLabel = historyRange.options[historyRange.selectedIndex].text;
+        historyTableTitle.textContent = `Price History: ${rangeLabel}${type === 'active' ? ' (Active)' : ''}`;
+
+        // A new fetch replaces the state object, so pages still in flight for an older one are ignored
+        historyState = { type, range, activeOnly, items: [], dates: [], dateSet: new Set(), cursor: null, done: false, loading: false, error: false, scrolledToEnd: false };
+        historyScroll.scrollTop = 0;
+        renderHistoryTable();
+        await loadMoreHistory();
+    }
 
-            const res = await fetch(`/api/history?days=${days}&active_only=${activeOnly}`);
-            const data = await res.json();
-            renderHistoryTable(data, type);
+    async function loadMoreHistory() {
+        const state = historyState;
+        if (!state || state.loading || state.done) return;
+        state.loading = true;
+        try {
+            const params = new URLSearchParams({ range: state.range, active_only: state.activeOnly, limit: HISTORY_PAGE_SIZE });
+            if (state.cursor) params.set('cursor', state.cursor);
+            // Unchanged pages come back as 304s from the browser cache (ETag)
+            const res = await fetch(`/api/history?${params}`);
+            if (!res.ok) throw new Error('Failed to load history');
+            const page = await res.json();
+            if (state !== historyState) return;
+
+            page.items.forEach(item => {
+                prepareHistoryItem(item);
+                item.dates.forEach(d => {
+                    if (!state.dateSet.has(d)) {
+                        state.dateSet.add(d);
+                        state.dates.push(d);
+                    }
+                });
+            });
+            state.dates.sort();
+            state.items.push(...page.items);
+            state.cursor = page.next_cursor;
+            state.done = !page.next_cursor;
         } catch (error) {
-            historyTableBody.innerHTML = '<tr><td colspan="9" style="text-align:center;color:var(--accent-warning);">Failed to load history data</td></tr>';
+            state.error = true;
+            state.done = true;
+        } finally {
+            state.loading = false;
+        }
+        if (state !== historyState) return;
+        renderHistoryTable();
+        // Keep fetching while the loaded rows don't fill the viewport yet
+        if (!state.done && historyRowsNeeded() > state.items.length) {
+            loadMoreHistory();
         }
     }
 
-    function renderHistoryTable(data, type) {
-        // Collect all distinct dates from the dataset
-        const allDatesSet = new Set();
-        data.forEach(item => {
-            Object.keys(item.history || {}).forEach(d => allDatesSet.add(d));
+    // Price + trend per date, computed once per product instead of on every render
+    function prepareHistoryItem(item) {
+        item.dates = Object.keys(item.history || {}).sort();
+        item.trends = {};
+        let previousPrice = null;
+        item.dates.forEach(d => {
+            const price = item.history[d];
+            if (price === null || price === undefined) return;
+            // Gaps don't reset the baseline: compare with the last day that had a price
+            if (previousPrice !== null) {
+                item.trends[d] = price > previousPrice ? 'up' : price < previousPrice ? 'down' : 'flat';
+            }
+            previousPrice = price;
         });
+    }
 
-        // Sort dates chronologically
-        let dates = Array.from(allDatesSet).sort();
-
-        // If it's active type, cap at 7 just in case backend ignores it visually
-        if (type === 'active') {
-            dates = dates.slice(-7);
+    function historyVisibleDates() {
+        // The 7-day view shows at most 7 columns, even if the range spans 8 calendar dates
+        if (historyState.type === 'active' && historyState.range === '7d') {
+            return historyState.dates.slice(-7);
         }
+        return historyState.dates;
+    }
+
+    function historyRowsNeeded() {
+        const lastVisible = Math.ceil((historyScroll.scrollTop + historyScroll.clientHeight) / HISTORY_ROW_HEIGHT);
+        return lastVisible + HISTORY_OVERSCAN * 4;
+    }
+
+    function scheduleHistoryRender() {
+        if (historyRenderQueued) return;
+        historyRenderQueued = true;
+        requestAnimationFrame(() => {
+            historyRenderQueued = false;
+            if (!historyState) return;
+            renderHistoryTable();
+            if (!historyState.done && historyRowsNeeded() > historyState.items.length) {
+                loadMoreHistory();
+            }
+        });
+    }
+
+    historyScroll.addEventListener('scroll', scheduleHistoryRender);
+    window.addEventListener('resize', scheduleHistoryRender);
+
+    function historyCell(tag, width, className) {
+        const cell = document.createElement(tag);
+        cell.style.width = `${width}px`;
+        cell.style.minWidth = `${width}px`;
+        cell.style.maxWidth = `${width}px`;
+        if (className) cell.className = className;
+        return cell;
+    }
+
+    function renderHistoryTable() {
+        const state = historyState;
+        const dates = historyVisibleDates();
 
         // Helper to format ISO date (YYYY-MM-DD) to DD/MM
         const formatDate = (iso) => {
@@ -684,119 +847,126 @@ document.addEventListener('DOMContentLoaded', () => {
             return iso;
         };
 
+        // Visible window: rows from the vertical scroll, date columns from the horizontal one
+        const fixedWidth = HISTORY_FIXED_WIDTHS[0] + HISTORY_FIXED_WIDTHS[1];
+        const viewWidth = historyScroll.clientWidth || 800;
+        const viewHeight = historyScroll.clientHeight || 600;
+        const scrollLeft = Math.max(historyScroll.scrollLeft, 0);
+        const firstCol = Math.max(0, Math.floor(scrollLeft / HISTORY_COL_WIDTH) - HISTORY_OVERSCAN);
+        const lastCol = Math.min(dates.length, Math.ceil((scrollLeft + viewWidth - fixedWidth) / HISTORY_COL_WIDTH) + HISTORY_OVERSCAN);
+        const firstRow = Math.max(0, Math.floor(historyScroll.scrollTop / HISTORY_ROW_HEIGHT) - HISTORY_OVERSCAN);
+        const lastRow = Math.min(state.items.length, Math.ceil((historyScroll.scrollTop + viewHeight) / HISTORY_ROW_HEIGHT) + HISTORY_OVERSCAN);
+        const leftPad = firstCol * HISTORY_COL_WIDTH;
+        const rightPad = (dates.length - lastCol) * HISTORY_COL_WIDTH;
+        const visibleDates = dates.slice(firstCol, lastCol);
+
         // Render header
-        historyTableHeader.innerHTML = `
-            <th>Store</th>
-            <th>Product Name</th>
-        `;
-        dates.forEach(d => {
-            const th = document.createElement('th');
+        historyTableHeader.innerHTML = '';
+        ['Store', 'Product Name'].forEach((label, i) => {
+            const th = historyCell('th', HISTORY_FIXED_WIDTHS[i], `history-fixed-col history-fixed-col-${i}`);
+            th.textContent = label;
+            historyTableHeader.appendChild(th);
+        });
+        if (leftPad) historyTableHeader.appendChild(historyCell('th', leftPad, 'history-spacer'));
+        visibleDates.forEach(d => {
+            const th = historyCell('th', HISTORY_COL_WIDTH);
             th.textContent = formatDate(d); // Display formatted date
-            th.setAttribute('data-full-date', d); // Keep raw date for CSV
+            th.title = d;
             historyTableHeader.appendChild(th);
         });
+        if (rightPad) historyTableHeader.appendChild(historyCell('th', rightPad, 'history-spacer'));
 
         // Render body
         historyTableBody.innerHTML = '';
-        if (data.length === 0) {
-            historyTableBody.innerHTML = `<tr><td colspan="${dates.length + 2}" style="text-align:center">No historical data available.</td></tr>`;
+        const columnCount = 2 + visibleDates.length + (leftPad ? 1 : 0) + (rightPad ? 1 : 0);
+        if (state.items.length === 0) {
+            const message = state.error ? 'Failed to load history data' : state.done ? 'No historical data available.' : 'Loading history...';
+            const color = state.error ? 'color:var(--accent-warning);' : '';
+            historyTableBody.innerHTML = `<tr><td colspan="${columnCount}" style="text-align:center;${color}">${message}</td></tr>`;
             return;
         }
 
-        data.forEach(item => {
+        const spacerRow = (height) => {
+            const tr = document.createElement('tr');
+            tr.className = 'history-spacer-row';
+            const td = document.createElement('td');
+            td.colSpan = columnCount;
+            td.style.height = `${height}px`;
+            tr.appendChild(td);
+            return tr;
+        };
+
+        if (firstRow > 0) historyTableBody.appendChild(spacerRow(firstRow * HISTORY_ROW_HEIGHT));
+
+        state.items.slice(firstRow, lastRow).forEach(item => {
             const tr = document.createElement('tr');
+            tr.style.height = `${HISTORY_ROW_HEIGHT}px`;
 
             // Store badge
-            const tdStore = document.createElement('td');
+            const tdStore = historyCell('td', HISTORY_FIXED_WIDTHS[0], 'history-fixed-col history-fixed-col-0');
             const storeName = storeNames[item.store] || item.store;
             tdStore.innerHTML = `<span class="badge" style="background-color: var(--bg-hover); color: var(--brand-${item.store})"><i class="fa-solid fa-store"></i> ${storeName}</span>`;
             tr.appendChild(tdStore);
 
             // Product name
-            const tdName = document.createElement('td');
-            tdName.className = 'history-product-name';
-            tdName.textContent = item.name;
-            tdName.title = item.name; // Full name on hover
+            const tdName = historyCell('td', HISTORY_FIXED_WIDTHS[1], 'history-fixed-col history-fixed-col-1');
+            const nameSpan = document.createElement('span');
+            nameSpan.className = 'history-product-name';
+            nameSpan.textContent = item.name;
+            nameSpan.title = item.name; // Full name on hover
+            tdName.appendChild(nameSpan);
             tr.appendChild(tdName);
 
+            if (leftPad) tr.appendChild(historyCell('td', leftPad, 'history-spacer'));
+
             // History columns + Trends
-            let previousPrice = null;
-            dates.forEach((d, index) => {
-                const td = document.createElement('td');
+            const unitSuffix = item.unit && item.unit !== 'each' ? `/${item.unit}` : '';
+            visibleDates.forEach(d => {
+                const td = historyCell('td', HISTORY_COL_WIDTH);
                 const price = item.history[d];
 
-                if (price !== undefined) {
+                if (price !== undefined && price !== null) {
                     td.className = 'price-cell';
-                    let trendHTML = '';
-
-                    if (previousPrice !== null) {
-                        if (price > previousPrice) {
-                            trendHTML = `<i class="fa-solid fa-arrow-up trend-icon trend-up"></i>`;
-                        } else if (price < previousPrice) {
-                            trendHTML = `<i class="fa-solid fa-arrow-down trend-icon trend-down"></i>`;
-                        } else {
-                            trendHTML = `<i class="fa-solid fa-minus trend-icon trend-flat"></i>`;
-                        }
-                    } else if (index > 0) {
-                        // Found a price but the previous registered was null.
-                        // We cannot establish a trend here cleanly since we have a gap.
-                        trendHTML = '';
-                    }
-
-                    const unitSuffix = item.unit && item.unit !== 'each' ? `/${item.unit}` : '';
+                    const trend = item.trends[d];
+                    const trendHTML = trend === 'up' ? `<i class="fa-solid fa-arrow-up trend-icon trend-up"></i>`
+                        : trend === 'down' ? `<i class="fa-solid fa-arrow-down trend-icon trend-down"></i>`
+                        : trend === 'flat' ? `<i class="fa-solid fa-minus trend-icon trend-flat"></i>` : '';
                     td.innerHTML = `$${price.toFixed(2)}${unitSuffix}${trendHTML}`;
-                    previousPrice = price; // Update previous valid price
                 } else {
                     td.className = 'price-cell empty';
                     td.textContent = '-';
-                    // We don't reset previous price here, if it was 4.99 the day before, it remains the baseline for the next valid day.
                 }
                 tr.appendChild(td);
             });
 
+            if (rightPad) tr.appendChild(historyCell('td', rightPad, 'history-spacer'));
             historyTableBody.appendChild(tr);
         });
-    }
 
-    function exportCsv() {
-        const table = document.getElementById('historyTable');
-        if (!table) return;
-
-        let csv = [];
-        const rows = table.querySelectorAll('tr');
-
-        for (let i = 0; i < rows.length; i++) {
-            let row = [], cols = rows[i].querySelectorAll('td, th');
-
-            for (let j = 0; j < cols.length; j++) {
-                // If it's a header with a full date, use that instead of the short format
-                let data = cols[j].getAttribute('data-full-date') || cols[j].innerText;
-                // Clean up any trend icons/text formats
-                data = data.replace(/[↑↓\-]/g, '').trim();
-                // Escape quotes and wrap in quotes to preserve spaces/commas safely
-                data = data.replace(/"/g, '""');
-                row.push('"' + data + '"');
-            }
-            csv.push(row.join(','));
-        }
+        const below = state.items.length - lastRow;
+        if (below > 0) historyTableBody.appendChild(spacerRow(below * HISTORY_ROW_HEIGHT));
 
-        const csvString = csv.join('\\n');
-        const defaultFilename = 'price_history_export.csv';
-
-        // Trigger Download
-        const blob = new Blob([csvString], { type: 'text/csv;charset=utf-8;' });
-        const link = document.createElement("a");
-        if (link.download !== undefined) {
-            const url = URL.createObjectURL(blob);
-            link.setAttribute("href", url);
-            link.setAttribute("download", defaultFilename);
-            link.style.visibility = 'hidden';
-            document.body.appendChild(link);
-            link.click();
-            document.body.removeChild(link);
+        // Long ranges open on the most recent dates, like the 7-day view
+        if (!state.scrolledToEnd && dates.length) {
+            state.scrolledToEnd = true;
+            historyScroll.scrollLeft = historyScroll.scrollWidth;
+            scheduleHistoryRender();
         }
     }
 
+    function exportCsv() {
+        // Streamed by the server, so exporting never depends on what the table has loaded
+        const type = currentHistoryType();
+        const params = new URLSearchParams({ range: historyRange.value, active_only: type === 'all' ? 'false' : 'true' });
+        const link = document.createElement('a');
+        link.href = `/api/history/export.csv?${params}`;
+        link.setAttribute('download', 'price_history_export.csv');
+        link.style.visibility = 'hidden';
+        document.body.appendChild(link);
+        link.click();
+        document.body.removeChild(link);
+    }
+
     async function startScraper() {
         btnRunScraper.disabled = true;
         try {
@@ -805,16 +975,15 @@ document.addEventListener('DOMContentLoaded', () => {
                 const err = await res.json();
                 throw new Error(err.detail || 'Failed to start scraper');
             }
-            showToast('Scraper started successfully');
+            const started = await res.json();
+            showToast(started.message || 'Scraper started successfully');
 
             // Show tracker UI
             scraperTracker.style.display = 'flex';
             btnRunScraper.style.display = 'none';
 
-            // Begin polling status
-            if (trackingIntervalName) clearInterval(trackingIntervalName);
-            pollScraperStatus();
-            trackingIntervalName = setInterval(pollScraperStatus, 2000);
+            // Subscribe to pushed progress events
+            trackScraperEvents();
 
         } catch (error) {
             showToast(error.message, 'error');
@@ -822,47 +991,104 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
-    async function pollScraperStatus() {
-        try {
-            const res = await fetch('/api/scrape/status');
-            const state = await res.json();
+    function trackScraperEvents() {
+        if (trackingSource) trackingSource.close();
+        trackingSource = new EventSource('/api/scrape/events');
 
-            if (state.status === 'idle' || state.status === 'error') {
-                // UI if it finished before opening or error immediately
-                if (trackingIntervalName) clearInterval(trackingIntervalName);
-                scraperTracker.style.display = 'none';
-                btnRunScraper.style.display = 'inline-flex';
-                btnRunScraper.disabled = false;
-                return;
-            }
+        // Full status on (re)connect, then one message per product event
+        trackingSource.addEventListener('state', (e) => {
+            trackerState = JSON.parse(e.data);
+            renderScraperState();
+        });
+        trackingSource.addEventListener('progress', (e) => {
+            if (!trackerState) return;
+            applyScraperEvent(trackerState, JSON.parse(e.data));
+            renderScraperState();
+        });
+        trackingSource.onerror = () => {
+            // EventSource reconnects by itself and receives a fresh snapshot
+            console.error('Scraper event stream interrupted, reconnecting...');
+        };
+    }
 
-            // Update UI
-            const percentage = state.total > 0 ? (state.progress / state.total) * 100 : 0;
-            trackerProgressFill.style.width = `${percentage}%`;
-            trackerStats.textContent = `${state.progress}/${state.total}`;
-            trackerMessage.textContent = state.current_product;
+    function stopTrackingScraper() {
+        if (trackingSource) trackingSource.close();
+        trackingSource = null;
+        trackerState = null;
+    }
 
-            if (state.status === 'running') {
-                trackerProgressFill.classList.add('running');
-            } else {
-                trackerProgressFill.classList.remove('running');
-                trackerMessage.textContent = 'Completed!';
-
-                // Allow user to close it or reset after a delay
-                if (trackingIntervalName) clearInterval(trackingIntervalName);
-                setTimeout(() => {
-                    scraperTracker.style.display = 'none';
-                    btnRunScraper.style.display = 'inline-flex';
-                    btnRunScraper.disabled = false;
-                    // Refresh history if we are on that view
-                    if (historyView.style.display === 'block') {
-                        fetchHistory();
-                    }
-                }, 3000);
+    // Same folding rules as ProgressLog.apply in utils/progress_log.py
+    function applyScraperEvent(state, event) {
+        switch (event.type) {
+            case 'run_requested':
+            case 'run_started':
+                if (event.type === 'run_requested' || state.status !== 'running' || state.total) {
+                    Object.assign(state, { progress: 0, completed_ids: [], succeeded: 0, failed: 0, blocked: 0 });
+                }
+                Object.assign(state, { status: 'running', total: event.total || 0, current_product: 'Initializing...' });
+                if (event.type === 'run_requested') state.run = event.run || null;
+                break;
+            case 'product_started':
+                state.current_product = event.name;
+                state.progress = event.index;
+                break;
+            case 'product_succeeded':
+            case 'product_blocked':
+            case 'product_failed': {
+                const outcome = event.type.split('_')[1];
+                state.progress += 1;
+                state[outcome] = (state[outcome] || 0) + 1;
+                if (outcome === 'succeeded') state.completed_ids.push(event.id);
+                break;
+            }
+            case 'run_completed': {
+                // main.py ends a run as completed; the job manager closes cancelled/failed/stale ones
+                const status = event.status || 'completed';
+                state.status = status;
+                state.current_product = status === 'completed' ? 'Done' : status.charAt(0).toUpperCase() + status.slice(1);
+                if (status === 'completed') state.progress = state.total;
+                if (event.error) state.error = event.error;
+                break;
             }
+        }
+        state.seq = event.seq;
+    }
 
-        } catch (error) {
-            console.error('Error polling status:', error);
+    function renderScraperState() {
+        const state = trackerState;
+
+        if (state.status === 'idle' || state.status === 'error') {
+            // UI if it finished before opening or error immediately
+            stopTrackingScraper();
+            scraperTracker.style.display = 'none';
+            btnRunScraper.style.display = 'inline-flex';
+            btnRunScraper.disabled = false;
+            return;
+        }
+
+        // Update UI
+        const percentage = state.total > 0 ? (state.progress / state.total) * 100 : 0;
+        trackerProgressFill.style.width = `${percentage}%`;
+        trackerStats.textContent = `${state.progress}/${state.total}`;
+        trackerMessage.textContent = state.current_product;
+
+        if (state.status === 'running') {
+            trackerProgressFill.classList.add('running');
+        } else {
+            trackerProgressFill.classList.remove('running');
+            trackerMessage.textContent = state.status === 'completed' ? 'Completed!' : state.current_product;
+
+            // Allow user to close it or reset after a delay
+            stopTrackingScraper();
+            setTimeout(() => {
+                scraperTracker.style.display = 'none';
+                btnRunScraper.style.display = 'inline-flex';
+                btnRunScraper.disabled = false;
+                // Refresh history if we are on that view
+                if (historyView.style.display === 'block') {
+                    fetchHistory();
+                }
+            }, 3000);
         }
     }
 });
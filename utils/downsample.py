@@ -0,0 +1,120 @@
+import numpy as np
+
+# Downsampling for price charts: reduce series to a point budget while keeping their visual
+# shape (spikes, drops, plateaus), which plain decimation loses.
+#
+# Series are passed as one matrix on a shared date grid (rows: days, columns: products; NaN
+# where a product has no price that day), so each step runs vectorized across every product
+# at once: the Python-level loop is over buckets, never over products or points.
+METHODS = ("lttb", "minmax")
+
+
+def _as_matrix(y):
+    y = np.asarray(y, dtype=np.float64)
+    return y[:, None] if y.ndim == 1 else y
+
+
+def _bucket_edges(start, stop, buckets):
+    """Start offsets of `buckets` equal-width buckets over [start, stop), plus `stop`."""
+    return np.floor(np.linspace(start, stop, buckets + 1)).astype(np.int64)
+
+
+def _ends(valid):
+    """Row of the first and the last valid value of each column (0 / n-1 for empty columns)."""
+    first = np.argmax(valid, axis=0)
+    last = valid.shape[0] - 1 - np.argmax(valid[::-1], axis=0)
+    return first, last
+
+
+def forward_fill(matrix: np.ndarray):
+    """Fills NaNs in each column with the last value above them."""
+    rows = np.arange(matrix.shape[0])[:, None]
+    last_valid = np.where(~np.isnan(matrix), rows, 0)
+    np.maximum.accumulate(last_valid, axis=0, out=last_valid)
+    return matrix[last_valid, np.arange(matrix.shape[1])]
+
+
+def lttb(x: np.ndarray, y, n_out: int):
+    """
+    Largest-Triangle-Three-Buckets. Keeps each column's first and last point and, from each of
+    the n_out - 2 buckets in between, the point forming the largest triangle with the previously
+    kept point and the average of the next bucket. Returns a boolean mask shaped like `y`.
+    """
+    Y = _as_matrix(y)
+    n, k = Y.shape
+    valid = ~np.isnan(Y)
+    if n_out >= n:
+        return valid.reshape(np.shape(y))
+    x = np.asarray(x, dtype=np.float64)
+    cols = np.arange(k)
+    keep = np.zeros_like(valid)
+    first, last = _ends(valid)
+    has_data = valid.any(axis=0)
+    keep[first[has_data], cols[has_data]] = True
+    keep[last[has_data], cols[has_data]] = True
+    if n_out < 3:
+        return keep.reshape(np.shape(y))
+
+    # Average point of every inner bucket, for all columns in one pass
+    edges = _bucket_edges(1, n - 1, n_out - 2)
+    inner = slice(1, n - 1)
+    counts = np.add.reduceat(valid[inner], edges[:-1] - 1, axis=0).astype(np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        avg_y = np.add.reduceat(np.where(valid[inner], Y[inner], 0.0), edges[:-1] - 1, axis=0) / counts
+        avg_x = np.add.reduceat(valid[inner] * x[inner, None], edges[:-1] - 1, axis=0) / counts
+    # The bucket after the last one is each column's final point; an empty bucket borrows the next average
+    avg_y = forward_fill(np.vstack([avg_y, Y[last, cols]])[::-1])[::-1]
+    avg_x = forward_fill(np.vstack([avg_x, x[last]])[::-1])[::-1]
+
+    ax, ay = x[first], Y[first, cols]
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        seg = Y[lo:hi]
+        # Twice the triangle area for every candidate, every column at once
+        area = np.abs((ax - avg_x[i + 1]) * (seg - ay) - (ax - x[lo:hi, None]) * (avg_y[i + 1] - ay))
+        area = np.where(valid[lo:hi] & ~np.isnan(area), area, -1.0)
+        pick = lo + np.argmax(area, axis=0)
+        found = valid[pick, cols]
+        keep[pick[found], cols[found]] = True
+        ax = np.where(found, x[pick], ax)
+        ay = np.where(found, Y[pick, cols], ay)
+    return keep.reshape(np.shape(y))
+
+
+def minmax(x: np.ndarray, y, n_out: int):
+    """
+    Min/max bucketing: splits the rows into n_out // 2 equal-width buckets and keeps the
+    lowest and highest point of each column in each bucket. Returns a boolean mask shaped like `y`.
+    """
+    Y = _as_matrix(y)
+    n, k = Y.shape
+    valid = ~np.isnan(Y)
+    buckets = n_out // 2
+    if n <= n_out or buckets < 1:
+        return valid.reshape(np.shape(y))
+    cols = np.arange(k)
+    keep = np.zeros_like(valid)
+    low = np.where(valid, Y, np.inf)
+    high = np.where(valid, Y, -np.inf)
+    edges = _bucket_edges(0, n, buckets)
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        for pick in (lo + np.argmin(low[lo:hi], axis=0), lo + np.argmax(high[lo:hi], axis=0)):
+            found = valid[pick, cols]
+            keep[pick[found], cols[found]] = True
+    return keep.reshape(np.shape(y))
+
+
+def downsample(x: np.ndarray, y, n_out: int, method: str = "lttb"):
+    """Boolean mask of the points to keep (at most ~n_out per column) with the chosen method."""
+    if method not in METHODS:
+        raise ValueError(f"Unknown method '{method}', expected one of {METHODS}")
+    return lttb(x, y, n_out) if method == "lttb" else minmax(x, y, n_out)
+
+
+def basket(matrix: np.ndarray):
+    """
+    Total cost of all columns per row, carrying each product's last price over days it wasn't
+    scraped. NaN until every product has a first price, so the total never jumps when one starts.
+    """
+    filled = forward_fill(matrix)
+    return np.where(np.isnan(filled).any(axis=1), np.nan, np.nansum(filled, axis=1))
@@ -0,0 +1,188 @@
+import heapq
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+class ProductMatcher:
+    """
+    Matches scraper product names against the canonical dim_product list.
+
+    Names are indexed once. match() applies the EXACT / PARTIAL / KEYWORD rules only to the
+    products that can satisfy them, found through the index without a scan:
+      - KEYWORD needs two shared words, so one of them is not the query's most common word;
+      - "query in name" needs the query's rarest trigram;
+      - "name in query" needs the name's own rarest trigram, which is indexed per product.
+    The result is the same as comparing against every product. candidates() ranks names by
+    TF-IDF similarity for suggestions; very common trigrams and tokens (in more than
+    `common_df` of the catalog) only add to products already reached through rarer ones.
+    """
+
+    TOKEN_PATTERN = re.compile(r"\w+")
+
+    def __init__(self, dim_products: Dict[int, dict], top_k: int = 50, common_df: float = 0.2):
+        """dim_products: {product_id: {"product_name": ...}}, as loaded from data/products.csv."""
+        self.top_k = top_k
+        self._names = {}
+        self._lower = {}
+        self._words = {}
+        self._order = {}
+        self._exact = {}
+        self._gram_sets = {}
+        token_postings = defaultdict(list)
+        gram_postings = defaultdict(list)
+        word_postings = defaultdict(list)
+        raw_gram_postings = defaultdict(set)
+
+        for position, (pid, dp) in enumerate(dim_products.items()):
+            lower = dp["product_name"].lower()
+            self._names[pid] = dp["product_name"]
+            self._lower[pid] = lower
+            self._words[pid] = set(lower.split())
+            self._order[pid] = position
+            self._exact.setdefault(lower, pid)
+            for token, tf in Counter(self._tokens(lower)).items():
+                token_postings[token].append((pid, tf))
+            self._gram_sets[pid] = set(self._grams(lower))
+            for gram in self._gram_sets[pid]:
+                gram_postings[gram].append(pid)
+            for word in self._words[pid]:
+                word_postings[word].append(pid)
+            for gram in self._raw_grams(lower):
+                raw_gram_postings[gram].add(pid)
+
+        # Each name is filed under its rarest raw trigram (or whole, if shorter than a trigram)
+        self._word_postings = dict(word_postings)
+        self._raw_gram_postings = dict(raw_gram_postings)
+        self._anchors = defaultdict(list)
+        self._short = []
+        for pid, lower in self._lower.items():
+            grams = self._raw_grams(lower)
+            if grams:
+                self._anchors[min(grams, key=lambda g: len(raw_gram_postings[g]))].append(pid)
+            elif lower:
+                self._short.append(pid)
+
+        n = max(len(self._names), 1)
+        self._common_df = max(common_df * n, 1)
+        self._token_postings = dict(token_postings)
+        self._gram_postings = dict(gram_postings)
+        self._token_idf = {t: math.log((n + 1) / (len(p) + 1)) + 1 for t, p in token_postings.items()}
+        self._gram_idf = {g: math.log((n + 1) / (len(p) + 1)) + 1 for g, p in gram_postings.items()}
+        # Per-product vector norms, so long names don't win just by having more tokens
+        norms = defaultdict(float)
+        for token, postings in token_postings.items():
+            for pid, tf in postings:
+                norms[pid] += (tf * self._token_idf[token]) ** 2
+        self._norms = {pid: math.sqrt(v) for pid, v in norms.items()}
+
+    @classmethod
+    def _tokens(cls, text: str) -> List[str]:
+        return cls.TOKEN_PATTERN.findall(text)
+
+    @staticmethod
+    def _grams(text: str, n: int = 3) -> List[str]:
+        padded = f" {' '.join(text.split())} "
+        return [padded[i:i + n] for i in range(max(len(padded) - n + 1, 1))]
+
+    @staticmethod
+    def _raw_grams(text: str, n: int = 3) -> set:
+        return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+    def candidates(self, name: str, k: Optional[int] = None) -> List[Tuple[int, float]]:
+        """Returns up to k (product_id, score) pairs that share tokens or trigrams with `name`, best first."""
+        lower = name.lower()
+        scores = defaultdict(float)
+        common_tokens = []
+        for token, tf in Counter(self._tokens(lower)).items():
+            idf = self._token_idf.get(token)
+            if idf is None:
+                continue
+            if len(self._token_postings[token]) > self._common_df:
+                common_tokens.append((token, tf, idf))
+                continue
+            for pid, dtf in self._token_postings[token]:
+                scores[pid] += tf * dtf * idf * idf / self._norms[pid]
+        grams = set(self._grams(lower))
+        gram_weight = sum(self._gram_idf.get(g, 0.0) for g in grams) or 1.0
+        common_grams = []
+        for gram in grams:
+            idf = self._gram_idf.get(gram)
+            if idf is None:
+                continue
+            if len(self._gram_postings[gram]) > self._common_df:
+                common_grams.append((gram, idf))
+                continue
+            for pid in self._gram_postings[gram]:
+                scores[pid] += idf / gram_weight
+        if not scores:
+            # Only common terms matched: fall back to the rarest of them
+            rarest = min(common_grams, key=lambda item: len(self._gram_postings[item[0]]), default=None)
+            for pid in self._gram_postings[rarest[0]] if rarest else ():
+                scores[pid] = 0.0
+        # Common terms only refine the products already reached
+        for pid in scores:
+            pid_grams = self._gram_sets[pid]
+            for gram, idf in common_grams:
+                if gram in pid_grams:
+                    scores[pid] += idf / gram_weight
+        for token, tf, idf in common_tokens:
+            for pid, dtf in self._token_postings[token]:
+                if pid in scores:
+                    scores[pid] += tf * dtf * idf * idf / self._norms[pid]
+        return heapq.nlargest(k or self.top_k, scores.items(), key=lambda item: item[1])
+
+    def _rule_candidates(self, lower: str) -> set:
+        """Every product that could pass the PARTIAL or KEYWORD rule for `lower` (a superset)."""
+        found = set()
+        # KEYWORD: two shared words, so at least one besides the query's most common word
+        words = sorted((w for w in set(lower.split()) if w in self._word_postings),
+                       key=lambda w: len(self._word_postings[w]))
+        for word in words[:-1]:
+            found.update(self._word_postings[word])
+        # PARTIAL, query inside the name: the name contains the query's rarest trigram
+        grams = self._raw_grams(lower)
+        if not grams:
+            found.update(pid for pid, name in self._lower.items() if lower in name)
+        elif all(g in self._raw_gram_postings for g in grams):
+            found.update(self._raw_gram_postings[min(grams, key=lambda g: len(self._raw_gram_postings[g]))])
+        # PARTIAL, name inside the query: the query contains the name's anchor trigram
+        for gram in grams:
+            found.update(self._anchors.get(gram, ()))
+        found.update(self._short)
+        return found
+
+    def match(self, scraper_name: str):
+        """
+        Finds the best dim_product for a scraper name.
+        Returns (product_id, product_name, "EXACT" | "PARTIAL" | "KEYWORD") or None.
+        """
+        scraper_lower = scraper_name.lower()
+        pid = self._exact.get(scraper_lower)
+        if pid is not None:
+            return pid, self._names[pid], "EXACT"
+
+        scraper_words = set(scraper_lower.split())
+        best_match = None
+        best_score = 0
+        # Same rules and tie-breaking (catalog order) as the original pairwise scan, on the candidates only
+        for pid in sorted(self._rule_candidates(scraper_lower), key=self._order.get):
+            dim_lower = self._lower[pid]
+
+            # Check if dim name is contained in scraper name or vice versa
+            if dim_lower in scraper_lower or scraper_lower in dim_lower:
+                score = len(dim_lower) / max(len(scraper_lower), 1)
+                if score > best_score:
+                    best_score = score
+                    best_match = (pid, self._names[pid], "PARTIAL")
+
+            # Check keyword overlap
+            dim_words = self._words[pid]
+            overlap = dim_words & scraper_words
+            if len(overlap) >= 2:
+                score = len(overlap) / max(len(dim_words), len(scraper_words))
+                if score > best_score:
+                    best_score = score
+                    best_match = (pid, self._names[pid], "KEYWORD")
+
+        return best_match
@@ -0,0 +1,146 @@
+import json
+import os
+import threading
+import uuid
+from datetime import datetime
+
+class ProgressLog:
+    """
+    Append-only JSON-lines log of scrape progress events (data/scraper_events.jsonl).
+
+    The scraper appends one short line per event (run_started, product_started,
+    product_succeeded, product_blocked, product_failed, run_completed), so reporting
+    progress costs O(1) per product. Readers tail the file from a cursor (the run id
+    from the run_requested line plus a byte offset) and fold the events into the
+    familiar status dict (see state()).
+    """
+
+    def __init__(self, path="/Users/carlosborda/Documents/Python/Learning/scraping/data/scraper_events.jsonl"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._seq = None
+        self._size = 0
+        # Reader side: fold of every event up to _cursor
+        self._cursor = None
+        self._state = self.initial_state()
+
+    # ── Writing ───────────────────────────────────────────────
+    def _next_seq(self):
+        # Recount only if another process appended since our last write (the UI closing a run main.py started)
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        if self._seq is None or size != self._size:
+            self._seq = 0
+            if size:
+                with open(self.path, "rb") as f:
+                    self._seq = sum(1 for _ in f)
+        self._seq += 1
+        return self._seq
+
+    def begin(self):
+        """Starts a fresh log for a new run (truncating the previous one) and records the request."""
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            open(self.path, "w").close()
+            self._seq, self._size = 0, 0
+            self._cursor, self._state = None, self.initial_state()
+        return self.emit("run_requested", run=uuid.uuid4().hex[:12])
+
+    def emit(self, event_type, **fields):
+        """Appends one event and returns it."""
+        with self._lock:
+            event = {"seq": self._next_seq(), "ts": datetime.now().isoformat(timespec="seconds"),
+                     "type": event_type, **fields}
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(event) + "\n")
+                self._size = f.tell()
+        return event
+
+    # ── Reading ───────────────────────────────────────────────
+    @staticmethod
+    def _run_id(f):
+        """The run id on the log's first line (run_requested), or None."""
+        f.seek(0)
+        line = f.readline()
+        try:
+            return json.loads(line).get("run") if line.endswith(b"\n") else None
+        except ValueError:
+            return None
+
+    def read_from(self, cursor=None):
+        """
+        Returns (events, new_cursor) for complete lines after `cursor` (None: the whole log).
+        A log rewritten for another run restarts at its run_requested event, even when the new
+        log has already grown past the old offset.
+        """
+        if not os.path.exists(self.path):
+            return [], None
+        run, offset = cursor or (None, 0)
+        events = []
+        with open(self.path, "rb") as f:
+            current = self._run_id(f)
+            if current != run or os.fstat(f.fileno()).st_size < offset:
+                offset = 0
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # still being written
+                offset += len(line)
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    continue
+            if self._run_id(f) != current:
+                # A new run began while we were reading: the next call starts over on it
+                return [], cursor
+        return events, (current, offset)
+
+    @staticmethod
+    def initial_state():
+        return {"status": "idle", "progress": 0, "total": 0, "current_product": None,
+                "completed_ids": [], "succeeded": 0, "failed": 0, "blocked": 0, "seq": 0, "run": None}
+
+    @staticmethod
+    def apply(state, event):
+        """Folds one event into a status dict (mutates and returns it)."""
+        kind = event.get("type")
+        if kind in ("run_requested", "run_started"):
+            if kind == "run_requested" or state["status"] != "running" or state["total"]:
+                state.update(ProgressLog.initial_state())
+            state.update(status="running", total=event.get("total", 0),
+                         current_product=event.get("current_product", "Initializing..."))
+            if kind == "run_requested":
+                state["run"] = event.get("run")
+        elif kind == "product_started":
+            state["current_product"] = event.get("name")
+            state["progress"] = event.get("index", state["progress"])
+        elif kind in ("product_succeeded", "product_blocked", "product_failed"):
+            state["progress"] += 1
+            state[kind.split("_", 1)[1]] += 1
+            if kind == "product_succeeded":
+                state["completed_ids"].append(event.get("id"))
+        elif kind == "run_completed":
+            # main.py ends a run as "completed"; the UI job manager closes cancelled/failed/stale ones
+            status = event.get("status", "completed")
+            state.update(status=status, current_product="Done" if status == "completed" else status.capitalize())
+            if status == "completed":
+                state["progress"] = state["total"]
+            if event.get("error"):
+                state["error"] = event["error"]
+        state["seq"] = event.get("seq", state["seq"])
+        return state
+
+    def snapshot(self):
+        """(status, cursor): the fold of the log so far and the read_from cursor it covers, for tailing after it."""
+        with self._lock:
+            # Only the events appended since the last call are folded
+            events, cursor = self.read_from(self._cursor)
+            if self._cursor and cursor and (cursor[0] != self._cursor[0] or cursor[1] < self._cursor[1]):
+                # Another run replaced the log: fold it from its first event
+                self._state = self.initial_state()
+            for event in events:
+                self.apply(self._state, event)
+            self._cursor = cursor
+            return json.loads(json.dumps(self._state)), self._cursor
+
+    def state(self):
+        return self.snapshot()[0]
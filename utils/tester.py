@@ -3,6 +3,10 @@ import json
 import logging
 import argparse
 import os
+import queue
+import threading
+import time
+from urllib.parse import urlparse
 
 # Ensure the root directory is in sys.path when running from different locations
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -14,6 +18,7 @@ from scrapers.nofrills import NoFrillsScraper
 from scrapers.foodbasics import FoodBasicsScraper
 from scrapers.metro import MetroScraper
 from utils.browser_manager import BrowserManager
+from storage.product_catalog import ProductCatalog
 from utils.unit_converter import UnitConverter
 
 # Suppress debug logs for cleaner JSON output
@@ -62,21 +67,158 @@ def process_test_result(item, result):
         return {"status": "error", "error": "Failed to extract required data (price or name)."}
 
 
-def main():
-    parser = argparse.ArgumentParser(description="Test a single URL and return JSON")
-    parser.add_argument("--store", required=True, help="Store name (e.g., nofrills, foodbasics, metro)")
-    parser.add_argument("--url", required=True, help="URL to scrape")
-    parser.add_argument("--id", required=True, help="Product ID")
-    parser.add_argument("--name", required=True, help="Product Name")
-    parser.add_argument("--pack-size", type=float, default=None, help="Pack Size")
-    args = parser.parse_args()
-
-    scrapers = {
+def build_scrapers():
+    return {
         "nofrills": NoFrillsScraper(),
         "foodbasics": FoodBasicsScraper(),
         "metro": MetroScraper()
     }
 
+
+class BatchTester:
+    """
+    Tests many products on a pool of warm browsers and yields results as they finish.
+
+    Each worker thread owns one BrowserManager for the whole batch (Playwright objects must stay
+    on the thread that created them), so Chrome starts `workers` times instead of once per product.
+    At most `per_host` products of the same site are in flight at once; a worker picks the next
+    product whose site has a free slot, so one slow banner doesn't hold up the others.
+    """
+
+    def __init__(self, workers=3, per_host=2, browser_factory=None, scrapers_factory=build_scrapers):
+        self.workers = max(1, workers)
+        self.per_host = max(1, per_host)
+        self.browser_factory = browser_factory or (lambda: BrowserManager(headless=True))
+        self.scrapers_factory = scrapers_factory
+
+    @staticmethod
+    def host(item):
+        return urlparse(item.get("url") or "").netloc or item.get("store")
+
+    def run(self, items):
+        """Yields one result dict per item, in completion order."""
+        pending = list(items)
+        in_flight = {}
+        lock = threading.Condition()
+        results = queue.Queue()
+        enqueued_at = time.monotonic()
+
+        def next_item():
+            # Called with the lock held: first pending item whose host has a free slot
+            for index, item in enumerate(pending):
+                if in_flight.get(self.host(item), 0) < self.per_host:
+                    return pending.pop(index)
+            return None
+
+        def worker():
+            try:
+                browser = self.browser_factory()
+                browser.__enter__()
+            except Exception as e:
+                logging.getLogger("tester").error(f"Could not start browser: {e}")
+                results.put(None)
+                return
+            scrapers = self.scrapers_factory()
+            try:
+                while True:
+                    with lock:
+                        item = next_item()
+                        while item is None and pending:
+                            lock.wait()
+                            item = next_item()
+                        if item is None:
+                            return
+                        host = self.host(item)
+                        in_flight[host] = in_flight.get(host, 0) + 1
+                    results.put(self._test(item, scrapers, browser, enqueued_at))
+                    with lock:
+                        in_flight[host] -= 1
+                        lock.notify_all()
+            finally:
+                browser.__exit__(None, None, None)
+                results.put(None)
+
+        threads = [threading.Thread(target=worker, name=f"tester-{i}", daemon=True) for i in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        finished_workers = 0
+        while finished_workers < len(threads):
+            result = results.get()
+            if result is None:
+                finished_workers += 1
+                continue
+            yield result
+        # Every browser failed to start: report what was never tested
+        for item in pending:
+            yield self._result(item, {"status": "error", "error": "No browser available"}, 0.0, 0.0)
+
+    def _test(self, item, scrapers, browser, enqueued_at):
+        started = time.monotonic()
+        scraper = scrapers.get(item.get("store"))
+        if not scraper:
+            payload = {"status": "error", "error": f"Unknown store: {item.get('store')}"}
+        else:
+            try:
+                payload = process_test_result(item, scraper.run(item["url"], browser_mgr=browser))
+            except Exception as e:
+                payload = {"status": "error", "error": str(e)}
+        return self._result(item, payload, started - enqueued_at, time.monotonic() - started)
+
+    def _result(self, item, payload, queued, elapsed):
+        return {
+            "product_id": item.get("id"),
+            "store": item.get("store"),
+            "host": self.host(item),
+            **payload,
+            "timing": {"queued_s": round(queued, 3), "scrape_s": round(elapsed, 3)},
+        }
+
+
+def run_batch(args):
+    """--batch: tests catalog products and prints one JSON line (NDJSON) per product as it finishes."""
+    catalog = ProductCatalog(os.path.join(root_dir, "config", "products.json"))
+    if args.ids:
+        ids = [i.strip() for i in args.ids.split(",") if i.strip()]
+        items = [p for p in (catalog.get(i) for i in ids) if p]
+        for missing in sorted(set(ids) - {p["id"] for p in items}):
+            print(json.dumps({"product_id": missing, "status": "error", "error": "Product not found"}), flush=True)
+    else:
+        stores = {s.strip() for s in args.stores.split(",")} if args.stores else None
+        items = catalog.all(active_only=not args.include_paused, stores=stores)
+
+    started = time.monotonic()
+    summary = {"tested": 0, "success": 0, "error": 0}
+    for result in BatchTester(workers=args.workers, per_host=args.per_host).run(items):
+        summary["tested"] += 1
+        summary["success" if result["status"] == "success" else "error"] += 1
+        print(json.dumps(result), flush=True)
+    summary["elapsed_s"] = round(time.monotonic() - started, 3)
+    print(json.dumps({"summary": summary}), flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test a single URL (or a batch of catalog products) and return JSON")
+    parser.add_argument("--store", help="Store name (e.g., nofrills, foodbasics, metro)")
+    parser.add_argument("--url", help="URL to scrape")
+    parser.add_argument("--id", help="Product ID")
+    parser.add_argument("--name", help="Product Name")
+    parser.add_argument("--pack-size", type=float, default=None, help="Pack Size")
+    parser.add_argument("--batch", action="store_true", help="Test catalog products on a shared browser pool, printing NDJSON")
+    parser.add_argument("--ids", help="Batch: comma-separated product ids (default: all active products)")
+    parser.add_argument("--stores", help="Batch: only products of these comma-separated stores (ignored with --ids)")
+    parser.add_argument("--include-paused", action="store_true", help="Batch: also test inactive products")
+    parser.add_argument("--workers", type=int, default=3, help="Batch: browsers running in parallel")
+    parser.add_argument("--per-host", type=int, default=2, help="Batch: max products in flight per site")
+    args = parser.parse_args()
+
+    if args.batch:
+        run_batch(args)
+        return
+    if not all([args.store, args.url, args.id, args.name]):
+        parser.error("--store, --url, --id and --name are required (or use --batch)")
+
+    scrapers = build_scrapers()
+
     scraper = scrapers.get(args.store)
     if not scraper:
         print(json.dumps({"status": "error", "error": f"Unknown store: {args.store}"}))